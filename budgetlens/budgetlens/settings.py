@@ -164,3 +164,82 @@ LOGOUT_REDIRECT_URL = '/core/login/'
 LOGIN_URL = '/core/login/'
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+
+# Exchange rates
+# Number of dates whose full rate table is kept in the per-process LRU cache
+EXCHANGE_RATE_CACHE_SIZE = int(os.getenv('EXCHANGE_RATE_CACHE_SIZE', '512'))
+# Optional memory-mapped rate bundle written by `manage.py sync_exchange_rates --export-bundle`
+EXCHANGE_RATE_BUNDLE = os.getenv('EXCHANGE_RATE_BUNDLE', '')
+
+OPEN_EXCHANGE_RATES_API_KEY = os.getenv('OPEN_EXCHANGE_RATES_API_KEY')
+OPEN_EXCHANGE_RATES_API_URL = os.getenv(
+    'OPEN_EXCHANGE_RATES_API_URL', 'https://openexchangerates.org/api/historical/'
+)
+# Total seconds a single rate lookup may spend across all of its retries
+FX_TIME_BUDGET = float(os.getenv('FX_TIME_BUDGET', '3'))
+FX_MAX_ATTEMPTS = int(os.getenv('FX_MAX_ATTEMPTS', '3'))
+# Consecutive failures before the circuit opens, and how long it stays open
+FX_FAILURE_THRESHOLD = int(os.getenv('FX_FAILURE_THRESHOLD', '5'))
+FX_CIRCUIT_COOLDOWN = float(os.getenv('FX_CIRCUIT_COOLDOWN', '60'))
+# Seconds a failed date is remembered before it is retried
+FX_NEGATIVE_TTL = float(os.getenv('FX_NEGATIVE_TTL', '30'))
+FX_NEGATIVE_CACHE_SIZE = int(os.getenv('FX_NEGATIVE_CACHE_SIZE', '1024'))
+FX_POOL_SIZE = int(os.getenv('FX_POOL_SIZE', '10'))
+# Queue re-converting stored amounts for the process_reconversions worker when a user's
+# target currency changes (False re-converts inside the request)
+RECONVERT_IN_BACKGROUND = os.getenv('RECONVERT_IN_BACKGROUND', 'True') == 'True'
+
+# Receipt OCR
+# Worker processes in the OCR pool (0 runs OCR inline in the calling process)
+OCR_POOL_SIZE = int(os.getenv('OCR_POOL_SIZE', str(os.cpu_count() or 1)))
+# Receipts allowed in flight at once; further submissions wait (defaults to 2x the pool)
+OCR_MAX_IN_FLIGHT = int(os.getenv('OCR_MAX_IN_FLIGHT', '0')) or None
+# Receipts are decoded and resampled to this width before OCR; a typical 80mm receipt
+# photographed edge to edge then lands near OCR_TARGET_DPI, which is passed to Tesseract
+OCR_TARGET_WIDTH = int(os.getenv('OCR_TARGET_WIDTH', '1200'))
+OCR_TARGET_DPI = int(os.getenv('OCR_TARGET_DPI', '300'))
+# Tesseract speed profile: fast, balanced or accurate (Tesseract's defaults)
+OCR_PROFILE = os.getenv('OCR_PROFILE', 'accurate')
+OCR_LANG = os.getenv('OCR_LANG', 'eng')
+# Optional model directories, e.g. tessdata_fast for the fast profile and tessdata_best for accurate
+OCR_TESSDATA_FAST_DIR = os.getenv('OCR_TESSDATA_FAST_DIR', '')
+OCR_TESSDATA_BEST_DIR = os.getenv('OCR_TESSDATA_BEST_DIR', '')
+# Only OCR the header and total/date lines found by a quick layout pass
+OCR_ROI = os.getenv('OCR_ROI', 'False') == 'True'
+# Tall receipts are OCR'd as up to this many overlapping strips in parallel (0 or 1 disables).
+# Each OCR pool worker may start this many Tesseract processes, so size it against OCR_POOL_SIZE.
+OCR_STRIP_WORKERS = int(os.getenv('OCR_STRIP_WORKERS', '0'))
+OCR_STRIP_MIN_ASPECT = float(os.getenv('OCR_STRIP_MIN_ASPECT', '2.5'))
+OCR_STRIP_OVERLAP = int(os.getenv('OCR_STRIP_OVERLAP', '48'))
+# Parsed receipts cached by content hash (least recently used entries are evicted)
+RECEIPT_CACHE_MAX_ENTRIES = int(os.getenv('RECEIPT_CACHE_MAX_ENTRIES', '10000'))
+# Bulk receipt upload limits (files per batch, bytes per file inside a ZIP)
+RECEIPT_BATCH_MAX_FILES = int(os.getenv('RECEIPT_BATCH_MAX_FILES', '1000'))
+RECEIPT_MAX_BYTES = int(os.getenv('RECEIPT_MAX_BYTES', str(20 * 1024 * 1024)))
+DATA_UPLOAD_MAX_NUMBER_FILES = int(os.getenv('DATA_UPLOAD_MAX_NUMBER_FILES', '500'))
+# PDF receipts: pages rasterized and OCR'd concurrently (pdftoppm from poppler is required)
+OCR_PDF_PAGE_WORKERS = int(os.getenv('OCR_PDF_PAGE_WORKERS', '2'))
+# Extra receipt category keywords on top of the built-in table, e.g. {"Groceries": ["aldi"]}
+RECEIPT_CATEGORY_KEYWORDS = {}
+# Vision model for reading receipts; OPENAI_BASE_URL points at any OpenAI-compatible endpoint
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', '')
+VISION_MODEL = os.getenv('VISION_MODEL', 'gpt-4o-mini')
+# Requests in flight per event loop, and the total seconds one receipt may take across retries
+VISION_MAX_CONCURRENCY = int(os.getenv('VISION_MAX_CONCURRENCY', '4'))
+VISION_DEADLINE = float(os.getenv('VISION_DEADLINE', '30'))
+VISION_MAX_ATTEMPTS = int(os.getenv('VISION_MAX_ATTEMPTS', '3'))
+# Receipt images are shrunk to fit these limits before upload; "low" detail caps the image token cost
+VISION_MAX_EDGE = int(os.getenv('VISION_MAX_EDGE', '1600'))
+VISION_MAX_BYTES = int(os.getenv('VISION_MAX_BYTES', '300000'))
+VISION_IMAGE_DETAIL = os.getenv('VISION_IMAGE_DETAIL', 'auto')
+# Receipts whose local OCR confidence (0-1) for amount, date or category is below this go to the vision model
+RECEIPT_ESCALATION_THRESHOLD = float(os.getenv('RECEIPT_ESCALATION_THRESHOLD', '0.6'))
+# Per-user category classifiers kept in memory (count) and reloaded from the database after (seconds)
+CATEGORY_CLASSIFIER_CACHE_SIZE = int(os.getenv('CATEGORY_CLASSIFIER_CACHE_SIZE', '1024'))
+CATEGORY_CLASSIFIER_CACHE_TTL = float(os.getenv('CATEGORY_CLASSIFIER_CACHE_TTL', '300'))
+# Rows per page of the expense and income listings (further pages load on demand)
+LISTING_PAGE_SIZE = int(os.getenv('LISTING_PAGE_SIZE', '50'))
+# Seconds a user's dashboard data is cached (entries are keyed by the user's data version, so
+# writes invalidate them); with several processes, point CACHES at a shared cache such as Redis
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '300'))
@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import Expense, UserProfile
+from .models import CategoryClassifier, Expense, UserProfile, ExchangeRate, ExchangeRateDate, ReceiptJob, ReconversionJob, MonthlySummary, DataVersion
 
 admin.site.register(Expense)
 admin.site.register(UserProfile)
+admin.site.register(ExchangeRate)
+admin.site.register(ExchangeRateDate)
+admin.site.register(ReceiptJob)
+admin.site.register(ReconversionJob)
+admin.site.register(CategoryClassifier)
+admin.site.register(MonthlySummary)
+admin.site.register(DataVersion)
@@ -51,4 +51,16 @@ class ExpenseAddForm(forms.ModelForm):
             'expense_date': forms.DateInput(attrs={'type': 'date'}),
             'category': forms.Select(choices=Expense.CATEGORY_CHOICES),
         }
-        
\ No newline at end of file
+        
+class ListingFilterForm(forms.Form):
+    """Form to filter the expense and income listings"""
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    category = forms.CharField(max_length=100, required=False)
+    currency = forms.CharField(max_length=3, required=False)
+
+    def clean_currency(self):
+        return self.cleaned_data['currency'].strip().upper()
+
+    def clean_category(self):
+        return self.cleaned_data['category'].strip()
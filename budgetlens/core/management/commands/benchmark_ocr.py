@@ -0,0 +1,106 @@
+"""Benchmark receipt preprocessing: time, peak memory and extracted-field parity"""
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageEnhance, ImageFilter
+
+DEFAULT_IMAGES = ["reciept1.jpg", "reciept2.jpg"]
+
+
+def legacy_preprocess(image_path):
+    """The original full-resolution pipeline, kept as the benchmark baseline"""
+    img = Image.open(image_path).convert("L")
+    img = img.filter(ImageFilter.MedianFilter())
+    return ImageEnhance.Contrast(img).enhance(2)
+
+
+def fast_preprocess(image_path):
+    from ...services.image_preprocess import prepare_for_ocr
+
+    return prepare_for_ocr(image_path)
+
+
+VARIANTS = {"legacy": legacy_preprocess, "fast": fast_preprocess}
+
+
+def _measure(variant, image_path, repeat):
+    """Run one variant in a fresh process and report timings and its RSS high-water mark"""
+    preprocess = VARIANTS[variant]
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        img = preprocess(image_path)
+        img.load()
+        timings.append(time.perf_counter() - start)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"timings": timings, "peak_kb": peak_kb - baseline_kb, "size": img.size}
+
+
+def _ocr_fields(variant, image_path, profile=None, roi=None):
+    from ...services.ocr_engine import ocr_image
+    from ...services.receipt_parser import extract_receipt_fields
+
+    img = VARIANTS[variant](image_path)
+    return extract_receipt_fields(ocr_image(img, dpi=settings.OCR_TARGET_DPI, profile=profile, roi=roi))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the legacy and fast receipt preprocessing paths on sample receipts "
+        "(wall time, peak RSS growth and OCR field parity)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("images", nargs="*", help="Images to benchmark (defaults to the sample receipts)")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--skip-ocr", action="store_true", help="Skip the Tesseract parity check")
+        parser.add_argument("--profile", help="Tesseract profile for the parity check (defaults to OCR_PROFILE)")
+        parser.add_argument("--roi", action="store_true", help="Use region-of-interest OCR for the parity check")
+
+    def handle(self, *args, **options):
+        images = options["images"] or [
+            str(Path(settings.BASE_DIR).parent / name) for name in DEFAULT_IMAGES
+        ]
+        for image_path in images:
+            with Image.open(image_path) as img:
+                self.stdout.write(f"\n{image_path} ({img.format}, {img.width}x{img.height})")
+
+            results = {}
+            for variant in VARIANTS:
+                # A fresh process per variant keeps the peak-memory numbers independent
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    results[variant] = pool.submit(
+                        _measure, variant, image_path, options["repeat"]
+                    ).result()
+                result = results[variant]
+                self.stdout.write(
+                    f"  {variant:<7} median {statistics.median(result['timings']) * 1000:8.1f} ms"
+                    f"  min {min(result['timings']) * 1000:8.1f} ms"
+                    f"  peak +{result['peak_kb'] / 1024:7.1f} MiB"
+                    f"  output {result['size'][0]}x{result['size'][1]}"
+                )
+            speedup = statistics.median(results["legacy"]["timings"]) / statistics.median(
+                results["fast"]["timings"]
+            )
+            self.stdout.write(f"  speedup x{speedup:.1f}")
+
+            if options["skip_ocr"]:
+                continue
+            try:
+                fields = {
+                    variant: _ocr_fields(variant, image_path, options["profile"], options["roi"] or None)
+                    for variant in VARIANTS
+                }
+            except Exception as e:
+                self.stdout.write(f"  field parity: skipped ({e})")
+                continue
+            for name in ("amount", "expense_date", "description", "category"):
+                legacy_value, fast_value = fields["legacy"][name], fields["fast"][name]
+                marker = "ok" if legacy_value == fast_value else "DIFF"
+                self.stdout.write(f"  {name:<13} {marker:<4} legacy={legacy_value!r} fast={fast_value!r}")
@@ -0,0 +1,125 @@
+"""Benchmark receipt text parsing: the original multi-pass parser against the compiled one"""
+import random
+import re
+import statistics
+import string
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from django.conf import settings
+
+from ...services.receipt_text import ReceiptTextParser, build_keyword_table
+
+HEADERS = [
+    "Big Bazaar Supermarket", "Cafe Coffee Day", "Uber Trip Receipt", "PVR Cinema",
+    "Apollo Pharmacy", "Sharma General Traders", "Invoice", "Tax Invoice",
+]
+BODY_LINES = [
+    "Item {n} x {q}  {a}", "Subtotal  {a}", "GST 18%  {a}", "Total  {a}",
+    "Thank you for visiting", "Cashier: {n}", "Card ****{n}", "Qty {q} @ {a}",
+]
+
+
+def legacy_extract(text, category_keywords):
+    """The original parser, kept as the benchmark baseline (run over the same keyword table)"""
+    amount_match = re.search(r'(\d+[.,]?\d{0,2})', text)
+    amount = float(amount_match.group(1).replace(',', '')) if amount_match else None
+
+    date_match = re.search(r'(\d{2}[/-]\d{2}[/-]\d{4}|\d{4}[/-]\d{2}[/-]\d{2})', text)
+    expense_date = None
+    if date_match:
+        for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d"):
+            try:
+                expense_date = datetime.strptime(date_match.group(1), fmt).date()
+                break
+            except ValueError:
+                continue
+
+    lines = [line.strip() for line in text.split("\n") if line.strip()]
+    description = lines[0] if lines else "Receipt Expense"
+
+    category = "Miscellaneous"
+    for cat, keywords in category_keywords.items():
+        if any(word.lower() in text.lower() for word in keywords):
+            category = cat
+            break
+
+    return {"amount": amount, "expense_date": expense_date, "description": description,
+            "category": category, "currency": "INR"}
+
+
+def synthetic_receipt(rng, lines):
+    """A header naming the merchant, a date line and item lines, like a flattened OCR dump"""
+    out = [rng.choice(HEADERS), f"Date: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024"]
+    for _ in range(lines):
+        out.append(rng.choice(BODY_LINES).format(
+            n=rng.randint(1, 9999), q=rng.randint(1, 5), a=f"{rng.uniform(1, 5000):.2f}",
+        ))
+    return "\n".join(out)
+
+
+def _time(func, texts, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the original and compiled receipt text parsers on OCR dumps "
+        "(or synthetic receipts) and report field parity."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="*", help="OCR text dumps to parse (defaults to synthetic receipts)")
+        parser.add_argument("--receipts", type=int, default=2000, help="Synthetic receipts to generate")
+        parser.add_argument("--lines", type=int, default=60, help="Lines per synthetic receipt")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--extra-keywords", type=int, default=0,
+            help="Add this many random (never matching) keywords to show how each parser scales",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        if options["files"]:
+            texts = []
+            for path in options["files"]:
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    texts.append(f.read())
+        else:
+            texts = [synthetic_receipt(rng, options["lines"]) for _ in range(options["receipts"])]
+
+        table = build_keyword_table(getattr(settings, "RECEIPT_CATEGORY_KEYWORDS", {}))
+        table["Miscellaneous"] = table["Miscellaneous"] + [
+            "".join(rng.choice(string.ascii_lowercase) for _ in range(8))
+            for _ in range(options["extra_keywords"])
+        ]
+        parse = ReceiptTextParser(table).parse
+        legacy = lambda text: legacy_extract(text, table)  # noqa: E731
+        total_kb = sum(len(text) for text in texts) / 1024
+        keywords = sum(len(words) for words in table.values())
+        self.stdout.write(f"{len(texts)} receipts, {total_kb:.0f} KiB of text, {keywords} keywords")
+
+        results = {}
+        for name, func in (("legacy", legacy), ("compiled", parse)):
+            results[name] = _time(func, texts, options["repeat"])
+            per_receipt = results[name] / len(texts) * 1e6
+            self.stdout.write(f"  {name:<8} {results[name] * 1000:9.1f} ms  ({per_receipt:.1f} us/receipt)")
+        self.stdout.write(f"  speedup x{results['legacy'] / results['compiled']:.1f}")
+
+        diffs = {}
+        for text in texts:
+            old, new = legacy(text), parse(text)
+            for field in ("amount", "expense_date", "description", "category"):
+                if old[field] != new[field]:
+                    diffs[field] = diffs.get(field, 0) + 1
+        for field in ("amount", "expense_date", "description", "category"):
+            self.stdout.write(f"  {field:<13} {diffs.get(field, 0)} of {len(texts)} differ")
@@ -0,0 +1,63 @@
+"""Delete receipt files in MEDIA_ROOT that no Expense points at"""
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...models import Expense
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp", ".heic", ".pdf"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove orphaned receipt files: copies left in MEDIA_ROOT by the old two-step "
+        "upload and images under receipts/ whose expense is gone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="List orphans without deleting them")
+        parser.add_argument(
+            "--min-age", type=float, default=24.0,
+            help="Only touch files older than this many hours, so in-flight uploads are safe",
+        )
+
+    def handle(self, *args, **options):
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        referenced = {
+            os.path.realpath(os.path.join(media_root, name))
+            for name in Expense.objects.exclude(receipt_image="")
+            .exclude(receipt_image=None)
+            .values_list("receipt_image", flat=True)
+            .distinct()
+            .iterator()
+        }
+        cutoff = time.time() - options["min_age"] * 3600
+
+        # The old upload path saved to MEDIA_ROOT itself; Expense images live in receipts/
+        candidates = []
+        for directory, recursive in ((media_root, False), (os.path.join(media_root, "receipts"), True)):
+            if not os.path.isdir(directory):
+                continue
+            for root, dirs, files in os.walk(directory):
+                if not recursive:
+                    dirs.clear()
+                candidates.extend(os.path.join(root, name) for name in files)
+
+        removed = freed = 0
+        for path in candidates:
+            path = os.path.realpath(path)
+            if path in referenced or os.path.splitext(path)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue
+            self.stdout.write(f"{'Would remove' if options['dry_run'] else 'Removing'} {path}")
+            if not options["dry_run"]:
+                os.remove(path)
+            removed += 1
+            freed += stat.st_size
+
+        verb = "Would free" if options["dry_run"] else "Freed"
+        self.stdout.write(f"{verb} {freed / (1024 * 1024):.1f} MiB in {removed} orphaned files")
@@ -0,0 +1,26 @@
+"""Worker that drains the re-conversion queue"""
+from django.core.management.base import BaseCommand
+
+from ...services.reconversion import DEFAULT_BATCH_SIZE, run_worker
+
+
+class Command(BaseCommand):
+    help = "Re-convert stored amounts for users whose target currency changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once the queue is empty instead of polling")
+        parser.add_argument("--poll-interval", type=float, default=2.0,
+                            help="Seconds to wait between polls of an empty queue")
+        parser.add_argument("--max-jobs", type=int, help="Exit after processing this many jobs")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows converted and written per transaction")
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            poll_interval=options["poll_interval"],
+            once=options["once"],
+            max_jobs=options["max_jobs"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(f"Processed {processed} re-conversion jobs")
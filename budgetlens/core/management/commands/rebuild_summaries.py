@@ -0,0 +1,28 @@
+"""Recompute the monthly category summaries from expense and income history"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.summaries import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the monthly per-category totals of a user (or of all users) from every "
+        "saved expense and income, repairing any drift in the incrementally kept rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", dest="usernames", action="append", default=[],
+                            help="Username to rebuild (repeatable); defaults to every user")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(users.values_list("username", flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        for user in users.iterator():
+            rows = rebuild(user.id)
+            self.stdout.write(f"{user.username}: {rows} summary rows")
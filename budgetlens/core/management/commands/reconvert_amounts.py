@@ -0,0 +1,33 @@
+"""Recompute stored target-currency amounts for one or all users"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.reconversion import DEFAULT_BATCH_SIZE, reconvert_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-convert amount_in_target_currency on every expense and income of a user "
+        "(or of all users) into their profile's current target currency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", dest="usernames", action="append", default=[],
+                            help="Username to re-convert (repeatable); defaults to every user")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(users.values_list("username", flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        def progress(model_name, done, total):
+            self.stdout.write(f"  {model_name}: {done}/{total}")
+
+        for user in users.iterator():
+            self.stdout.write(f"Re-converting {user.username}")
+            updated = reconvert_user(user, batch_size=options["batch_size"], progress=progress)
+            self.stdout.write(f"  {updated} rows updated")
@@ -0,0 +1,164 @@
+"""Bulk-load, pre-fetch and export historical exchange rates"""
+import csv
+import datetime
+import json
+import logging
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import Expense, ExchangeRate, ExchangeRateDate, Income
+from ...services.exchange_rates import fetch_rates, save_rates
+from ...services.rate_bundle import clean_rate, clean_table, write_bundle
+
+log = logging.getLogger(__name__)
+
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except ValueError as e:
+        raise CommandError(f"Invalid date {value!r}") from e
+
+
+def _date_of(payload, fallback=None):
+    """Work out which day a historical API payload belongs to"""
+    if payload.get("date"):
+        return _parse_date(payload["date"])
+    if payload.get("timestamp"):
+        return datetime.datetime.fromtimestamp(
+            payload["timestamp"], tz=datetime.timezone.utc
+        ).date()
+    if fallback is not None:
+        return _parse_date(fallback)
+    raise CommandError("Rate table without a date or timestamp")
+
+
+def read_json(path):
+    """Read rate tables from a JSON dump of the historical API format
+
+    Accepts a single historical response, a list of them, or an object mapping
+    YYYY-MM-DD to either a response or a bare {currency: rate} table.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f, parse_float=Decimal)
+
+    if isinstance(data, dict) and "rates" in data:
+        data = [data]
+
+    tables = {}
+    if isinstance(data, list):
+        for payload in data:
+            date = _date_of(payload)
+            tables[date] = clean_table(payload["rates"], f"{path} ({date})")
+    elif isinstance(data, dict):
+        for key, payload in data.items():
+            rates = payload.get("rates", payload)
+            date = _date_of(payload if "rates" in payload else {}, fallback=key)
+            tables[date] = clean_table(rates, f"{path} ({date})")
+    else:
+        raise CommandError(f"{path}: unsupported JSON layout")
+    return tables
+
+
+def read_csv(path):
+    """Read rate tables from a CSV file with date, currency and rate columns
+
+    Rows with a malformed currency code or rate are skipped and logged.
+    """
+    tables = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            try:
+                date, currency, rate = row["date"], row["currency"], row["rate"]
+            except KeyError as e:
+                raise CommandError(f"{path}: missing column {e}") from e
+            try:
+                currency, rate = clean_rate(currency, rate)
+            except ValueError as e:
+                log.error("Skipping %s line %s: %s", path, reader.line_num, e)
+                continue
+            tables.setdefault(_parse_date(date), {})[currency] = rate
+    return tables
+
+
+class Command(BaseCommand):
+    help = (
+        "Load historical exchange rates from CSV/JSON dumps, pre-fetch every transaction "
+        "date, and export the store as a memory-mappable rate bundle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--load", nargs="+", default=[], metavar="FILE",
+            help="CSV (date,currency,rate) or JSON dumps of the historical API to import",
+        )
+        parser.add_argument(
+            "--complete", action="store_true",
+            help="The --load files hold full provider tables: mark their dates complete",
+        )
+        parser.add_argument(
+            "--sync", action="store_true",
+            help="Fetch every distinct expense/income date whose full table is not stored yet",
+        )
+        parser.add_argument(
+            "--export-bundle", metavar="PATH",
+            help="Write all stored rates to a rate bundle (see EXCHANGE_RATE_BUNDLE)",
+        )
+
+    def handle(self, *args, **options):
+        if not (options["load"] or options["sync"] or options["export_bundle"]):
+            raise CommandError("Nothing to do: pass --load, --sync and/or --export-bundle")
+
+        for path in options["load"]:
+            # The whole file is parsed before anything is stored, and stored all or nothing
+            tables = read_json(path) if path.lower().endswith(".json") else read_csv(path)
+            with transaction.atomic():
+                for date, rates in tables.items():
+                    save_rates(date, rates, complete=options["complete"])
+            self.stdout.write(f"Loaded {len(tables)} dates from {path}")
+
+        if options["sync"]:
+            self.sync()
+
+        if options["export_bundle"]:
+            self.export(options["export_bundle"])
+
+    def sync(self):
+        """Fetch the rate table for every transaction date without a complete stored table
+
+        Dates holding only some currencies, e.g. from a CSV load, are fetched too,
+        the same rule get_rates() applies.
+        """
+        dates = set(
+            Expense.objects.exclude(expense_date=None)
+            .values_list("expense_date", flat=True).distinct()
+        )
+        dates |= set(Income.objects.values_list("income_date", flat=True).distinct())
+        complete = set(ExchangeRateDate.objects.values_list("date", flat=True))
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        missing = sorted(d for d in dates - complete if d < today)
+
+        self.stdout.write(f"{len(dates)} transaction dates, {len(missing)} without a complete table")
+        failed = []
+        for i, date in enumerate(missing, start=1):
+            rates = fetch_rates(date)
+            if rates is None:
+                failed.append(date)
+                continue
+            save_rates(date, rates, complete=True)
+            self.stdout.write(f"[{i}/{len(missing)}] {date}: {len(rates)} rates")
+
+        if failed:
+            self.stderr.write(f"Could not fetch {len(failed)} dates: {', '.join(map(str, failed))}")
+
+    def export(self, path):
+        """Dump the whole ExchangeRate table to a rate bundle"""
+        tables = {}
+        rows = ExchangeRate.objects.order_by("date").values_list("date", "currency", "rate")
+        for date, currency, rate in rows.iterator(chunk_size=5000):
+            tables.setdefault(date, {})[currency] = rate
+        n_dates, n_currencies = write_bundle(path, tables)
+        self.stdout.write(f"Wrote {n_dates} dates x {n_currencies} currencies to {path}")
@@ -0,0 +1,28 @@
+"""Retrain per-user category classifiers from expense history"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.category_classifier import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the naive Bayes category classifier of a user (or of all users) "
+        "from the descriptions and categories of expenses the user categorized."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", dest="usernames", action="append", default=[],
+                            help="Username to retrain (repeatable); defaults to every user")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(users.values_list("username", flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        for user in users.iterator():
+            examples = rebuild(user.id)
+            self.stdout.write(f"{user.username}: trained on {examples} expenses")
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_exchangerate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="income",
+            name="amount_in_target_currency",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+    ]
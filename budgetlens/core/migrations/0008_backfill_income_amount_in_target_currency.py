@@ -0,0 +1,59 @@
+"""Fill Income.amount_in_target_currency for existing rows
+
+Only rates already in the ExchangeRate table are used (run
+`manage.py sync_exchange_rates --load/--sync` beforehand for full coverage);
+rows without a stored rate keep the original amount, which is what the
+dashboard used to fall back to as well.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+
+CENT = Decimal("0.01")
+
+
+def backfill(apps, schema_editor):
+    Income = apps.get_model("core", "Income")
+    UserProfile = apps.get_model("core", "UserProfile")
+    ExchangeRate = apps.get_model("core", "ExchangeRate")
+
+    targets = dict(UserProfile.objects.values_list("user_id", "target_currency"))
+    rate_tables = defaultdict(dict)
+
+    def rates_for(date):
+        if date not in rate_tables:
+            rate_tables[date] = dict(
+                ExchangeRate.objects.filter(date=date).values_list("currency", "rate")
+            )
+        return rate_tables[date]
+
+    pending = []
+    queryset = Income.objects.filter(amount_in_target_currency=None).only(
+        "id", "user_id", "amount", "currency", "income_date"
+    )
+    for income in queryset.iterator(chunk_size=1000):
+        target = targets.get(income.user_id)
+        converted = income.amount
+        if target and income.currency != target:
+            rates = rates_for(income.income_date)
+            if rates.get(income.currency) and rates.get(target):
+                converted = (income.amount / rates[income.currency] * rates[target]).quantize(CENT)
+        income.amount_in_target_currency = converted
+        pending.append(income)
+        if len(pending) >= 1000:
+            Income.objects.bulk_update(pending, ["amount_in_target_currency"])
+            pending = []
+    if pending:
+        Income.objects.bulk_update(pending, ["amount_in_target_currency"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_income_amount_in_target_currency"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
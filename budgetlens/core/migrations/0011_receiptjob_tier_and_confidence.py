@@ -0,0 +1,42 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_receipt_hash_and_extraction_cache"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="receiptjob",
+            name="confidence",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="receiptjob",
+            name="local_ms",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="receiptjob",
+            name="tier",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("cache", "Extraction cache"),
+                    ("local", "Local OCR"),
+                    ("vision", "Vision model"),
+                ],
+                default="",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="receiptjob",
+            name="vision_ms",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_categoryclassifier"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlySummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("expense", "Expense"), ("income", "Income")],
+                        max_length=7,
+                    ),
+                ),
+                ("month", models.CharField(blank=True, default="", max_length=7)),
+                ("category", models.CharField(blank=True, default="", max_length=100)),
+                (
+                    "total",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="monthly_summaries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "kind", "month", "category"),
+                        name="unique_summary_per_month_category",
+                    )
+                ],
+            },
+        ),
+    ]
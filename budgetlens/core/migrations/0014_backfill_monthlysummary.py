@@ -0,0 +1,56 @@
+"""Fill MonthlySummary from existing expenses and income
+
+Same rules as core.services.summaries.entry(), restated here because
+migrations must not depend on the current models.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+
+CENT = Decimal("0.01")
+
+
+def backfill(apps, schema_editor):
+    Expense = apps.get_model("core", "Expense")
+    Income = apps.get_model("core", "Income")
+    MonthlySummary = apps.get_model("core", "MonthlySummary")
+
+    totals = defaultdict(lambda: [Decimal("0.00"), 0])
+    sources = [
+        ("expense", Expense.objects.values_list(
+            "user_id", "category", "expense_date", "amount_in_target_currency", "amount_in_target_currency"
+        )),
+        ("income", Income.objects.values_list(
+            "user_id", "category", "income_date", "amount_in_target_currency", "amount"
+        )),
+    ]
+    for kind, rows in sources:
+        for user_id, category, date, converted, amount in rows.iterator(chunk_size=2000):
+            value = converted if converted is not None else (amount if kind == "income" else None)
+            key = (user_id, kind, date.strftime("%Y-%m") if date else "", (category or "").strip().lower())
+            totals[key][0] += Decimal(str(value)).quantize(CENT) if value is not None else 0
+            totals[key][1] += 1
+
+    MonthlySummary.objects.bulk_create(
+        [
+            MonthlySummary(user_id=user_id, kind=kind, month=month, category=category, total=total, count=count)
+            for (user_id, kind, month, category), (total, count) in totals.items()
+        ],
+        batch_size=500,
+    )
+
+
+def clear(apps, schema_editor):
+    apps.get_model("core", "MonthlySummary").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_monthlysummary"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, clear),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_backfill_monthlysummary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["user", "expense_date"], name="expense_user_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["user", "category"], name="expense_user_category_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="income",
+            index=models.Index(
+                fields=["user", "income_date"], name="income_user_date_idx"
+            ),
+        ),
+    ]
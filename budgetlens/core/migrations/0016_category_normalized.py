@@ -0,0 +1,45 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0015_user_date_and_category_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="expense",
+            name="expense_user_category_idx",
+        ),
+        migrations.AddField(
+            model_name="expense",
+            name="category_normalized",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=100
+            ),
+        ),
+        migrations.AddField(
+            model_name="income",
+            name="category_normalized",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=100
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["user", "category_normalized"], name="expense_user_category_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="income",
+            index=models.Index(
+                fields=["user", "category_normalized"], name="income_user_category_idx"
+            ),
+        ),
+    ]
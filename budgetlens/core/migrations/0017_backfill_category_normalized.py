@@ -0,0 +1,34 @@
+"""Fill category_normalized for existing expenses and income
+
+Normalized in Python, exactly like core.models.normalize_category(), so the
+stored values match what save() writes from now on.
+"""
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    for model_name in ("Expense", "Income"):
+        model = apps.get_model("core", model_name)
+        pending = []
+        queryset = model.objects.exclude(category=None).exclude(category="").only("id", "category")
+        for row in queryset.iterator(chunk_size=BATCH_SIZE):
+            row.category_normalized = row.category.strip().lower()
+            pending.append(row)
+            if len(pending) >= BATCH_SIZE:
+                model.objects.bulk_update(pending, ["category_normalized"])
+                pending = []
+        if pending:
+            model.objects.bulk_update(pending, ["category_normalized"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0016_category_normalized"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.2 on 2026-10-18 04:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0018_dataversion"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="expense",
+            name="expense_user_date_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="income",
+            name="income_user_date_idx",
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["user", "expense_date", "id"], name="expense_user_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="income",
+            index=models.Index(
+                fields=["user", "income_date", "id"], name="income_user_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0019_user_date_id_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expense",
+            name="category_confirmed",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+"""Mark the categories of existing manually entered expenses as user-chosen
+
+Expenses read from a receipt got their category from OCR or the vision model,
+so only rows without a receipt image count as labelled by the user. Run
+train_category_classifier afterwards to drop learned receipt guesses.
+"""
+from django.db import migrations
+from django.db.models import Q
+
+
+def backfill(apps, schema_editor):
+    Expense = apps.get_model("core", "Expense")
+    (
+        Expense.objects.filter(Q(receipt_image="") | Q(receipt_image=None))
+        .exclude(category=None)
+        .exclude(category="")
+        .update(category_confirmed=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0020_expense_category_confirmed"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
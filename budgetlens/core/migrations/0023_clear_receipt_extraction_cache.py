@@ -0,0 +1,22 @@
+"""Empty the receipt extraction cache
+
+Entries written so far may hold the uploader's personal classifier category,
+which every other user uploading the same receipt would have received. The
+cache refills as receipts are read again.
+"""
+from django.db import migrations
+
+
+def clear(apps, schema_editor):
+    apps.get_model("core", "ReceiptExtraction").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0022_exchangeratedate"),
+    ]
+
+    operations = [
+        migrations.RunPython(clear, migrations.RunPython.noop),
+    ]
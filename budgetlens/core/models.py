@@ -1,25 +1,56 @@
 """This module contains the models for the core app."""
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
 
+def normalize_category(category):
+    """Category as it is grouped and filtered on: trimmed and lowercased, "" when missing"""
+    return (category or "").strip().lower()
+
+
+def _normalized_save_kwargs(instance, kwargs):
+    """Refresh category_normalized, and write it too when only some fields are saved"""
+    instance.category_normalized = normalize_category(instance.category)
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and "category" in update_fields:
+        kwargs["update_fields"] = {*update_fields, "category_normalized"}
+    return kwargs
+
+
 class Income(models.Model):
     """Model to store the income details"""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, default="INR")
     income_date = models.DateField()
+    amount_in_target_currency = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True
+    )
     description = models.CharField(max_length=255, default="", blank=True)  # ✅ fixed here
     category = models.CharField(max_length=100, blank=True, null=True)
+    category_normalized = models.CharField(max_length=100, blank=True, default="", editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "income_date", "id"], name="income_user_date_idx"),
+            models.Index(fields=["user", "category_normalized"], name="income_user_category_idx"),
+        ]
+
     def __str__(self):
         return f"{self.description} - {self.amount} {self.currency} on {self.income_date}"
 
+    def save(self, *args, **kwargs):
+        # Django sends pre_save and post_save outside the row write: one transaction keeps
+        # the summary and data version updates they make in step with it
+        with transaction.atomic():
+            super().save(*args, **_normalized_save_kwargs(self, kwargs))
+
 
 class Expense(models.Model):
     """Model to store the expense details"""
@@ -32,6 +63,10 @@ class Expense(models.Model):
         max_digits=10, decimal_places=2, blank=True, null=True
     )
     description = models.CharField(max_length=255, default="", blank=True)
+    receipt_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    duplicate_of = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, blank=True, null=True, related_name="duplicates"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
@@ -52,10 +87,78 @@ class Expense(models.Model):
         blank=True,
         null=True
     )
+    # Kept equal to normalize_category(category) by save(); bulk writes set it themselves
+    category_normalized = models.CharField(max_length=100, blank=True, default="", editable=False)
+    # The user chose or corrected the category; only these rows train the category classifier
+    category_confirmed = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "expense_date", "id"], name="expense_user_date_idx"),
+            models.Index(fields=["user", "category_normalized"], name="expense_user_category_idx"),
+        ]
 
     def __str__(self):  # ✅ fixed from _str_
         return f"{self.category} - {self.amount} {self.currency} on {self.expense_date}"
 
+    def save(self, *args, **kwargs):
+        # Django sends pre_save and post_save outside the row write: one transaction keeps
+        # the summary and data version updates they make in step with it
+        with transaction.atomic():
+            super().save(*args, **_normalized_save_kwargs(self, kwargs))
+
+
+class ReceiptJob(models.Model):
+    """Model to queue an uploaded receipt for background OCR processing"""
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+    # Which extractor produced the fields
+    TIER_CACHE = "cache"
+    TIER_LOCAL = "local"
+    TIER_VISION = "vision"
+    TIER_CHOICES = [
+        (TIER_CACHE, "Extraction cache"),
+        (TIER_LOCAL, "Local OCR"),
+        (TIER_VISION, "Vision model"),
+    ]
+
+    expense = models.OneToOneField(Expense, on_delete=models.CASCADE, related_name="receipt_job")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    tier = models.CharField(max_length=10, choices=TIER_CHOICES, blank=True, default="")
+    # Local OCR confidence per field (0-1) and the time spent in each tier
+    confidence = models.JSONField(default=dict, blank=True)
+    local_ms = models.PositiveIntegerField(null=True, blank=True)
+    vision_ms = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = models.Manager()
+
+    def __str__(self):
+        return f"Receipt job {self.pk} ({self.status}) for expense {self.expense_id}"
+
+
+class ReceiptExtraction(models.Model):
+    """Model to cache parsed receipt data by the SHA-256 of the uploaded file"""
+    content_hash = models.CharField(max_length=64, unique=True)
+    data = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(auto_now_add=True, db_index=True)
+    objects = models.Manager()
+
+    def __str__(self):
+        return f"Extraction {self.content_hash[:12]} ({self.hits} hits)"
+
 
 class UserProfile(models.Model):
     """Model to store the user's profile details"""
@@ -64,6 +167,129 @@ class UserProfile(models.Model):
     objects = models.Manager()
 
 
+class ReconversionJob(models.Model):
+    """Model to queue re-converting a user's stored amounts into a new target currency"""
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+    SUPERSEDED = "superseded"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+        (SUPERSEDED, "Superseded"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="reconversion_jobs")
+    target_currency = models.CharField(max_length=3)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    # Highest Expense / Income id already re-converted, so an interrupted job picks up after it
+    last_expense_id = models.PositiveBigIntegerField(default=0)
+    last_income_id = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = models.Manager()
+
+    def __str__(self):
+        return f"Re-conversion job {self.pk} ({self.status}) for user {self.user_id} into {self.target_currency}"
+
+
+class ExchangeRate(models.Model):
+    """Model to store a historical USD-based exchange rate for one currency on one date"""
+    date = models.DateField()
+    currency = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=24, decimal_places=10)
+    fetched_at = models.DateTimeField(auto_now_add=True)
+    objects = models.Manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "currency"], name="unique_rate_per_date_currency"),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.rate} on {self.date}"
+
+
+class ExchangeRateDate(models.Model):
+    """Model to mark a date whose full provider rate table is stored
+
+    ExchangeRate rows alone may be a partial table, e.g. a CSV load with a few
+    currencies; only dates marked here are known to hold every currency.
+    """
+    date = models.DateField(unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    objects = models.Manager()
+
+    def __str__(self):
+        return f"Complete rate table for {self.date}"
+
+
+class CategoryClassifier(models.Model):
+    """Model to store a user's naive Bayes category classifier as token counts per category"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="category_classifier")
+    state = models.JSONField(default=dict)
+    examples = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = models.Manager()
+
+    def __str__(self):
+        return f"Category classifier for {self.user} ({self.examples} examples)"
+
+
+class MonthlySummary(models.Model):
+    """Model to store a user's expense or income total for one month and one category
+
+    Maintained incrementally by the Expense and Income signals below; the
+    rebuild_summaries command recomputes it from scratch.
+    """
+    EXPENSE = "expense"
+    INCOME = "income"
+    KIND_CHOICES = [
+        (EXPENSE, "Expense"),
+        (INCOME, "Income"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="monthly_summaries")
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    # "YYYY-MM", or "" for undated expenses
+    month = models.CharField(max_length=7, blank=True, default="")
+    # Trimmed, lowercased category, or "" for uncategorized rows
+    category = models.CharField(max_length=100, blank=True, default="")
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+    objects = models.Manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "kind", "month", "category"], name="unique_summary_per_month_category"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.month or 'undated'} {self.category or 'uncategorized'}: {self.total}"
+
+
+class DataVersion(models.Model):
+    """Model to count writes to a user's expenses, income and profile
+
+    Bumped by the signals below (and by bulk writes, which skip signals); the
+    dashboard uses it for ETags and cache keys.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="data_version")
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = models.Manager()
+
+    def __str__(self):
+        return f"Data version {self.version} for {self.user}"
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Signal to create a user profile when a new user is created"""
@@ -72,6 +298,107 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
     """Signal to save the user profile when the user is updated"""
+    if update_fields is not None:
+        # Partial saves, like the last_login update on every login, leave the profile alone
+        return
     instance.userprofile.save()
+
+
+@receiver(pre_save, sender=UserProfile)
+def remember_target_currency(sender, instance, update_fields=None, **kwargs):
+    """Signal to remember the stored target currency before the profile is saved"""
+    if update_fields is not None and "target_currency" not in update_fields:
+        # The currency is not written, so it cannot change: no need to look it up
+        instance._previous_target_currency = instance.target_currency
+        return
+    instance._previous_target_currency = (
+        UserProfile.objects.filter(pk=instance.pk).values_list("target_currency", flat=True).first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=UserProfile)
+def reconvert_on_target_currency_change(sender, instance, created, **kwargs):
+    """Signal to rebase the user's stored amounts when the target currency changes"""
+    previous = getattr(instance, "_previous_target_currency", None)
+    if created or previous == instance.target_currency or not instance.target_currency:
+        return
+
+    from .services.reconversion import enqueue_reconversion, reconvert_user
+
+    if settings.RECONVERT_IN_BACKGROUND:
+        # Picked up by the process_reconversions worker
+        enqueue_reconversion(instance.user, instance.target_currency)
+    else:
+        reconvert_user(instance.user, instance.target_currency)
+
+
+def _stored_summary(instance):
+    """The summary entry of an expense or income as stored, locking its row until the transaction ends"""
+    from .services.summaries import entry
+
+    if instance.pk is None:
+        return None
+    if isinstance(instance, Income):
+        kind, fields = MonthlySummary.INCOME, ("category", "income_date", "amount_in_target_currency", "amount")
+    else:
+        kind, fields = MonthlySummary.EXPENSE, ("category", "expense_date", "amount_in_target_currency")
+    stored = type(instance).objects.select_for_update().filter(pk=instance.pk).values_list(*fields).first()
+    return entry(kind, *stored) if stored else None
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=Income)
+def remember_stored_summary(sender, instance, **kwargs):
+    """Signal to remember the stored summary entry before an expense or income is saved"""
+    # The lock makes concurrent edits of one row move the totals one after the other
+    instance._previous_summary = _stored_summary(instance)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+def update_monthly_summary(sender, instance, **kwargs):
+    """Signal to move a saved expense or income between monthly summary rows"""
+    from .services.summaries import apply, instance_entry
+
+    apply(instance.user_id, getattr(instance, "_previous_summary", None), instance_entry(instance))
+
+
+@receiver(pre_delete, sender=Expense)
+@receiver(pre_delete, sender=Income)
+def remember_deleted_summary(sender, instance, origin=None, **kwargs):
+    """Signal to remember the stored summary entry before an expense or income is deleted"""
+    if isinstance(origin, User):
+        return
+    # Deletes run in a transaction; the instance in memory may predate a concurrent edit
+    instance._previous_summary = _stored_summary(instance)
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+def remove_from_monthly_summary(sender, instance, origin=None, **kwargs):
+    """Signal to take a deleted expense or income out of its monthly summary row"""
+    from .services.summaries import apply
+
+    if isinstance(origin, User):
+        # The user's summary rows are being deleted along with them
+        return
+    apply(instance.user_id, getattr(instance, "_previous_summary", None), None)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+def bump_data_version(sender, instance, origin=None, **kwargs):
+    """Signal to invalidate the user's cached pages whenever their data changes"""
+    from .services.data_version import bump
+
+    if isinstance(origin, User):
+        # The version row is being deleted along with the user
+        return
+    bump(instance.user_id)
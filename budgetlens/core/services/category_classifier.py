@@ -0,0 +1,195 @@
+"""Per-user naive Bayes classifier from expense descriptions to categories
+
+Each user's model is just token counts per category, stored as JSON on a
+CategoryClassifier row. It only learns from categories the user chose: the
+views call relabel() when an expense is added with a category, or when an
+edit corrects one, and mark the row category_confirmed. Predicted and
+receipt-assigned categories are never learned, so wrong guesses cannot
+reinforce themselves, and ordinary saves and deletes do no classifier work.
+Deleted expenses are only forgotten by rebuild(). Models are kept in an
+in-process LRU, so a prediction is a few dictionary lookups and logarithms
+with no query or network call.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import CategoryClassifier, Expense
+from .receipt_parser import OCR_UNAVAILABLE_DESCRIPTION
+from .receipt_text import DEFAULT_DESCRIPTION
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]{2,}")
+STOPWORDS = {"the", "and", "for", "of", "to", "in", "at", "on", "receipt", "expense", "invoice"}
+# Placeholders written by the receipt pipeline say nothing about the category
+IGNORED_DESCRIPTIONS = {"", DEFAULT_DESCRIPTION, OCR_UNAVAILABLE_DESCRIPTION}
+
+
+def tokenize(text):
+    """Distinct lowercase word tokens of a description"""
+    return {token for token in TOKEN_PATTERN.findall((text or "").lower()) if token not in STOPWORDS}
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over binary token features, with Laplace smoothing"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.docs = Counter(state.get("docs", {}))
+        self.tokens = {category: Counter(counts) for category, counts in state.get("tokens", {}).items()}
+        self._totals = {category: sum(counts.values()) for category, counts in self.tokens.items()}
+        self._vocabulary = Counter()
+        for counts in self.tokens.values():
+            self._vocabulary.update(counts)
+
+    def to_state(self):
+        return {
+            "docs": {category: n for category, n in self.docs.items() if n > 0},
+            "tokens": {category: dict(counts) for category, counts in self.tokens.items() if counts},
+        }
+
+    @property
+    def examples(self):
+        return sum(n for n in self.docs.values() if n > 0)
+
+    def learn(self, tokens, category, weight=1):
+        """Add (weight=1) or remove (weight=-1) one labelled example"""
+        if not tokens or not category:
+            return
+        self.docs[category] += weight
+        if self.docs[category] <= 0:
+            del self.docs[category]
+        counts = self.tokens.setdefault(category, Counter())
+        for token in tokens:
+            counts[token] += weight
+            self._vocabulary[token] += weight
+            if counts[token] <= 0:
+                del counts[token]
+            if self._vocabulary[token] <= 0:
+                del self._vocabulary[token]
+        self._totals[category] = sum(counts.values())
+        if not counts:
+            del self.tokens[category]
+            del self._totals[category]
+
+    def predict(self, tokens):
+        """Return (category, probability), or (None, 0.0) when nothing known matches"""
+        known = [token for token in tokens if token in self._vocabulary]
+        if not known or not self.docs:
+            return None, 0.0
+
+        total_docs = sum(self.docs.values())
+        vocabulary = len(self._vocabulary)
+        scores = {}
+        for category, docs in self.docs.items():
+            counts = self.tokens.get(category, {})
+            denominator = self._totals.get(category, 0) + vocabulary
+            scores[category] = math.log(docs / total_docs) + sum(
+                math.log((counts.get(token, 0) + 1) / denominator) for token in known
+            )
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        probability = 1 / sum(math.exp(score - top) for score in scores.values())
+        return best, probability
+
+
+_lock = threading.Lock()
+_models = OrderedDict()  # user id -> (loaded at, NaiveBayes)
+
+
+def _remember(user_id, model):
+    with _lock:
+        _models[user_id] = (time.monotonic(), model)
+        _models.move_to_end(user_id)
+        while len(_models) > settings.CATEGORY_CLASSIFIER_CACHE_SIZE:
+            _models.popitem(last=False)
+
+
+def get_model(user_id):
+    """Return the user's classifier, from memory when it was loaded recently enough"""
+    with _lock:
+        entry = _models.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < settings.CATEGORY_CLASSIFIER_CACHE_TTL:
+            _models.move_to_end(user_id)
+            return entry[1]
+    state = CategoryClassifier.objects.filter(user_id=user_id).values_list("state", flat=True).first()
+    model = NaiveBayes(state)
+    _remember(user_id, model)
+    return model
+
+
+def clear_cache():
+    with _lock:
+        _models.clear()
+
+
+def predict(user_id, text):
+    """Predict a category for a description: (category, probability) or (None, 0.0)"""
+    return get_model(user_id).predict(tokenize(text))
+
+
+def _example(label):
+    """(tokens, category) for a (description, category) pair, or None if it cannot teach anything"""
+    if label is None:
+        return None
+    description, category = label
+    if not category or (description or "").strip() in IGNORED_DESCRIPTIONS:
+        return None
+    tokens = tokenize(description)
+    return (tokens, category) if tokens else None
+
+
+def _apply(user_id, changes, create=True):
+    """Apply [(tokens, category, weight)] to the stored model under a row lock"""
+    with transaction.atomic():
+        record = CategoryClassifier.objects.select_for_update().filter(user_id=user_id).first()
+        if record is None:
+            if not create:
+                return
+            record = CategoryClassifier(user_id=user_id)
+        model = NaiveBayes(record.state)
+        for tokens, category, weight in changes:
+            model.learn(tokens, category, weight)
+        record.state = model.to_state()
+        record.examples = model.examples
+        record.save()
+    _remember(user_id, model)
+
+
+def relabel(user_id, previous, current):
+    """Move one expense's example from its previous (description, category) to the current one
+
+    Either side may be None (a new or a deleted expense).
+    """
+    old, new = _example(previous), _example(current)
+    if old == new:
+        return
+    changes = []
+    if old is not None:
+        changes.append((*old, -1))
+    if new is not None:
+        changes.append((*new, 1))
+    if changes:
+        _apply(user_id, changes, create=new is not None)
+
+
+def rebuild(user_id):
+    """Retrain a user's classifier from scratch on their confirmed expenses; returns the example count"""
+    model = NaiveBayes()
+    labels = Expense.objects.filter(user_id=user_id, category_confirmed=True).values_list(
+        "description", "category"
+    )
+    for label in labels.iterator():
+        example = _example(label)
+        if example is not None:
+            model.learn(*example)
+    CategoryClassifier.objects.update_or_create(
+        user_id=user_id, defaults={"state": model.to_state(), "examples": model.examples}
+    )
+    _remember(user_id, model)
+    return model.examples
@@ -0,0 +1,53 @@
+"""Batch currency conversion through the USD-based historical rate tables"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from .exchange_rates import _as_date, get_rates
+
+log = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+
+
+def convert_many(items, target_currency):
+    """Convert [(amount, currency, date), ...] into target_currency
+
+    Items are grouped by date so each distinct date costs one rate-table lookup,
+    whatever the number of items or whether the date is given as a date or a
+    YYYY-MM-DD string. Returns a list aligned with items holding the
+    converted amount rounded to cents, or None where no rate was available.
+    """
+    results = [None] * len(items)
+    by_date = defaultdict(list)
+
+    for i, (amount, currency, date) in enumerate(items):
+        if amount is None:
+            continue
+        amount = Decimal(str(amount))
+        if not currency or currency == target_currency:
+            results[i] = amount.quantize(CENT)
+        elif date is not None:
+            by_date[_as_date(date)].append((i, amount, currency))
+
+    for date, group in by_date.items():
+        rates = get_rates(date, {target_currency, *(currency for _, _, currency in group)})
+        if not rates:
+            log.debug("No exchange rates for %s, leaving %s amounts unconverted", date, len(group))
+            continue
+        rate_to_target = rates.get(target_currency)
+        if not rate_to_target:
+            continue
+        rate_to_target = Decimal(str(rate_to_target))
+        for i, amount, currency in group:
+            rate_to_usd = rates.get(currency)
+            if rate_to_usd:
+                converted = amount / Decimal(str(rate_to_usd)) * rate_to_target
+                results[i] = converted.quantize(CENT)
+
+    return results
+
+
+def convert(amount, currency, date, target_currency):
+    """Convert a single amount, returning None when no rate is available"""
+    return convert_many([(amount, currency, date)], target_currency)[0]
@@ -0,0 +1,36 @@
+"""Per-user data version: a counter bumped by every write to a user's data
+
+Every save or delete of an Expense, Income or UserProfile increments the
+user's DataVersion row with an F() update (signals in models.py). For
+expenses and income that happens in the transaction that writes the row; a
+profile save bumps it just after its own write. Bulk writes, which skip
+signals, call bump() themselves. Pages
+built only from that data can then be identified by (user, version): the
+dashboard uses it as its ETag and as part of its cache key, so a write
+invalidates both without deleting any cache entry.
+
+Read the version before reading the data it describes: a page is then never
+older than the version it is stored under.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from ..models import DataVersion
+
+
+def bump(user_id):
+    """Increment the user's data version, creating it on the first write"""
+    versions = DataVersion.objects.filter(user_id=user_id)
+    if versions.update(version=F("version") + 1):
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(user_id=user_id, version=1)
+    except IntegrityError:
+        # Another transaction created the row first
+        versions.update(version=F("version") + 1)
+
+
+def get_version(user_id):
+    """The user's current data version (0 before their first write)"""
+    return DataVersion.objects.filter(user_id=user_id).values_list("version", flat=True).first() or 0
@@ -0,0 +1,163 @@
+"""Historical exchange-rate store backed by the database with an in-process LRU on top
+
+A date's table counts as complete only when it came from the provider (an
+ExchangeRateDate marker records that for stored tables). Other tables, such
+as a partial CSV load or a bundle row with missing currencies, answer a
+lookup only if they hold every currency it needs; otherwise the lookup falls
+through to the next source and finally to the network.
+"""
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from ..models import ExchangeRate, ExchangeRateDate
+from .fx_client import get_client
+from .rate_bundle import clean_table, get_bundle
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+_stats = {"hits": 0, "store_hits": 0, "bundle_hits": 0, "misses": 0}
+
+
+def _as_date(value):
+    """Accept a date or a YYYY-MM-DD string and return a date"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value))
+
+
+def _today():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def _is_final(date):
+    """Historical rates only stop changing once the (UTC) day is over"""
+    return date < _today()
+
+
+def _cache_size():
+    return getattr(settings, "EXCHANGE_RATE_CACHE_SIZE", 512)
+
+
+def _remember(date, rates, complete):
+    with _lock:
+        _cache[date] = (rates, complete)
+        _cache.move_to_end(date)
+        while len(_cache) > _cache_size():
+            _cache.popitem(last=False)
+
+
+def _covers(rates, complete, currencies):
+    """Whether a table can answer a lookup for currencies"""
+    return bool(rates) and (complete or all(currency in rates for currency in currencies))
+
+
+def _load_from_store(date):
+    """Return (stored rate table or None, whether it is marked complete)"""
+    rates = dict(ExchangeRate.objects.filter(date=date).values_list("currency", "rate"))
+    if not rates:
+        return None, False
+    return rates, ExchangeRateDate.objects.filter(date=date).exists()
+
+
+def save_rates(date, rates, complete=False):
+    """Persist a rate table for a date, ignoring currencies that are already stored
+
+    complete=True marks it as the provider's full table for that date.
+    """
+    ExchangeRate.objects.bulk_create(
+        [
+            ExchangeRate(date=date, currency=currency, rate=rate)
+            for currency, rate in clean_table(rates, date).items()
+        ],
+        ignore_conflicts=True,
+        batch_size=500,
+    )
+    if complete:
+        ExchangeRateDate.objects.bulk_create([ExchangeRateDate(date=date)], ignore_conflicts=True)
+
+
+def fetch_rates(date):
+    """Fetch the full USD-based rate table for a date from openexchangerates.org"""
+    log.debug("exchange_rates : fetch_rates()")
+    return get_client().historical(_as_date(date))
+
+
+def get_rates(date, currencies=()):
+    """Return the {currency: rate} table for a date, fetching it once and serving it locally afterwards
+
+    Lookup order is the in-process LRU, the ExchangeRate table, the offline rate
+    bundle (settings.EXCHANGE_RATE_BUNDLE) and finally the network. currencies
+    are the ones the caller needs: a table not known to be complete is passed
+    over unless it holds them all. If the network fails as well, whatever was
+    found locally is returned. Dates after today never reach the network: the
+    provider has no table for them yet.
+    """
+    date = _as_date(date)
+    found = {}
+
+    with _lock:
+        cached = _cache.get(date)
+        if cached is not None:
+            if _covers(*cached, currencies):
+                _cache.move_to_end(date)
+                _stats["hits"] += 1
+                return cached[0]
+            found.update(cached[0])
+
+    rates, complete = _load_from_store(date)
+    if _covers(rates, complete, currencies):
+        with _lock:
+            _stats["store_hits"] += 1
+        _remember(date, rates, complete)
+        return rates
+    found.update(rates or {})
+
+    bundle = get_bundle()
+    rates = bundle.rates(date) if bundle is not None else None
+    if _covers(rates, False, currencies):
+        with _lock:
+            _stats["bundle_hits"] += 1
+        _remember(date, rates, False)
+        return rates
+    found = {**(rates or {}), **found}
+
+    with _lock:
+        _stats["misses"] += 1
+    if date > _today():
+        return found or None
+    rates = fetch_rates(date)
+    if rates is None:
+        return found or None
+    rates = clean_table(rates, date)
+
+    # Today's table is still moving, so only settled dates are stored and cached
+    if _is_final(date):
+        save_rates(date, rates, complete=True)
+        _remember(date, rates, True)
+    return rates
+
+
+def cache_info():
+    """Return hit/miss counters for the rate cache"""
+    with _lock:
+        return {
+            **_stats,
+            "size": len(_cache),
+            "maxsize": _cache_size(),
+        }
+
+
+def clear_cache():
+    """Drop the in-process LRU and reset its counters (the database store is untouched)"""
+    with _lock:
+        _cache.clear()
+        for key in _stats:
+            _stats[key] = 0
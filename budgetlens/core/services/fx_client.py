@@ -0,0 +1,222 @@
+"""HTTP client for the openexchangerates.org historical API
+
+One pooled keep-alive session is shared per process. Each lookup gets a total
+time budget across all of its retries: the body is streamed in chunks and
+every socket read is limited to the time left, so a server dripping bytes
+cannot stretch a lookup past the budget. Failures are negatively cached for a
+short while (in a bounded LRU), and a circuit breaker stops calling the
+provider after repeated failures so a slow or dead upstream cannot stall
+every request. Only the provider's own faults (transport errors, timeouts,
+5xx, 429) count toward the breaker: a client error such as a date the
+provider has no table for says nothing about other lookups, so it is only
+negatively cached.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+import requests
+import urllib3
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 1024
+
+
+class DeadlineExceeded(requests.Timeout):
+    """The lookup's total time budget ran out while reading a response"""
+
+
+def _read_body(response, deadline):
+    """Read a streamed response body, never letting one read outlast the deadline"""
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    body = bytearray()
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("time budget exhausted while reading the response")
+        if sock is not None:
+            # requests only bounds each read by the timeout given at the start
+            sock.settimeout(remaining)
+        try:
+            # read1 returns whatever has arrived instead of waiting for a full chunk
+            chunk = response.raw.read1(CHUNK_SIZE, decode_content=True)
+        except ReadTimeoutError as e:
+            raise DeadlineExceeded(f"time budget exhausted while reading the response: {e}") from e
+        except urllib3.exceptions.HTTPError as e:
+            raise requests.ConnectionError(e) from e
+        if not chunk:
+            return bytes(body)
+        body.extend(chunk)
+
+
+class FXClient:
+    """Pooled, budgeted client for historical exchange-rate tables"""
+
+    def __init__(
+        self,
+        base_url,
+        app_id=None,
+        time_budget=3.0,
+        connect_timeout=1.0,
+        max_attempts=3,
+        backoff=0.2,
+        failure_threshold=5,
+        cooldown=60.0,
+        negative_ttl=30.0,
+        negative_cache_size=1024,
+        pool_size=10,
+    ):
+        self.base_url = base_url if base_url.endswith("/") else f"{base_url}/"
+        self.app_id = app_id
+        self.time_budget = time_budget
+        self.connect_timeout = connect_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.negative_ttl = negative_ttl
+        self.negative_cache_size = negative_cache_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._negative = OrderedDict()  # key -> expiry, least recently failed first
+
+    @property
+    def circuit_open(self):
+        with self._lock:
+            return time.monotonic() < self._open_until
+
+    def _rejected(self, key, now):
+        """Return why a call for key should be skipped, or None to go ahead"""
+        with self._lock:
+            if now < self._open_until:
+                return "circuit open"
+            expires = self._negative.get(key)
+            if expires is not None:
+                if now < expires:
+                    return "recent failure"
+                del self._negative[key]
+        return None
+
+    def _record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._open_until = 0.0
+
+    def _record_failure(self, key, provider_fault=True):
+        now = time.monotonic()
+        with self._lock:
+            self._negative[key] = now + self.negative_ttl
+            self._negative.move_to_end(key)
+            while len(self._negative) > self.negative_cache_size:
+                self._negative.popitem(last=False)
+            if not provider_fault:
+                return
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.failure_threshold:
+                self._open_until = now + self.cooldown
+                log.warning(
+                    "FX provider failed %s times in a row, pausing calls for %ss",
+                    self._consecutive_failures, self.cooldown,
+                )
+
+    def historical(self, date):
+        """Return the USD-based {currency: rate} table for a date, or None on failure"""
+        key = date.isoformat()
+        start = time.monotonic()
+        reason = self._rejected(key, start)
+        if reason:
+            log.debug("Skipping FX lookup for %s: %s", key, reason)
+            return None
+
+        url = f"{self.base_url}{key}.json"
+        params = {"app_id": self.app_id} if self.app_id else {}
+        deadline = start + self.time_budget
+        provider_fault = True
+
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                with self.session.get(
+                    url,
+                    params=params,
+                    timeout=(min(self.connect_timeout, remaining), remaining),
+                    stream=True,
+                ) as response:
+                    body = _read_body(response, deadline)
+            except requests.RequestException as e:
+                log.error("Error fetching exchange rate: %s", e)
+            else:
+                if response.status_code == 200:
+                    try:
+                        rates = json.loads(body, parse_float=Decimal).get("rates")
+                    except ValueError as e:
+                        log.error("Invalid exchange rate payload: %s", e)
+                    else:
+                        self._record_success()
+                        return rates or None
+                else:
+                    log.error("Error fetching exchange rate: %s", body[:200].decode("utf-8", "replace"))
+                    # Client errors (bad key, unknown date) will not get better by retrying
+                    if 400 <= response.status_code < 500 and response.status_code != 429:
+                        provider_fault = False
+                        break
+
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            if attempt + 1 >= self.max_attempts or time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+        self._record_failure(key, provider_fault)
+        return None
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide FXClient configured from settings"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FXClient(
+                settings.OPEN_EXCHANGE_RATES_API_URL,
+                app_id=settings.OPEN_EXCHANGE_RATES_API_KEY,
+                time_budget=settings.FX_TIME_BUDGET,
+                max_attempts=settings.FX_MAX_ATTEMPTS,
+                failure_threshold=settings.FX_FAILURE_THRESHOLD,
+                cooldown=settings.FX_CIRCUIT_COOLDOWN,
+                negative_ttl=settings.FX_NEGATIVE_TTL,
+                negative_cache_size=settings.FX_NEGATIVE_CACHE_SIZE,
+                pool_size=settings.FX_POOL_SIZE,
+            )
+        return _client
+
+
+def reset_client():
+    """Drop the shared client so the next call picks up new settings"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,81 @@
+"""Keyset (seek) pagination for the expense and income listings
+
+Rows are ordered newest first by (date, id), with undated expenses last. A
+page is the first LISTING_PAGE_SIZE rows after a cursor, the (date, id) of the
+last row already shown, so every page is an index range scan of the same
+size however deep the user has scrolled; no OFFSET, no COUNT. The cursor is
+the string "<ISO date>.<id>", with an empty date for an undated row.
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+from ..models import Expense, Income, normalize_category
+
+LISTINGS = {
+    "expense": (Expense, "expense_date"),
+    "income": (Income, "income_date"),
+}
+FIELDS = {
+    "expense": ("id", "category", "amount", "currency", "expense_date"),
+    "income": ("id", "description", "category", "amount", "currency", "income_date"),
+}
+
+
+def encode_cursor(date, pk):
+    return f"{date.isoformat() if date else ''}.{pk}"
+
+
+def decode_cursor(cursor):
+    """Return (date or None, id) for a cursor; ValueError if it is malformed"""
+    date, _, pk = cursor.rpartition(".")
+    return (datetime.date.fromisoformat(date) if date else None), int(pk)
+
+
+def filtered(kind, user, filters=None):
+    """The user's rows of a listing, narrowed by ListingFilterForm's cleaned data"""
+    model, date_field = LISTINGS[kind]
+    rows = model.objects.filter(user=user)
+    filters = filters or {}
+    if filters.get("date_from"):
+        rows = rows.filter(**{f"{date_field}__gte": filters["date_from"]})
+    if filters.get("date_to"):
+        rows = rows.filter(**{f"{date_field}__lte": filters["date_to"]})
+    if filters.get("category"):
+        rows = rows.filter(category_normalized=normalize_category(filters["category"]))
+    if filters.get("currency"):
+        rows = rows.filter(currency=filters["currency"])
+    return rows
+
+
+def page(kind, user, filters=None, cursor=None, size=None):
+    """Return (rows, next cursor or None) for one page of a listing"""
+    model, date_field = LISTINGS[kind]
+    size = size or settings.LISTING_PAGE_SIZE
+    rows = filtered(kind, user, filters).only(*FIELDS[kind])
+    date, pk = decode_cursor(cursor) if cursor else (None, None)
+
+    # Dated and undated rows are read separately (one extra row tells whether
+    # there is another page), so both are plain range scans of the
+    # (user, date, id) index, which also covers the id tie-break, with no
+    # NULLS LAST ordering to sort for.
+    found = []
+    if cursor is None or date is not None:
+        dated = rows.filter(**{f"{date_field}__isnull": False})
+        if date is not None:
+            dated = dated.filter(
+                Q(**{f"{date_field}__lte": date}) & (Q(**{f"{date_field}__lt": date}) | Q(id__lt=pk))
+            )
+        found = list(dated.order_by(f"-{date_field}", "-id")[: size + 1])
+    if len(found) <= size and model._meta.get_field(date_field).null:
+        undated = rows.filter(**{f"{date_field}__isnull": True})
+        if cursor is not None and date is None:
+            undated = undated.filter(id__lt=pk)
+        found += undated.order_by("-id")[: size + 1 - len(found)]
+
+    if len(found) <= size:
+        return found, None
+    found = found[:size]
+    last = found[-1]
+    return found, encode_cursor(getattr(last, date_field), last.id)
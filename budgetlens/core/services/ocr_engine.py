@@ -0,0 +1,250 @@
+"""Tesseract invocation: speed profiles, region-of-interest and strip-parallel OCR
+
+A profile fixes the page segmentation mode, the OCR engine mode, an optional
+character whitelist and optionally a tessdata directory (e.g. tessdata_fast or
+tessdata_best models). The deployment picks one with settings.OCR_PROFILE:
+
+- fast: LSTM only, one uniform text block, receipt characters only
+- balanced: LSTM only, a single column of variable-size text, receipt characters only
+- accurate: Tesseract's defaults (full automatic page segmentation)
+
+With settings.OCR_ROI a quick layout pass (image_to_data at half resolution)
+locates the text lines first, and only the header lines and the lines that
+look like a total or a date are OCR'd again at full resolution. If those
+regions do not give an amount and a date, the whole image is OCR'd instead.
+
+Tall receipts (height at least OCR_STRIP_MIN_ASPECT times the width) can be
+split into up to OCR_STRIP_WORKERS horizontal strips. Cuts are placed on the
+whitest pixel rows near evenly spaced points, each strip reaches
+OCR_STRIP_OVERLAP pixels into its neighbours, and the strips are OCR'd by
+concurrent Tesseract processes. The texts are stitched back in order, dropping
+the lines a strip repeats from the end of the previous one.
+
+Text is read through image_to_data, so callers that need it also get the
+confidence Tesseract reported for every word (ocr_image_words).
+"""
+import difflib
+import logging
+import re
+import string
+from concurrent.futures import ThreadPoolExecutor
+
+import pytesseract
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from PIL import Image
+
+from .receipt_text import DATE_PATTERN, has_amount_and_date
+
+log = logging.getLogger(__name__)
+
+# Characters that matter on a receipt; no spaces or quotes, as the config string is shell-split
+RECEIPT_CHARS = string.ascii_letters + string.digits + ".,:;/-%&*#@()+=$₹€£"
+
+PROFILES = {
+    "fast": {"oem": 1, "psm": 6, "whitelist": RECEIPT_CHARS, "tessdata": "OCR_TESSDATA_FAST_DIR"},
+    "balanced": {"oem": 1, "psm": 4, "whitelist": RECEIPT_CHARS, "tessdata": None},
+    "accurate": {"oem": 3, "psm": 3, "whitelist": "", "tessdata": "OCR_TESSDATA_BEST_DIR"},
+}
+
+# Region-of-interest mode
+ROI_HEADER_LINES = 2
+ROI_LAYOUT_SCALE = 0.5
+ROI_PADDING = 10
+ROI_LINE_PATTERN = re.compile(r"total|amount|amt|payable|balance|net|due|date|dated", re.I)
+
+# Strip-parallel mode
+STRIP_MIN_HEIGHT = 400
+STRIP_MAX_OVERLAP_LINES = 8
+STRIP_LINE_SIMILARITY = 0.85
+
+
+def get_profile(name=None):
+    """Return the named profile (settings.OCR_PROFILE by default)"""
+    name = name or settings.OCR_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"OCR_PROFILE must be one of {', '.join(PROFILES)}, not {name!r}"
+        ) from None
+
+
+def tesseract_config(profile, dpi, psm=None):
+    """Build the Tesseract command-line config for a profile"""
+    parts = [f"--oem {profile['oem']}", f"--psm {psm or profile['psm']}", f"--dpi {int(dpi)}"]
+    tessdata_dir = getattr(settings, profile["tessdata"], "") if profile["tessdata"] else ""
+    if tessdata_dir:
+        parts.append(f'--tessdata-dir "{tessdata_dir}"')
+    if profile["whitelist"]:
+        parts.append(f"-c tessedit_char_whitelist={profile['whitelist']}")
+    return " ".join(parts)
+
+
+def layout_lines(img, dpi):
+    """Quick layout pass: return text lines as (top, bottom, text), top to bottom, in full-size pixels"""
+    scale = ROI_LAYOUT_SCALE
+    small = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+    data = pytesseract.image_to_data(
+        small,
+        lang=settings.OCR_LANG,
+        config=tesseract_config(PROFILES["fast"], dpi * scale),
+        output_type=pytesseract.Output.DICT,
+    )
+
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip() or float(data["conf"][i]) < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        top, bottom = data["top"][i], data["top"][i] + data["height"][i]
+        if key in lines:
+            line_top, line_bottom, words = lines[key]
+            lines[key] = (min(line_top, top), max(line_bottom, bottom), words + [word])
+        else:
+            lines[key] = (top, bottom, [word])
+
+    return sorted(
+        (round(top / scale), round(bottom / scale), " ".join(words))
+        for top, bottom, words in lines.values()
+    )
+
+
+def regions_of_interest(lines, height):
+    """Pick the header lines and total/date lines, merged into non-overlapping bands"""
+    wanted = lines[:ROI_HEADER_LINES] + [
+        line for line in lines[ROI_HEADER_LINES:]
+        if ROI_LINE_PATTERN.search(line[2]) or DATE_PATTERN.search(line[2])
+    ]
+    bands = []
+    for top, bottom, _ in sorted(wanted):
+        top, bottom = max(top - ROI_PADDING, 0), min(bottom + ROI_PADDING, height)
+        if bands and top <= bands[-1][1]:
+            bands[-1] = (bands[-1][0], max(bands[-1][1], bottom))
+        else:
+            bands.append((top, bottom))
+    return bands
+
+
+def read_words(img, config):
+    """OCR an image, returning its text and the (word, confidence 0-100) pairs it was built from"""
+    data = pytesseract.image_to_data(
+        img, lang=settings.OCR_LANG, config=config, output_type=pytesseract.Output.DICT
+    )
+    lines, words, current = [], [], None
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        key = (data["page_num"][i], data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if key != current:
+            lines.append([])
+            current = key
+        lines[-1].append(word)
+        words.append((word, float(data["conf"][i])))
+    return "\n".join(" ".join(line) for line in lines), words
+
+
+def _combine(results):
+    texts, words = [], []
+    for text, line_words in results:
+        texts.append(text)
+        words.extend(line_words)
+    return texts, words
+
+
+def ocr_regions(img, profile, dpi):
+    """OCR only the regions of interest at full resolution; None when the layout pass finds nothing"""
+    bands = regions_of_interest(layout_lines(img, dpi), img.height)
+    if not bands:
+        return None
+    config = tesseract_config(profile, dpi, psm=6)
+    texts, words = _combine(read_words(img.crop((0, top, img.width, bottom)), config) for top, bottom in bands)
+    return "\n".join(texts), words
+
+
+def _row_means(img):
+    """Mean brightness of every pixel row, computed in Pillow's C core"""
+    return list(img.convert("L").resize((1, img.height), Image.Resampling.BOX).getdata())
+
+
+def _whitest_row(means, center, radius):
+    low, high = max(center - radius, 0), min(center + radius, len(means) - 1)
+    return max(range(low, high + 1), key=lambda row: (means[row], -abs(row - center)))
+
+
+def strip_bounds(img, count, overlap):
+    """Return (top, bottom) of count overlapping horizontal strips cut along blank rows"""
+    means = _row_means(img)
+    step = img.height / count
+    radius = max(overlap // 2, 1)
+    cuts = [0] + [_whitest_row(means, round(step * i), radius) for i in range(1, count)] + [img.height]
+    return [
+        (
+            0 if i == 0 else _whitest_row(means, cuts[i] - overlap, radius),
+            img.height if i == count - 1 else _whitest_row(means, cuts[i + 1] + overlap, radius),
+        )
+        for i in range(count)
+    ]
+
+
+def _same_line(a, b):
+    a, b = " ".join(a.split()), " ".join(b.split())
+    return a == b or difflib.SequenceMatcher(None, a, b).ratio() >= STRIP_LINE_SIMILARITY
+
+
+def stitch(texts):
+    """Join strip texts in order, dropping lines repeated from the previous strip's overlap"""
+    lines = []
+    for text in texts:
+        new = [line for line in text.splitlines() if line.strip()]
+        for count in range(min(len(lines), len(new), STRIP_MAX_OVERLAP_LINES), 0, -1):
+            if all(_same_line(old, repeated) for old, repeated in zip(lines[-count:], new[:count])):
+                new = new[count:]
+                break
+        lines.extend(new)
+    return "\n".join(lines)
+
+
+def strip_count(img):
+    """How many strips to OCR an image in; 1 means the image is read in one piece"""
+    workers = settings.OCR_STRIP_WORKERS
+    if workers < 2 or img.height < img.width * settings.OCR_STRIP_MIN_ASPECT:
+        return 1
+    return max(1, min(workers, img.height // STRIP_MIN_HEIGHT))
+
+
+def ocr_strips(img, profile, dpi, count):
+    """OCR overlapping strips concurrently (one Tesseract process each) and stitch the text"""
+    config = tesseract_config(profile, dpi)
+    bounds = strip_bounds(img, count, settings.OCR_STRIP_OVERLAP)
+
+    def read(bound):
+        top, bottom = bound
+        return read_words(img.crop((0, top, img.width, bottom)), config)
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        texts, words = _combine(pool.map(read, bounds))
+    return stitch(texts), words
+
+
+def ocr_image(img, dpi=None, profile=None, roi=None):
+    """OCR a preprocessed image with the configured profile, by regions or strips where enabled"""
+    return ocr_image_words(img, dpi, profile, roi)[0]
+
+
+def ocr_image_words(img, dpi=None, profile=None, roi=None):
+    """Like ocr_image, also returning (word, confidence) pairs for every recognised word"""
+    profile = get_profile(profile)
+    dpi = dpi or img.info.get("dpi", (settings.OCR_TARGET_DPI,))[0]
+    roi = settings.OCR_ROI if roi is None else roi
+
+    if roi:
+        result = ocr_regions(img, profile, dpi)
+        if result is not None and has_amount_and_date(result[0]):
+            return result
+        log.debug("Region OCR missed the amount or date, reading the whole image")
+
+    count = strip_count(img)
+    if count > 1:
+        return ocr_strips(img, profile, dpi, count)
+    return read_words(img, tesseract_config(profile, dpi))
@@ -0,0 +1,95 @@
+"""Process pool that runs receipt OCR off the calling thread
+
+Preprocessing and Tesseract both run inside pre-warmed worker processes, so
+receipt throughput scales with cores instead of queueing behind the GIL of a
+single web or queue worker. A bounded semaphore caps how many receipts can be
+in flight at once; callers beyond the limit block until a slot frees up.
+"""
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+
+def _warm_worker():
+    """Set up Django and PIL once per worker process"""
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "budgetlens.settings")
+    django.setup()
+
+    from PIL import Image
+
+    Image.init()
+
+
+def _extract_local(image_path):
+    from .receipt_extraction import extract_local
+
+    return extract_local(image_path)
+
+
+class OCRExecutor:
+    """Bounded process pool for local receipt extraction
+
+    With pool_size=0 every call runs inline in the calling process, which keeps
+    development servers and tests free of child processes.
+    """
+
+    def __init__(self, pool_size, max_in_flight=None):
+        self.pool_size = pool_size
+        self.max_in_flight = max_in_flight or max(pool_size * 2, 1)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._pool = None
+        if pool_size > 0:
+            self._pool = ProcessPoolExecutor(max_workers=pool_size, initializer=_warm_worker)
+
+    def submit(self, fn, *args):
+        """Schedule fn(*args) in the pool, waiting for a free slot if the limit is reached"""
+        if self._pool is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit_extract(self, image_path):
+        """Schedule local extraction (OCR, parsing and field confidences) for one receipt"""
+        return self.submit(_extract_local, image_path)
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide OCR executor, starting the pool on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = OCRExecutor(settings.OCR_POOL_SIZE, settings.OCR_MAX_IN_FLIGHT)
+            atexit.register(_executor.shutdown)
+            log.info(
+                "Started OCR executor with %s workers and %s slots",
+                _executor.pool_size, _executor.max_in_flight,
+            )
+        return _executor
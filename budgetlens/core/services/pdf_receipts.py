@@ -0,0 +1,58 @@
+"""OCR for PDF receipts, one rasterized page at a time
+
+Pages are rendered individually at OCR_TARGET_DPI with pdftoppm, so memory
+stays flat however long the document is. Up to OCR_PDF_PAGE_WORKERS pages are
+rendered and OCR'd concurrently; both steps are external processes, so
+threads are enough to overlap them. Work stops after the first window of
+pages whose combined text already yields an amount and a date.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from .ocr_engine import ocr_image_words
+
+log = logging.getLogger(__name__)
+
+
+def is_pdf(path):
+    return str(path).lower().endswith(".pdf")
+
+
+def page_count(path):
+    return int(pdfinfo_from_path(path)["Pages"])
+
+
+def ocr_page(path, page_number, dpi):
+    """Rasterize one page and return its OCR text and word confidences; the image is dropped straight after"""
+    pages = convert_from_path(
+        path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True
+    )
+    if not pages:
+        return "", []
+    image = pages[0]
+    try:
+        return ocr_image_words(image, dpi=dpi)
+    finally:
+        image.close()
+
+
+def ocr_pdf_words(path, is_complete=None):
+    """Return the OCR text and word confidences of a PDF receipt, stopping early once is_complete(text) is true"""
+    dpi = settings.OCR_TARGET_DPI
+    workers = max(settings.OCR_PDF_PAGE_WORKERS, 1)
+    total = page_count(path)
+    texts, words = [], []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(1, total + 1, workers):
+            window = range(start, min(start + workers, total + 1))
+            for text, page_words in pool.map(lambda page: ocr_page(path, page, dpi), window):
+                texts.append(text)
+                words.extend(page_words)
+            if is_complete is not None and is_complete("\n".join(texts)):
+                log.debug("Stopped PDF OCR after %s of %s pages", len(texts), total)
+                break
+    return "\n".join(texts), words
@@ -0,0 +1,205 @@
+"""Compact, memory-mappable exchange-rate bundle for offline (date, currency) lookups
+
+Layout (little endian):
+    header      magic "FXB1", uint16 version, uint16 currency count, uint32 date count
+    currencies  3 ASCII bytes per currency, sorted
+    dates       uint32 proleptic ordinal per date, sorted ascending
+    rates       float64 per (date, currency) in row-major order, NaN where unknown
+
+Opening a bundle only reads the header and the currency table; every lookup is a
+binary search over the mapped date column plus one read from the rate matrix.
+
+Currency codes must be three ASCII capital letters and rates positive finite
+numbers: the writer skips (and logs) anything else, since one malformed code
+would shift every column after it. A bundle is written to a temporary file,
+checked by opening it, and only then moved into place.
+"""
+import datetime
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"FXB1"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHI")
+_DATE = struct.Struct("<I")
+_RATE = struct.Struct("<d")
+CURRENCY_CODE = re.compile(r"[A-Z]{3}")
+
+
+def clean_rate(currency, rate):
+    """Return (currency code, Decimal rate), or raise ValueError for a malformed code or rate"""
+    code = str(currency).strip().upper()
+    if not CURRENCY_CODE.fullmatch(code):
+        raise ValueError(f"invalid currency code {currency!r}")
+    try:
+        value = Decimal(str(rate).strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid rate {rate!r} for {code}") from None
+    if not value.is_finite() or value <= 0:
+        raise ValueError(f"invalid rate {rate!r} for {code}")
+    return code, value
+
+
+def clean_table(rates, source):
+    """Return the valid entries of a {currency: rate} table, logging the ones skipped"""
+    table = {}
+    for currency, rate in rates.items():
+        if rate is None:
+            continue
+        try:
+            code, value = clean_rate(currency, rate)
+        except ValueError as e:
+            log.error("Skipping exchange rate from %s: %s", source, e)
+            continue
+        table[code] = value
+    return table
+
+
+def _align(offset, size):
+    return (offset + size - 1) // size * size
+
+
+def write_bundle(path, tables):
+    """Write {date: {currency: rate}} tables to path as a rate bundle"""
+    tables = {date: clean_table(rates, date) for date, rates in tables.items()}
+    dates = sorted(tables)
+    currencies = sorted({currency for rates in tables.values() for currency in rates})
+    nan = float("nan")
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(currencies), len(dates)))
+            f.write("".join(currencies).encode("ascii"))
+            f.write(b"\0" * (_align(f.tell(), _DATE.size) - f.tell()))
+            for date in dates:
+                f.write(_DATE.pack(date.toordinal()))
+            f.write(b"\0" * (_align(f.tell(), _RATE.size) - f.tell()))
+            for date in dates:
+                rates = tables[date]
+                row = [float(rates[c]) if c in rates else nan for c in currencies]
+                f.write(struct.pack(f"<{len(row)}d", *row))
+        # Refuse to publish a file readers would reject
+        RateBundle(tmp_path).close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(dates), len(currencies)
+
+
+class RateBundle:
+    """Read-only view over a rate bundle file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._mm)
+        if size < _HEADER.size:
+            self._mm.close()
+            raise ValueError(f"{path} is too short to be a rate bundle")
+        magic, version, n_currencies, n_dates = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} rate bundle")
+
+        offset = _HEADER.size
+        self._n_dates = n_dates
+        self._dates_offset = _align(offset + 3 * n_currencies, _DATE.size)
+        self._rates_offset = _align(self._dates_offset + _DATE.size * n_dates, _RATE.size)
+        expected_size = self._rates_offset + _RATE.size * n_dates * n_currencies
+        if size != expected_size:
+            self._mm.close()
+            raise ValueError(f"{path} is {size} bytes, expected {expected_size}")
+
+        codes = self._mm[offset:offset + 3 * n_currencies].decode("ascii", errors="replace")
+        self.currencies = [codes[i:i + 3] for i in range(0, len(codes), 3)]
+        if not all(CURRENCY_CODE.fullmatch(code) for code in self.currencies):
+            self._mm.close()
+            raise ValueError(f"{path} has malformed currency codes")
+        self._index = {code: i for i, code in enumerate(self.currencies)}
+
+    def __len__(self):
+        return self._n_dates
+
+    def close(self):
+        self._mm.close()
+
+    def _ordinal_at(self, i):
+        return _DATE.unpack_from(self._mm, self._dates_offset + _DATE.size * i)[0]
+
+    def _row(self, date):
+        """Binary search the mapped date column, returning the row index or None"""
+        target = date.toordinal()
+        lo, hi = 0, self._n_dates
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ordinal_at(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._n_dates and self._ordinal_at(lo) == target:
+            return lo
+        return None
+
+    def dates(self):
+        """Iterate over every date in the bundle"""
+        for i in range(self._n_dates):
+            yield datetime.date.fromordinal(self._ordinal_at(i))
+
+    def rate(self, date, currency):
+        """Return the USD-based rate for one (date, currency) pair, or None"""
+        row = self._row(date)
+        col = self._index.get(currency)
+        if row is None or col is None:
+            return None
+        offset = self._rates_offset + _RATE.size * (row * len(self.currencies) + col)
+        value = _RATE.unpack_from(self._mm, offset)[0]
+        return None if math.isnan(value) else Decimal(repr(value))
+
+    def rates(self, date):
+        """Return the full {currency: rate} table for a date, or None"""
+        row = self._row(date)
+        if row is None:
+            return None
+        n = len(self.currencies)
+        values = struct.unpack_from(f"<{n}d", self._mm, self._rates_offset + _RATE.size * row * n)
+        return {
+            currency: Decimal(repr(value))
+            for currency, value in zip(self.currencies, values)
+            if not math.isnan(value)
+        }
+
+
+_bundle = None
+_failed_path = None
+_bundle_lock = threading.Lock()
+
+
+def get_bundle():
+    """Return the bundle configured by settings.EXCHANGE_RATE_BUNDLE, opened once per process"""
+    global _bundle, _failed_path
+    path = getattr(settings, "EXCHANGE_RATE_BUNDLE", "")
+    if not path or path == _failed_path:
+        return None
+    with _bundle_lock:
+        if _bundle is None or _bundle.path != path:
+            try:
+                _bundle = RateBundle(path)
+            except (OSError, ValueError) as e:
+                log.error("Could not open exchange-rate bundle %s: %s", path, e)
+                _failed_path = path
+                return None
+        return _bundle
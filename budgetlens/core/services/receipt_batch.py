@@ -0,0 +1,220 @@
+"""Bulk receipt import from many uploaded files and/or ZIP archives
+
+Each receipt is streamed to storage once while it is hashed; ZIP archives are
+read entry by entry, so an archive is never extracted into memory as a whole.
+Files uploaded directly and ZIP entries get the same extension and size
+checks, and one that cannot be read becomes an error in the summary rather
+than failing the batch. The database writes happen in one transaction; if
+anything fails, the files the batch stored are deleted again.
+Local OCR for every receipt that is not in the extraction cache runs
+concurrently in the OCR pool, the low-confidence ones go to the vision model
+together, all amounts are converted with a single convert_many call, and
+the expenses are written with one bulk_create.
+"""
+import logging
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from ..models import Expense, UserProfile, normalize_category
+from . import data_version, receipt_cache, summaries
+from .currency import convert_many
+from .ocr_executor import get_executor
+from .receipt_cache import save_upload
+from .receipt_extraction import extract_many, personalize
+from .receipt_parser import OCR_UNAVAILABLE_DESCRIPTION, fill_expense_fields, ocr_unavailable_fields
+
+log = logging.getLogger(__name__)
+
+RECEIPT_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp", ".pdf"}
+
+
+def _check(name, size):
+    """Return why a file cannot be a receipt, or None"""
+    if os.path.splitext(name)[1].lower() not in RECEIPT_EXTENSIONS:
+        return "Not a receipt image"
+    if size is not None and size > settings.RECEIPT_MAX_BYTES:
+        return "File too large"
+    return None
+
+
+def _iter_receipts(uploaded_files):
+    """Yield (name, file object, error) per receipt, expanding ZIP archives lazily"""
+    for upload in uploaded_files:
+        if not upload.name.lower().endswith(".zip"):
+            yield upload.name, upload, _check(upload.name, upload.size)
+            continue
+        try:
+            archive = zipfile.ZipFile(upload)
+        except zipfile.BadZipFile:
+            yield upload.name, None, "Not a valid ZIP archive"
+            continue
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or os.path.basename(info.filename).startswith("."):
+                    continue
+                name = f"{upload.name}/{info.filename}"
+                error = _check(info.filename, info.file_size)
+                if error is not None:
+                    yield name, None, error
+                    continue
+                try:
+                    entry = archive.open(info)
+                except Exception as e:
+                    # Encrypted or unsupported entries, or a damaged local header
+                    yield name, None, f"Could not read file: {e}"
+                    continue
+                with entry:
+                    yield name, entry, None
+
+
+def import_receipts(user, uploaded_files):
+    """Create one Expense per receipt and return a per-file summary list
+
+    If the import fails part way, the files it stored are deleted again.
+    """
+    stored_files = []
+    try:
+        return _import_receipts(user, uploaded_files, stored_files)
+    except BaseException:
+        for name in stored_files:
+            default_storage.delete(name)
+        raise
+
+
+def _import_receipts(user, uploaded_files, stored_files):
+    summary = []
+    pending = []  # (summary entry, expense) for receipts that were stored
+    originals = {}
+    first_in_batch = {}
+    batch_duplicates = []
+
+    for name, fileobj, error in _iter_receipts(uploaded_files):
+        if error is None and len(pending) >= settings.RECEIPT_BATCH_MAX_FILES:
+            error = "Batch limit reached"
+        if error is not None:
+            summary.append({"file": name, "status": "skipped", "error": error})
+            continue
+
+        try:
+            stored_name, content_hash = save_upload(fileobj, name)
+        except ValueError as e:
+            summary.append({"file": name, "status": "skipped", "error": str(e)})
+            continue
+        stored_files.append(stored_name)
+        entry = {"file": name, "status": "created"}
+        expense = Expense(user=user, receipt_hash=content_hash)
+
+        if content_hash not in originals:
+            originals[content_hash] = (
+                Expense.objects.filter(user=user, receipt_hash=content_hash)
+                .exclude(receipt_image="")
+                .order_by("id")
+                .first()
+            )
+        original = originals[content_hash]
+        if original is not None:
+            # Already stored once: point at the existing file and drop the new copy
+            default_storage.delete(stored_name)
+            stored_name = original.receipt_image.name
+            expense.duplicate_of = original
+            entry["status"] = "duplicate"
+            entry["duplicate_of"] = original.id
+        elif content_hash in first_in_batch:
+            # Same file twice in this batch: link it once the first copy has a primary key
+            default_storage.delete(stored_name)
+            stored_name = first_in_batch[content_hash].receipt_image.name
+            entry["status"] = "duplicate"
+            batch_duplicates.append((entry, expense, first_in_batch[content_hash]))
+        else:
+            first_in_batch[content_hash] = expense
+
+        expense.receipt_image.name = stored_name
+        summary.append(entry)
+        pending.append((entry, expense))
+
+    # Extract everything the cache does not know yet: local OCR concurrently in the pool first
+    executor = get_executor()
+    parsed = {}
+    futures = {}
+    for entry, expense in pending:
+        content_hash = expense.receipt_hash
+        if content_hash in parsed or content_hash in futures:
+            continue
+        cached = receipt_cache.get_cached(content_hash)
+        if cached is not None:
+            # Cached fields are shared by every user; the category is this user's call
+            parsed[content_hash] = personalize(cached, user.id)
+        else:
+            path = default_storage.path(expense.receipt_image.name)
+            futures[content_hash] = (path, executor.submit_extract(path))
+
+    extracted = []
+    for content_hash, (path, future) in futures.items():
+        try:
+            extracted.append((content_hash, path, future.result()))
+        except Exception:
+            log.exception("OCR failed for receipt %s", content_hash[:12])
+            parsed[content_hash] = None
+
+    extractions = extract_many(
+        [path for _, path, _ in extracted],
+        [local for _, _, local in extracted],
+        [user.id] * len(extracted),
+    )
+    for (content_hash, _, _), extraction in zip(extracted, extractions):
+        data = extraction["data"]
+        if data["description"] != OCR_UNAVAILABLE_DESCRIPTION:
+            receipt_cache.store(content_hash, extraction["shared_data"])
+        parsed[content_hash] = data
+
+    expenses = []
+    for entry, expense in pending:
+        data = parsed[expense.receipt_hash]
+        if data is None or data["description"] == OCR_UNAVAILABLE_DESCRIPTION:
+            entry["warning"] = "Receipt could not be read, please check the details"
+            data = data or ocr_unavailable_fields()
+        fill_expense_fields(expense, dict(data))
+        expenses.append(expense)
+
+    target_currency = (
+        UserProfile.objects.filter(user=user).values_list("target_currency", flat=True).first()
+    )
+    converted = convert_many(
+        [(e.amount, e.currency, e.expense_date) for e in expenses], target_currency
+    )
+    for expense, amount in zip(expenses, converted):
+        expense.amount_in_target_currency = amount if amount is not None else expense.amount
+
+    for expense in expenses:
+        # bulk_create does not call save(), which keeps this column in step
+        expense.category_normalized = normalize_category(expense.category)
+    with transaction.atomic():
+        Expense.objects.bulk_create(expenses, batch_size=500)
+        # bulk_create skips the signals that keep the summaries
+        summaries.add_many(user.id, expenses)
+
+        for entry, expense, first in batch_duplicates:
+            expense.duplicate_of = first
+            entry["duplicate_of"] = first.pk
+        if batch_duplicates:
+            Expense.objects.bulk_update(
+                [expense for _, expense, _ in batch_duplicates], ["duplicate_of"], batch_size=500
+            )
+        data_version.bump(user.id)
+
+    for entry, expense in pending:
+        entry.update(
+            {
+                "expense_id": expense.pk,
+                "amount": str(expense.amount),
+                "currency": expense.currency,
+                "expense_date": expense.expense_date.isoformat(),
+                "category": expense.category,
+                "description": expense.description,
+            }
+        )
+    return summary
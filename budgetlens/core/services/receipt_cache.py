@@ -0,0 +1,121 @@
+"""Content-hash cache of parsed receipts
+
+Uploads are hashed while they are streamed, and the parsed fields are stored
+under that hash so a receipt that was already read never goes through OCR
+again. The table is bounded by RECEIPT_CACHE_MAX_ENTRIES, evicting the least
+recently used entries.
+"""
+import datetime
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import ReceiptExtraction
+
+log = logging.getLogger(__name__)
+
+
+class _HashingReader:
+    """File-like wrapper that hashes bytes as storage reads them
+
+    A read error, or going past limit bytes, ends the stream early and is kept
+    in error, so storage closes the partial file normally and the caller can
+    delete it.
+    """
+
+    def __init__(self, fileobj, limit=None):
+        self._fileobj = fileobj
+        self.limit = limit
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.error = None
+
+    def read(self, size=-1):
+        if self.error is not None:
+            return b""
+        try:
+            data = self._fileobj.read(size)
+        except Exception as e:
+            # Corrupt ZIP entries raise BadZipFile, zlib.error, EOFError and more
+            self.error = f"Could not read file: {e}"
+            return b""
+        self.size += len(data)
+        if self.limit is not None and self.size > self.limit:
+            self.error = "File too large"
+            return b""
+        self.digest.update(data)
+        return data
+
+
+def save_upload(fileobj, name):
+    """Stream a receipt into receipts/ once, returning (stored name, sha256)
+
+    Raises ValueError, after deleting what was written, if the file could not
+    be read in full or turns out larger than RECEIPT_MAX_BYTES.
+    """
+    reader = _HashingReader(fileobj, settings.RECEIPT_MAX_BYTES)
+    stored = default_storage.save(
+        os.path.join("receipts", os.path.basename(name)), File(reader, name=name)
+    )
+    if reader.error is not None:
+        default_storage.delete(stored)
+        raise ValueError(reader.error)
+    return stored, reader.digest.hexdigest()
+
+
+def _serialize(data):
+    data = dict(data)
+    if isinstance(data.get("expense_date"), datetime.date):
+        data["expense_date"] = data["expense_date"].isoformat()
+    return data
+
+
+def _deserialize(data):
+    data = dict(data)
+    if data.get("expense_date"):
+        data["expense_date"] = datetime.date.fromisoformat(data["expense_date"])
+    return data
+
+
+def get_cached(content_hash):
+    """Return the parsed data cached for a hash, or None"""
+    if not content_hash:
+        return None
+    entry = ReceiptExtraction.objects.filter(content_hash=content_hash).first()
+    if entry is None:
+        return None
+    ReceiptExtraction.objects.filter(pk=entry.pk).update(
+        hits=F("hits") + 1, last_used=timezone.now()
+    )
+    return _deserialize(entry.data)
+
+
+def store(content_hash, data):
+    """Cache parsed data for a hash, evicting the least recently used entries past the limit"""
+    if not content_hash:
+        return
+    ReceiptExtraction.objects.update_or_create(
+        content_hash=content_hash,
+        defaults={"data": _serialize(data), "last_used": timezone.now()},
+    )
+    evict()
+
+
+def evict(max_entries=None):
+    """Trim the cache to max_entries (RECEIPT_CACHE_MAX_ENTRIES by default)"""
+    max_entries = settings.RECEIPT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    overflow = list(
+        ReceiptExtraction.objects.order_by("-last_used", "-id")
+        .values_list("last_used", flat=True)[max_entries:max_entries + 1]
+    )
+    if not overflow:
+        return 0
+    deleted, _ = ReceiptExtraction.objects.filter(last_used__lte=overflow[0]).delete()
+    log.debug("Evicted %s cached receipt extractions", deleted)
+    return deleted
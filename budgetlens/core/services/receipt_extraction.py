@@ -0,0 +1,245 @@
+"""Tiered receipt extraction: local OCR first, the vision model only when unsure
+
+Every receipt is read by Tesseract and the local parser. Each of amount, date
+and category gets a confidence between 0 and 1: how good the parser's match
+looks (an amount on a "total" line with cents beats the first bare number, a
+date near today beats one years away, a single matching category beats
+conflicting keywords) times the confidence Tesseract reported for the words
+it came from. When no keyword settles the category, the user's own
+category classifier gets a say first. Receipts with any field still below
+RECEIPT_ESCALATION_THRESHOLD
+are sent to the vision model in one concurrent batch, and only the unsure
+fields are taken from its answer. A receipt the vision model cannot read, for
+whatever reason, keeps its local result.
+
+Counts, escalations and the time spent in each tier are kept per process
+(extraction_stats) and per job on ReceiptJob.
+"""
+import asyncio
+import datetime
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from ..models import ReceiptJob
+from . import category_classifier, vision_client
+from .receipt_parser import OCR_UNAVAILABLE_DESCRIPTION, ocr_receipt_words, ocr_unavailable_fields
+from .receipt_text import DEFAULT_DESCRIPTION, get_parser
+
+log = logging.getLogger(__name__)
+
+FIELDS = ("amount", "date", "category")
+TOTAL_LINE_PATTERN = re.compile(r"total|amount|amt|payable|balance|net|due", re.I)
+CENTS_PATTERN = re.compile(r"[.,]\d{2}$")
+PLAUSIBLE_DATE_RANGE = datetime.timedelta(days=5 * 365)
+
+_lock = threading.Lock()
+_stats = {"receipts": 0, "escalated": 0, "vision_failed": 0, "local_seconds": 0.0, "vision_seconds": 0.0}
+
+
+def _word_confidence(token, words):
+    """Tesseract's confidence (0-1) for the words a token was read from"""
+    if not words:
+        return 0.0
+    token = token.lower()
+    matching = [
+        conf for word, conf in words
+        if token in word.lower() or (len(word) > 2 and word.lower() in token)
+    ]
+    if matching:
+        return max(0.0, min(matching)) / 100
+    # Tesseract split or merged the token differently: fall back to the page average
+    return max(0.0, sum(conf for _, conf in words) / len(words)) / 100
+
+
+def field_confidence(fields, evidence, words):
+    """Return {amount, date, category} confidences for locally parsed fields"""
+    amount = 0.0
+    if evidence["amount"] is not None:
+        token, line = evidence["amount"]
+        quality = 0.5
+        if CENTS_PATTERN.search(token):
+            quality += 0.2
+        if TOTAL_LINE_PATTERN.search(line):
+            quality += 0.3
+        amount = quality * _word_confidence(token, words)
+
+    date = 0.0
+    if fields["expense_date"] is not None:
+        age = datetime.date.today() - fields["expense_date"]
+        quality = 1.0 if datetime.timedelta(days=-1) <= age <= PLAUSIBLE_DATE_RANGE else 0.4
+        date = quality * _word_confidence(evidence["date"], words)
+
+    category = 0.0
+    if evidence["keywords"]:
+        categories = {found for _, found in evidence["keywords"]}
+        quality = 1.0 if len(categories) == 1 else 0.7
+        keyword = next(word for word, found in evidence["keywords"] if found == fields["category"])
+        category = quality * _word_confidence(keyword, words)
+
+    return {"amount": round(amount, 2), "date": round(date, 2), "category": round(category, 2)}
+
+
+def extract_local(image_path):
+    """Tier 1: OCR and parse one receipt; returns {"data", "confidence", "seconds"}"""
+    start = time.perf_counter()
+    try:
+        text, words = ocr_receipt_words(image_path)
+    except Exception as e:
+        log.warning("Local OCR failed for %s: %s", image_path, e)
+        data = ocr_unavailable_fields()
+        confidence = dict.fromkeys(FIELDS, 0.0)
+    else:
+        parser = get_parser()
+        data = parser.parse(text)
+        confidence = field_confidence(data, parser.evidence(text), words)
+    return {"data": data, "confidence": confidence, "seconds": time.perf_counter() - start}
+
+
+def unsure_fields(confidence):
+    """Fields whose local confidence is below the escalation threshold"""
+    threshold = settings.RECEIPT_ESCALATION_THRESHOLD
+    return [field for field in FIELDS if confidence.get(field, 0.0) < threshold]
+
+
+def _escalate(image_paths):
+    """Tier 2: ask the vision model about several receipts concurrently; [(result or None, seconds)]"""
+
+    async def timed(client, path):
+        start = time.perf_counter()
+        try:
+            result = await client.extract(path)
+        except Exception:
+            # One bad receipt keeps its local result instead of failing the batch
+            log.exception("Vision extraction failed for %s", path)
+            result = None
+        return result, time.perf_counter() - start
+
+    async def run():
+        async with vision_client.VisionClient.from_settings() as client:
+            return await asyncio.gather(*(timed(client, path) for path in image_paths))
+
+    return asyncio.run(run())
+
+
+def _merge(data, vision, unsure):
+    """Take the unsure fields (and the currency, which local OCR cannot tell) from the vision answer"""
+    data = dict(data)
+    if "amount" in unsure and vision["amount"] is not None:
+        data["amount"] = vision["amount"]
+    if "date" in unsure and vision["date"]:
+        data["expense_date"] = datetime.date.fromisoformat(vision["date"])
+    if "category" in unsure and vision["category"]:
+        data["category"] = vision["category"]
+    if vision["currency"]:
+        data["currency"] = vision["currency"]
+    if data["description"] == OCR_UNAVAILABLE_DESCRIPTION:
+        data["description"] = DEFAULT_DESCRIPTION
+    return data
+
+
+def _classify(local, user_id):
+    """Let the user's classifier pick the category when the keywords were not convincing"""
+    if user_id is None or local["confidence"]["category"] >= settings.RECEIPT_ESCALATION_THRESHOLD:
+        return local
+    category, probability = category_classifier.predict(user_id, local["data"]["description"])
+    if category is None or probability <= local["confidence"]["category"]:
+        return local
+    return {
+        **local,
+        "data": {**local["data"], "category": category},
+        "confidence": {**local["confidence"], "category": round(probability, 2)},
+    }
+
+
+def personalize(data, user_id):
+    """Let a user's classifier pick the category of shared extraction data, e.g. a receipt cache hit"""
+    local = {"data": data, "confidence": {"category": data.get("category_confidence", 0.0)}}
+    return _classify(local, user_id)["data"]
+
+
+def extract_many(image_paths, local_results, user_ids=None):
+    """Escalate where needed and return one extraction per receipt
+
+    local_results are extract_local() results for image_paths (computed by the
+    caller, usually in the OCR pool), and user_ids the receipts' owners, whose
+    category classifiers are consulted. Each extraction is a dict with data,
+    shared_data, tier, confidence, local_ms and vision_ms. shared_data holds
+    the same fields without the owner's classifier (plus category_confidence)
+    and is what may go into the receipt cache, which every user reads.
+    """
+    raw_results = local_results
+    local_results = [
+        _classify(local, user_id)
+        for local, user_id in zip(local_results, user_ids or [None] * len(local_results))
+    ]
+    extractions = [
+        {
+            "data": local["data"],
+            "shared_data": {**raw["data"], "category_confidence": raw["confidence"]["category"]},
+            "tier": ReceiptJob.TIER_LOCAL,
+            "confidence": local["confidence"],
+            "local_ms": round(local["seconds"] * 1000),
+            "vision_ms": None,
+        }
+        for raw, local in zip(raw_results, local_results)
+    ]
+    pending = [
+        (i, unsure) for i, local in enumerate(local_results)
+        if (unsure := unsure_fields(local["confidence"]))
+    ]
+
+    escalated = vision_failed = 0
+    vision_seconds = 0.0
+    if pending and vision_client.is_configured():
+        escalated = len(pending)
+        try:
+            answers = _escalate([image_paths[i] for i, _ in pending])
+        except Exception:
+            log.exception("Vision escalation failed, keeping the local results")
+            answers = [(None, 0.0)] * len(pending)
+        for (i, unsure), (vision, seconds) in zip(pending, answers):
+            extraction = extractions[i]
+            extraction["vision_ms"] = round(seconds * 1000)
+            vision_seconds += seconds
+            if vision is None:
+                vision_failed += 1
+                continue
+            extraction["data"] = _merge(extraction["data"], vision, unsure)
+            extraction["shared_data"] = _merge(extraction["shared_data"], vision, unsure)
+            if "category" in unsure and vision["category"]:
+                extraction["shared_data"]["category_confidence"] = 1.0
+            extraction["tier"] = ReceiptJob.TIER_VISION
+    elif pending:
+        log.debug("%s receipts below the confidence threshold, but no vision model is configured", len(pending))
+
+    with _lock:
+        _stats["receipts"] += len(extractions)
+        _stats["escalated"] += escalated
+        _stats["vision_failed"] += vision_failed
+        _stats["local_seconds"] += sum(local["seconds"] for local in local_results)
+        _stats["vision_seconds"] += vision_seconds
+    return extractions
+
+
+def extraction_stats():
+    """Receipts seen, escalation rate and mean latency per tier in this process"""
+    with _lock:
+        stats = dict(_stats)
+    receipts, escalated = stats["receipts"], stats["escalated"]
+    return {
+        "receipts": receipts,
+        "escalated": escalated,
+        "vision_failed": stats["vision_failed"],
+        "escalation_rate": escalated / receipts if receipts else 0.0,
+        "local_ms": stats["local_seconds"] * 1000 / receipts if receipts else 0.0,
+        "vision_ms": stats["vision_seconds"] * 1000 / escalated if escalated else 0.0,
+    }
+
+
+def reset_stats():
+    with _lock:
+        _stats.update(receipts=0, escalated=0, vision_failed=0, local_seconds=0.0, vision_seconds=0.0)
@@ -1,140 +1,95 @@
-import re
+import logging
+
 import pytesseract
-from PIL import Image, ImageEnhance, ImageFilter
-from datetime import datetime
-from django.core.files import File
-from ..models import Expense
-import os
+
+from .image_preprocess import prepare_for_ocr
+from .ocr_engine import ocr_image_words
+from .pdf_receipts import is_pdf, ocr_pdf_words
+from .receipt_text import get_parser, has_amount_and_date
 
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
+log = logging.getLogger(__name__)
+
+OCR_UNAVAILABLE_DESCRIPTION = "Receipt Expense (OCR not available)"
+
+
+def preprocess_receipt_image(image_path):
+    """Load a receipt image and prepare it for OCR"""
+    return prepare_for_ocr(image_path)
+
+
+def ocr_receipt_words(image_path):
+    """Run Tesseract over a preprocessed receipt image (or PDF pages)
+
+    Returns the raw text and Tesseract's (word, confidence) pairs.
+    """
+    if is_pdf(image_path):
+        text, words = ocr_pdf_words(image_path, is_complete=has_amount_and_date)
+    else:
+        img = preprocess_receipt_image(image_path)
+        text, words = ocr_image_words(img)
+
+    # Receipt text is personal data: only at debug level, never on stdout
+    log.debug("OCR output for %s:\n%s", image_path, text)
+    return text, words
 
-def parse_receipt_image(image_path):
-    """Extract details from receipt using OCR with preprocessing"""
-    try:
-        # Preprocess the image for better OCR accuracy
-        img = Image.open(image_path).convert("L")  # grayscale
-        img = img.filter(ImageFilter.MedianFilter())  # reduce noise
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(2)  # increase contrast
-
-        text = pytesseract.image_to_string(img)
-
-        # Debug: print OCR text in terminal
-        print("=== OCR OUTPUT START ===")
-        print(text)
-        print("=== OCR OUTPUT END ===")
-
-    except Exception as e:
-        print(f"Tesseract not available or error: {e}")
-        return {
-            "amount": None,
-            "expense_date": None,
-            "description": "Receipt Expense (OCR not available)",
-            "category": "Miscellaneous",
-            "currency": "INR",
-        }
-
-    # --- Extract Amount (₹500, 123.45, etc.) ---
-    amount_match = re.search(r'(\d+[.,]?\d{0,2})', text)
-    amount = float(amount_match.group(1).replace(',', '')) if amount_match else None
-
-    # --- Extract Date (dd/mm/yyyy or yyyy-mm-dd) ---
-    date_match = re.search(r'(\d{2}[/-]\d{2}[/-]\d{4}|\d{4}[/-]\d{2}[/-]\d{2})', text)
-    expense_date = None
-    if date_match:
-        for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d"):
-            try:
-                expense_date = datetime.strptime(date_match.group(1), fmt).date()
-                break
-            except ValueError:
-                continue
-
-    # --- Description (first line of OCR) ---
-    lines = [line.strip() for line in text.split("\n") if line.strip()]
-    description = lines[0] if lines else "Receipt Expense"
-
-    # --- Category detection ---
-    category = "Miscellaneous"
-    category_keywords = {
-        "Groceries": ["grocery", "supermarket", "store", "mart"],
-        "Dining Out": ["restaurant", "cafe", "food", "pizza", "burger"],
-        "Transportation": ["uber", "ola", "taxi", "bus", "train", "metro"],
-        "Entertainment": ["movie", "cinema", "netflix", "concert"],
-    }
-    for cat, keywords in category_keywords.items():
-        if any(word.lower() in text.lower() for word in keywords):
-            category = cat
-            break
 
+def ocr_unavailable_fields():
+    """Fields for a receipt that OCR could not read"""
     return {
-        "amount": amount,
-        "expense_date": expense_date,
-        "description": description,
-        "category": category,
-        "currency": "INR",  # default
+        "amount": None,
+        "expense_date": None,
+        "description": OCR_UNAVAILABLE_DESCRIPTION,
+        "category": "Miscellaneous",
+        "currency": "INR",
     }
 
 
-def create_expense_from_receipt(user, image_path):
-    """Process receipt and create Expense object"""
-    from ..models import UserProfile
-    from decimal import Decimal
+def extract_receipt_fields(text):
+    """Pull amount, date, description and category out of OCR text"""
+    return get_parser().parse(text)
+
+
+def fill_expense_fields(expense, data):
+    """Copy parsed receipt data onto an Expense, defaulting what OCR could not find"""
     import datetime
 
-    data = parse_receipt_image(image_path)
+    # Handle case where amount couldn't be extracted
+    if data["amount"] is None:
+        data["amount"] = 0.00
 
-    with open(image_path, 'rb') as f:
-        django_file = File(f)
-        django_file.name = os.path.basename(image_path)
+    # Handle case where date couldn't be extracted
+    if data["expense_date"] is None:
+        data["expense_date"] = datetime.date.today()
 
-        # Handle case where amount couldn't be extracted
-        if data["amount"] is None:
-            data["amount"] = 0.00
+    expense.amount = data["amount"]
+    expense.expense_date = data["expense_date"]
+    expense.description = data["description"]
+    expense.category = data["category"]
+    expense.currency = data["currency"]
+    return expense
 
-        # Handle case where date couldn't be extracted
-        if data["expense_date"] is None:
-            data["expense_date"] = datetime.date.today()
 
-        expense = Expense(
-            user=user,
-            receipt_image=django_file,
-            amount=data["amount"],
-            expense_date=data["expense_date"],
-            description=data["description"],
-            category=data["category"],
-            currency=data["currency"],
-        )
+def apply_receipt_data(expense, data):
+    """Fill an Expense from parsed receipt data and convert it to the user's target currency"""
+    from ..models import UserProfile
+    from .currency import convert_many
+
+    fill_expense_fields(expense, data)
 
-        # Currency conversion logic
-        try:
-            user_profile = UserProfile.objects.get(user=user)
-            target_currency = user_profile.target_currency
-
-            date_str = expense.expense_date.strftime("%Y-%m-%d") if expense.expense_date else datetime.date.today().strftime("%Y-%m-%d")
-
-            from ..views import get_exchange_rate
-
-            exchange_rate_to_usd, exchange_rate_to_target = get_exchange_rate(
-                date_str, expense.currency, target_currency
-            )
-
-            if exchange_rate_to_usd and exchange_rate_to_target:
-                exchange_rate_to_usd = Decimal(str(exchange_rate_to_usd))
-                exchange_rate_to_target = Decimal(str(exchange_rate_to_target))
-
-                # Convert amount to Decimal for proper division
-                amount_decimal = Decimal(str(expense.amount))
-                converted_amount_to_usd = amount_decimal / exchange_rate_to_usd
-                converted_amount_to_target = (
-                    converted_amount_to_usd * exchange_rate_to_target
-                )
-                expense.amount_in_target_currency = round(converted_amount_to_target, 2)
-            else:
-                expense.amount_in_target_currency = expense.amount
-        except UserProfile.DoesNotExist:
-            # If no user profile, use original amount
-            expense.amount_in_target_currency = expense.amount
-
-        expense.save()
+    # Currency conversion logic
+    try:
+        user_profile = UserProfile.objects.get(user=expense.user)
+        converted = convert_many(
+            [(expense.amount, expense.currency, expense.expense_date)],
+            user_profile.target_currency,
+        )[0]
+        expense.amount_in_target_currency = (
+            converted if converted is not None else expense.amount
+        )
+    except UserProfile.DoesNotExist:
+        # If no user profile, use original amount
+        expense.amount_in_target_currency = expense.amount
     return expense
+
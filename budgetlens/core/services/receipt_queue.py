@@ -0,0 +1,195 @@
+"""Database-backed queue that moves receipt OCR out of the request cycle
+
+upload_receipt only stores the image and enqueues a ReceiptJob; the
+`process_receipts` management command drains the queue in a separate process.
+Jobs are claimed with a conditional UPDATE, so several workers can share the
+queue without a broker or row locks.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Expense, ReceiptJob
+from . import receipt_cache
+from .ocr_executor import get_executor
+from .receipt_cache import save_upload
+from .receipt_extraction import extract_many, personalize
+from .receipt_parser import OCR_UNAVAILABLE_DESCRIPTION, apply_receipt_data
+
+log = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+# A job still marked processing after this long belongs to a worker that died
+STALE_AFTER = timedelta(minutes=10)
+
+
+def enqueue_receipt(user, receipt_image):
+    """Store an uploaded receipt on a pending Expense and queue it for processing
+
+    A receipt whose content hash was seen before skips OCR: the cached fields
+    are applied right away and the job is created already done. A re-upload of
+    one of the user's own receipts is flagged as a likely duplicate and reuses
+    the stored file instead of writing another copy. Raises ValueError if the
+    upload cannot be read or is larger than RECEIPT_MAX_BYTES.
+    """
+    # Hashed while it streams to storage, so the upload is read only once
+    stored_name, content_hash = save_upload(receipt_image, receipt_image.name)
+    original = (
+        Expense.objects.filter(user=user, receipt_hash=content_hash)
+        .exclude(receipt_image="")
+        .order_by("id")
+        .first()
+    )
+    if original is not None:
+        default_storage.delete(stored_name)
+        stored_name = original.receipt_image.name
+    expense = Expense(
+        user=user,
+        receipt_hash=content_hash,
+        duplicate_of=original,
+        description="Processing receipt…",
+    )
+    expense.receipt_image.name = stored_name
+
+    cached = receipt_cache.get_cached(content_hash)
+    if cached is None:
+        expense.save()
+        return ReceiptJob.objects.create(expense=expense)
+
+    log.debug("Receipt %s found in the extraction cache", content_hash[:12])
+    apply_receipt_data(expense, personalize(cached, user.id))
+    expense.save()
+    return ReceiptJob.objects.create(
+        expense=expense, status=ReceiptJob.DONE, tier=ReceiptJob.TIER_CACHE
+    )
+
+
+def requeue_stale_jobs():
+    """Put jobs abandoned by crashed workers back in the queue"""
+    cutoff = timezone.now() - STALE_AFTER
+    stale = ReceiptJob.objects.filter(status=ReceiptJob.PROCESSING, updated_at__lt=cutoff)
+    requeued = stale.filter(attempts__lt=MAX_ATTEMPTS).update(
+        status=ReceiptJob.PENDING, updated_at=timezone.now()
+    )
+    stale.update(status=ReceiptJob.FAILED, error="Gave up after repeated worker timeouts")
+    return requeued
+
+
+def claim_next_job():
+    """Atomically take the oldest pending job, or return None when the queue is empty"""
+    while True:
+        job_id = (
+            ReceiptJob.objects.filter(status=ReceiptJob.PENDING)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = ReceiptJob.objects.filter(id=job_id, status=ReceiptJob.PENDING).update(
+            status=ReceiptJob.PROCESSING, attempts=F("attempts") + 1, updated_at=timezone.now()
+        )
+        if claimed:
+            return ReceiptJob.objects.select_related("expense").get(id=job_id)
+        # Another worker got there first; try the next one
+
+
+def _finish_job(job, extraction=None, error=None):
+    """Fill in the job's expense from an extraction, or record why extraction failed"""
+    if error is None:
+        data = extraction["data"]
+        job.tier = extraction["tier"]
+        job.confidence = extraction["confidence"]
+        job.local_ms = extraction["local_ms"]
+        job.vision_ms = extraction["vision_ms"]
+        try:
+            if data["description"] != OCR_UNAVAILABLE_DESCRIPTION:
+                receipt_cache.store(job.expense.receipt_hash, extraction["shared_data"])
+            apply_receipt_data(job.expense, data)
+            job.expense.save()
+        except Exception as e:
+            log.exception("Receipt job %s failed", job.pk)
+            error = e
+
+    if error is None:
+        job.status = ReceiptJob.DONE
+        job.error = ""
+    else:
+        job.status = ReceiptJob.PENDING if job.attempts < MAX_ATTEMPTS else ReceiptJob.FAILED
+        job.error = str(error)
+    job.save(
+        update_fields=["status", "error", "tier", "confidence", "local_ms", "vision_ms", "updated_at"]
+    )
+    log.info("Receipt job %s finished with status %s (tier %s)", job.pk, job.status, job.tier or "-")
+    return job
+
+
+def process_job(job):
+    """Extract a claimed job's receipt and fill in its expense"""
+    return process_jobs([job])[0]
+
+
+def process_jobs(jobs):
+    """Extract a batch of claimed jobs and fill in their expenses
+
+    Local OCR runs concurrently in the OCR pool; the receipts it is unsure
+    about then go to the vision model together.
+    """
+    executor = get_executor()
+    futures = [executor.submit_extract(job.expense.receipt_image.path) for job in jobs]
+    extracted = []
+    for job, future in zip(jobs, futures):
+        try:
+            extracted.append((job, future.result()))
+        except Exception as e:
+            log.exception("OCR for receipt job %s failed", job.pk)
+            _finish_job(job, error=e)
+
+    if extracted:
+        try:
+            extractions = extract_many(
+                [job.expense.receipt_image.path for job, _ in extracted],
+                [local for _, local in extracted],
+                [job.expense.user_id for job, _ in extracted],
+            )
+        except Exception as e:
+            # Never leave claimed jobs in processing, or crash the worker loop
+            log.exception("Extraction failed for receipt jobs %s", [job.pk for job, _ in extracted])
+            for job, _ in extracted:
+                _finish_job(job, error=e)
+        else:
+            for (job, _), extraction in zip(extracted, extractions):
+                _finish_job(job, extraction)
+    return jobs
+
+
+def run_worker(poll_interval=2.0, once=False, max_jobs=None, batch_size=None):
+    """Drain the queue, sleeping poll_interval seconds whenever it is empty
+
+    Up to batch_size jobs (by default one per OCR worker process) are claimed
+    and parsed concurrently. With once=True the worker stops as soon as the
+    queue is empty. Returns the number of jobs processed.
+    """
+    batch_size = batch_size or max(get_executor().pool_size, 1)
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        requeue_stale_jobs()
+        limit = batch_size if max_jobs is None else min(batch_size, max_jobs - processed)
+        jobs = []
+        while len(jobs) < limit:
+            job = claim_next_job()
+            if job is None:
+                break
+            jobs.append(job)
+        if not jobs:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        process_jobs(jobs)
+        processed += len(jobs)
+    return processed
@@ -0,0 +1,190 @@
+"""Compiled field extraction from receipt OCR text
+
+Category keywords are compiled once into a trie-shaped alternation (shared
+prefixes are factored out, so the regex engine walks it like an automaton)
+and matched against a single lowercased copy of the text, instead of
+lowercasing the whole text again for every keyword. When keywords from
+several categories appear, the category listed first in the keyword table
+wins, as before. Amount and date come from their own precompiled patterns,
+which stop at the first usable match.
+
+The keyword table has an entry per Expense.BASE_CATEGORIES category and can
+be extended per deployment with settings.RECEIPT_CATEGORY_KEYWORDS, e.g.
+``{"Groceries": ["aldi", "lidl"]}``.
+"""
+import re
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from ..models import Expense
+
+DEFAULT_CATEGORY = "Miscellaneous"
+DEFAULT_DESCRIPTION = "Receipt Expense"
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%Y/%m/%d")
+
+# Earlier categories win when keywords from several categories appear
+CATEGORY_KEYWORDS = {
+    "Groceries": ["grocery", "supermarket", "store", "mart"],
+    "Dining Out": ["restaurant", "cafe", "food", "pizza", "burger"],
+    "Transportation": ["uber", "ola", "taxi", "bus", "train", "metro"],
+    "Entertainment": ["movie", "cinema", "netflix", "concert"],
+    "Healthcare": ["pharmacy", "hospital", "clinic"],
+    "Utilities": ["electricity", "water bill", "broadband"],
+    "Subscriptions": ["subscription"],
+    "Insurance": ["insurance"],
+    "Education": ["tuition", "university"],
+    "Childcare": ["daycare", "nursery"],
+    "Pet Care": ["veterinary", "pet shop"],
+    "Clothing": ["apparel", "clothing"],
+    "Housing": ["landlord", "mortgage"],
+    "Debt Payments": ["loan repayment"],
+    "Miscellaneous": [],
+}
+
+_DATE = r"\d{2}[/-]\d{2}[/-]\d{4}|\d{4}[/-]\d{2}[/-]\d{2}"
+_AMOUNT = r"\d+[.,]?\d{0,2}"
+
+DATE_PATTERN = re.compile(_DATE)
+# Dates are matched first at a position so their digits are never read as the amount
+AMOUNT_PATTERN = re.compile(f"(?P<date>{_DATE})|(?P<amount>{_AMOUNT})")
+
+
+def keyword_pattern(keywords):
+    """Compile keywords into one alternation with common prefixes factored into a trie"""
+    trie = {}
+    for word in keywords:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # A word ending here makes the rest optional; the engine tries the longer match first
+        return f"(?:{body})?" if "" in node else body
+
+    return re.compile(emit(trie)) if trie else None
+
+
+class ReceiptTextParser:
+    """Compiled extraction engine for one keyword table"""
+
+    def __init__(self, category_keywords):
+        self.categories = list(category_keywords)
+        self._keyword_rank = {}
+        for rank, category in enumerate(self.categories):
+            for keyword in category_keywords[category]:
+                self._keyword_rank.setdefault(keyword.lower(), rank)
+        self._keywords = keyword_pattern(self._keyword_rank)
+
+    def category(self, text):
+        """Return the highest-priority category with a keyword in text"""
+        best_rank = len(self.categories)
+        if self._keywords is not None:
+            for match in self._keywords.finditer(text.lower()):
+                best_rank = min(best_rank, self._keyword_rank[match.group()])
+                if best_rank == 0:
+                    break
+        return self.categories[best_rank] if best_rank < len(self.categories) else DEFAULT_CATEGORY
+
+    @staticmethod
+    def _amount(text):
+        for match in AMOUNT_PATTERN.finditer(text):
+            if match.lastgroup == "amount":
+                return match
+        return None
+
+    @staticmethod
+    def _date(text):
+        for match in DATE_PATTERN.finditer(text):
+            expense_date = _parse_date(match.group())
+            if expense_date is not None:
+                return expense_date, match.group()
+        return None, None
+
+    def parse(self, text):
+        """Return amount, date, description and category found in OCR text"""
+        amount = self._amount(text)
+        return {
+            "amount": float(amount.group().replace(",", "")) if amount else None,
+            "expense_date": self._date(text)[0],
+            "description": text.lstrip().partition("\n")[0].strip() or DEFAULT_DESCRIPTION,
+            "category": self.category(text),
+            "currency": "INR",  # default
+        }
+
+    def evidence(self, text):
+        """Return what each field was read from, for confidence scoring
+
+        amount: (matched token, the whole line it is on) or None
+        date: matched token or None
+        keywords: every (keyword, category) found, in text order
+        """
+        amount = self._amount(text)
+        amount_line = None
+        if amount is not None:
+            start = text.rfind("\n", 0, amount.start()) + 1
+            end = text.find("\n", amount.end())
+            amount_line = (amount.group(), text[start:end if end != -1 else len(text)])
+        keywords = []
+        if self._keywords is not None:
+            keywords = [
+                (match.group(), self.categories[self._keyword_rank[match.group()]])
+                for match in self._keywords.finditer(text.lower())
+            ]
+        return {"amount": amount_line, "date": self._date(text)[1], "keywords": keywords}
+
+
+def _parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def has_amount_and_date(text):
+    """True when OCR text already yields both an amount and a date"""
+    fields = get_parser().parse(text)
+    return fields["amount"] is not None and fields["expense_date"] is not None
+
+
+def build_keyword_table(extra=None):
+    """Merge extra {category: [keywords]} into the default table"""
+    table = {category: list(keywords) for category, keywords in CATEGORY_KEYWORDS.items()}
+    for category, keywords in (extra or {}).items():
+        if category not in Expense.BASE_CATEGORIES:
+            raise ImproperlyConfigured(
+                f"RECEIPT_CATEGORY_KEYWORDS: {category!r} is not one of Expense.BASE_CATEGORIES"
+            )
+        table[category].extend(keywords)
+    return table
+
+
+_parser = None
+_parser_lock = threading.Lock()
+
+
+def get_parser():
+    """Return the process-wide parser built from the default and configured keywords"""
+    global _parser
+    with _parser_lock:
+        if _parser is None:
+            _parser = ReceiptTextParser(
+                build_keyword_table(getattr(settings, "RECEIPT_CATEGORY_KEYWORDS", {}))
+            )
+        return _parser
+
+
+def reset_parser():
+    """Drop the compiled parser so the next call picks up new settings"""
+    global _parser
+    with _parser_lock:
+        _parser = None
@@ -0,0 +1,202 @@
+"""Rebase a user's stored amounts onto a new target currency in bounded batches
+
+A target currency change queues a ReconversionJob; the `process_reconversions`
+management command drains the queue in a separate process, so a restart or
+deploy of the web workers cannot cut a re-conversion short. Each batch is
+written in a transaction that first locks the user's profile row and checks
+that the target currency is still the one being converted to, and that
+records the last row written on the job: a re-conversion overtaken by a newer
+change stops there and leaves the rows to the newer one, and one abandoned by
+a crashed worker resumes after the last batch it committed.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Expense, Income, ReconversionJob, UserProfile
+from . import data_version, summaries
+from .currency import convert_many
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_ATTEMPTS = 3
+# A job still marked processing after this long belongs to a worker that died
+STALE_AFTER = timedelta(minutes=10)
+
+
+class Superseded(Exception):
+    """The user's target currency changed while their amounts were being re-converted"""
+
+
+def _reconvert_model(
+    model, date_field, cursor_field, user, target_currency, batch_size, progress, job
+):
+    """Stream one model's rows for a user and rewrite amount_in_target_currency"""
+    queryset = model.objects.filter(user=user).only("id", "amount", "currency", date_field)
+    total = queryset.count()
+    # Rows go in id order so the job can record how far it got
+    start = getattr(job, cursor_field) if job is not None else 0
+    queryset = queryset.filter(id__gt=start).order_by("id")
+    done = total - queryset.count()
+    batch = []
+
+    def flush():
+        nonlocal done
+        converted = convert_many(
+            [(row.amount, row.currency, getattr(row, date_field)) for row in batch],
+            target_currency,
+        )
+        for row, amount in zip(batch, converted):
+            # Same fallback as the write paths: keep the original amount when no rate is known
+            row.amount_in_target_currency = amount if amount is not None else row.amount
+        with transaction.atomic():
+            # A currency change waits for this batch, and one made since the start stops it
+            current = (
+                UserProfile.objects.select_for_update()
+                .filter(user=user)
+                .values_list("target_currency", flat=True)
+                .first()
+            )
+            if current != target_currency:
+                raise Superseded(current)
+            model.objects.bulk_update(batch, ["amount_in_target_currency"], batch_size=batch_size)
+            if job is not None:
+                setattr(job, cursor_field, batch[-1].id)
+                ReconversionJob.objects.filter(pk=job.pk).update(
+                    **{cursor_field: batch[-1].id}, updated_at=timezone.now()
+                )
+        done += len(batch)
+        batch.clear()
+        if progress:
+            progress(model.__name__, done, total)
+
+    for row in queryset.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return done
+
+
+def _reconvert(user, target_currency, batch_size, progress, job=None):
+    updated = _reconvert_model(
+        Expense, "expense_date", "last_expense_id", user, target_currency, batch_size, progress, job
+    )
+    updated += _reconvert_model(
+        Income, "income_date", "last_income_id", user, target_currency, batch_size, progress, job
+    )
+    # bulk_update skips the signals, and every converted amount may have changed
+    summaries.rebuild(user.pk)
+    data_version.bump(user.pk)
+    return updated
+
+
+def reconvert_user(user, target_currency=None, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Recompute amount_in_target_currency on every Expense and Income of a user
+
+    progress, if given, is called as progress(model_name, done, total) after
+    each batch. Returns the number of rows rewritten, 0 if the target currency
+    changed before the re-conversion could finish.
+    """
+    if target_currency is None:
+        target_currency = UserProfile.objects.get(user=user).target_currency
+    log.info("Re-converting amounts for user %s into %s", user.pk, target_currency)
+
+    try:
+        return _reconvert(user, target_currency, batch_size, progress)
+    except Superseded as e:
+        log.info(
+            "Re-conversion for user %s into %s superseded by a change to %s",
+            user.pk, target_currency, e,
+        )
+        return 0
+
+
+def enqueue_reconversion(user, target_currency):
+    """Queue re-converting a user's amounts, dropping their queued jobs for older currencies"""
+    ReconversionJob.objects.filter(user=user, status=ReconversionJob.PENDING).update(
+        status=ReconversionJob.SUPERSEDED, updated_at=timezone.now()
+    )
+    return ReconversionJob.objects.create(user=user, target_currency=target_currency)
+
+
+def requeue_stale_jobs():
+    """Put jobs abandoned by crashed workers back in the queue"""
+    cutoff = timezone.now() - STALE_AFTER
+    stale = ReconversionJob.objects.filter(status=ReconversionJob.PROCESSING, updated_at__lt=cutoff)
+    requeued = stale.filter(attempts__lt=MAX_ATTEMPTS).update(
+        status=ReconversionJob.PENDING, updated_at=timezone.now()
+    )
+    stale.update(status=ReconversionJob.FAILED, error="Gave up after repeated worker timeouts")
+    return requeued
+
+
+def claim_next_job():
+    """Atomically take the oldest pending job, or return None when the queue is empty"""
+    while True:
+        job_id = (
+            ReconversionJob.objects.filter(status=ReconversionJob.PENDING)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = ReconversionJob.objects.filter(id=job_id, status=ReconversionJob.PENDING).update(
+            status=ReconversionJob.PROCESSING, attempts=F("attempts") + 1, updated_at=timezone.now()
+        )
+        if claimed:
+            return ReconversionJob.objects.select_related("user").get(id=job_id)
+        # Another worker got there first; try the next one
+
+
+def _log_progress(model_name, done, total):
+    log.info("Re-converted %s/%s %s rows", done, total, model_name)
+
+
+def process_job(job, batch_size=DEFAULT_BATCH_SIZE):
+    """Run a claimed job from where it left off and record how it ended"""
+    log.info(
+        "Re-converting amounts for user %s into %s (job %s)", job.user_id, job.target_currency, job.pk
+    )
+    try:
+        _reconvert(job.user, job.target_currency, batch_size, _log_progress, job)
+    except Superseded as e:
+        log.info("Re-conversion job %s superseded by a change to %s", job.pk, e)
+        job.status = ReconversionJob.SUPERSEDED
+        job.error = ""
+    except Exception as e:
+        log.exception("Re-conversion job %s failed", job.pk)
+        job.status = ReconversionJob.PENDING if job.attempts < MAX_ATTEMPTS else ReconversionJob.FAILED
+        job.error = str(e)
+    else:
+        job.status = ReconversionJob.DONE
+        job.error = ""
+    job.save(update_fields=["status", "error", "updated_at"])
+    return job
+
+
+def run_worker(poll_interval=2.0, once=False, max_jobs=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Drain the queue, sleeping poll_interval seconds whenever it is empty
+
+    With once=True the worker stops as soon as the queue is empty. Returns the
+    number of jobs processed.
+    """
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        requeue_stale_jobs()
+        job = claim_next_job()
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        process_job(job, batch_size)
+        processed += 1
+    return processed
@@ -0,0 +1,168 @@
+"""Per-user monthly totals by category, kept up to date as rows change
+
+Every Expense and Income counts towards exactly one MonthlySummary row, keyed
+by (user, kind, month, normalized category), with the amount the dashboard
+adds up: amount_in_target_currency for expenses, falling back to the original
+amount for income. Saves and deletes move that amount between rows with
+F() updates (signals in models.py), so the dashboard reads a few rows per
+month and category instead of aggregating the user's whole history.
+
+The updates commit or roll back with the row: Expense.save() and
+Income.save() wrap the write and its signals in one transaction, and Django
+already runs deletes and their signals in one. The row's previous entry is
+read with select_for_update(), so concurrent edits of one row apply their
+deltas one after the other.
+
+bulk_create and bulk_update skip the signals: code using them calls
+add_many() or rebuild() itself. rebuild() also repairs any drift.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from ..models import Expense, Income, MonthlySummary, normalize_category
+
+log = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+
+
+def _amount(value):
+    # Receipt amounts may arrive as floats; go through str() to keep their printed value
+    return Decimal(str(value)).quantize(CENT) if value is not None else Decimal("0.00")
+
+
+def entry(kind, category, date, converted, amount=None):
+    """Return the (kind, month, category, amount) a row contributes to the summary"""
+    if kind == MonthlySummary.INCOME and converted is None:
+        converted = amount
+    month = date.strftime("%Y-%m") if date else ""
+    return kind, month, normalize_category(category), _amount(converted)
+
+
+def instance_entry(instance):
+    """The summary entry of an Expense or Income instance as it is in memory"""
+    if isinstance(instance, Income):
+        return entry(
+            MonthlySummary.INCOME,
+            instance.category,
+            instance.income_date,
+            instance.amount_in_target_currency,
+            instance.amount,
+        )
+    return entry(
+        MonthlySummary.EXPENSE, instance.category, instance.expense_date, instance.amount_in_target_currency
+    )
+
+
+def _add(user_id, key, amount, count):
+    kind, month, category = key
+    rows = MonthlySummary.objects.filter(user_id=user_id, kind=kind, month=month, category=category)
+    if count <= 0:
+        # Never let the count go negative; a missing row means the table has drifted
+        if not rows.filter(count__gte=-count).update(total=F("total") + amount, count=F("count") + count):
+            log.warning("Monthly summary %s for user %s is missing rows, run rebuild_summaries", key, user_id)
+        if count:
+            rows.filter(count=0).delete()
+        return
+    if rows.update(total=F("total") + amount, count=F("count") + count):
+        return
+    try:
+        with transaction.atomic():
+            MonthlySummary.objects.create(
+                user_id=user_id, kind=kind, month=month, category=category, total=amount, count=count
+            )
+    except IntegrityError:
+        # Another transaction created the row first
+        rows.update(total=F("total") + amount, count=F("count") + count)
+
+
+def apply(user_id, previous, current):
+    """Move one row's contribution from its previous entry to its current one (either may be None)"""
+    if previous == current:
+        return
+    changes = defaultdict(lambda: [Decimal("0.00"), 0])
+    if previous is not None:
+        changes[previous[:3]][0] -= previous[3]
+        changes[previous[:3]][1] -= 1
+    if current is not None:
+        changes[current[:3]][0] += current[3]
+        changes[current[:3]][1] += 1
+    for key, (amount, count) in changes.items():
+        if amount or count:
+            _add(user_id, key, amount, count)
+
+
+def add_many(user_id, instances):
+    """Count many newly created rows at once, e.g. after a bulk_create"""
+    changes = defaultdict(lambda: [Decimal("0.00"), 0])
+    for instance in instances:
+        *key, amount = instance_entry(instance)
+        changes[tuple(key)][0] += amount
+        changes[tuple(key)][1] += 1
+    for key, (amount, count) in changes.items():
+        _add(user_id, key, amount, count)
+
+
+def rebuild(user_id):
+    """Recompute a user's summary rows from all their expenses and income; returns the row count"""
+    sources = [
+        (MonthlySummary.EXPENSE, Expense.objects, "expense_date", Sum("amount_in_target_currency")),
+        (
+            MonthlySummary.INCOME,
+            Income.objects,
+            "income_date",
+            Sum(Coalesce("amount_in_target_currency", "amount")),
+        ),
+    ]
+    with transaction.atomic():
+        summaries = []
+        for kind, manager, date_field, total in sources:
+            # Grouped on the stored category_normalized column, covered by the (user, category) index
+            groups = (
+                manager.filter(user_id=user_id)
+                .values("category_normalized", month=TruncMonth(date_field))
+                .annotate(total=total, count=Count("id"))
+                .order_by()
+            )
+            summaries.extend(
+                MonthlySummary(
+                    user_id=user_id,
+                    kind=kind,
+                    month=group["month"].strftime("%Y-%m") if group["month"] else "",
+                    category=group["category_normalized"],
+                    total=_amount(group["total"]),
+                    count=group["count"],
+                )
+                for group in groups
+            )
+        MonthlySummary.objects.filter(user_id=user_id).delete()
+        MonthlySummary.objects.bulk_create(summaries, batch_size=500)
+    return len(summaries)
+
+
+def category_totals(user_id, kind=MonthlySummary.EXPENSE):
+    """[(normalized category, total)] across all months, ordered by category"""
+    return list(
+        MonthlySummary.objects.filter(user_id=user_id, kind=kind)
+        .values("category")
+        .annotate(amount=Sum("total"))
+        .order_by("category")
+        .values_list("category", "amount")
+    )
+
+
+def totals(user_id):
+    """{kind: total} for the user's expenses and income"""
+    found = dict(
+        MonthlySummary.objects.filter(user_id=user_id)
+        .values("kind")
+        .annotate(amount=Sum("total"))
+        .order_by()
+        .values_list("kind", "amount")
+    )
+    return {kind: found.get(kind) or Decimal("0.00") for kind, _ in MonthlySummary.KIND_CHOICES}
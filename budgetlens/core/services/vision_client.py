@@ -0,0 +1,280 @@
+"""Async client that reads receipts with an OpenAI-compatible vision model
+
+A bounded semaphore keeps at most VISION_MAX_CONCURRENCY requests in flight,
+each receipt gets a total deadline across all of its attempts (enforced
+around each whole request, not just per socket read), and timeouts,
+connection errors, 429s and 5xx responses are retried with jittered
+exponential backoff. extract_many() runs a whole batch concurrently, so bulk
+and background jobs can keep N requests in flight from one event loop.
+
+Images are shrunk before upload: decoded at reduced scale, fitted within
+VISION_MAX_EDGE pixels, converted to grayscale and recompressed as JPEG until
+they fit VISION_MAX_BYTES. The original file is never read into memory whole,
+and the data URL is built from the small JPEG buffer.
+
+The endpoint is settings.OPENAI_BASE_URL when set, so the client can be
+pointed at a local stub server that speaks the chat completions API.
+"""
+import asyncio
+import base64
+import datetime
+import io
+import json
+import logging
+import random
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from ..models import Expense
+from .pdf_receipts import is_pdf
+from .rate_bundle import CURRENCY_CODE
+
+log = logging.getLogger(__name__)
+
+PROMPT = (
+    "Analyze the provided receipt and extract the following details: "
+    "1. Category: Determine the category of the expense from this list: "
+    f"{', '.join(Expense.BASE_CATEGORIES)}. 2.Date: Identify the transaction date. "
+    "3. Amount: Extract the expense amount as a decimal number. Consider: "
+    "- A comma may serve as a thousand separator or decimal separator. "
+    "- In KRW (Korean Won), the amount is never lower than a thousand. "
+    "4. Currency: Identify the currency used in the expense starting "
+    "(three-character ISO 4217 code). Respond strictly in JSON format, "
+    "and ending with braces, without any additional markup language "
+    'or explanation. Example response: {"category": "<category>",'
+    ' "date": "<date>", "amount": <amount>,'
+    ' "currency": "<currency>"}'
+)
+
+
+JPEG_QUALITIES = (80, 70, 60, 50, 40)
+SHRINK_STEP = 0.75
+
+
+def _open_receipt(image_path, max_edge):
+    """Open a receipt image (or a PDF's first page) decoded at no more than about max_edge"""
+    if is_pdf(image_path):
+        from pdf2image import convert_from_path
+
+        return convert_from_path(
+            image_path, first_page=1, last_page=1, grayscale=True, size=(None, max_edge)
+        )[0]
+    img = Image.open(image_path)
+    if img.format == "JPEG":
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale while staying above max_edge
+        scale = max_edge / max(img.size)
+        if scale < 1:
+            img.draft("L", (round(img.width * scale), round(img.height * scale)))
+    return ImageOps.exif_transpose(img)
+
+
+def encode_image(image_path, max_edge=None, max_bytes=None):
+    """Return a JPEG data URL for a receipt, downscaled, grayscale and within max_bytes"""
+    max_edge = max_edge or settings.VISION_MAX_EDGE
+    max_bytes = max_bytes or settings.VISION_MAX_BYTES
+
+    img = _open_receipt(image_path, max_edge).convert("L")
+    img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    while True:
+        for quality in JPEG_QUALITIES:
+            buffer.seek(0)
+            buffer.truncate()
+            img.save(buffer, "JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= max_bytes:
+                break
+        if buffer.tell() <= max_bytes or min(img.size) <= 64:
+            break
+        img = img.resize(
+            (round(img.width * SHRINK_STEP), round(img.height * SHRINK_STEP)), Image.Resampling.LANCZOS
+        )
+
+    log.debug("Vision payload for %s: %sx%s, %s bytes", image_path, img.width, img.height, buffer.tell())
+    # Encode straight from the buffer's memory, without copying it to bytes first
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getbuffer()).decode("ascii")
+
+
+def _normalize_date(date_str):
+    """Return a model date as YYYY-MM-DD, reading YYYY-MM-DD, DD-MM-YYYY or MM-DD-YYYY"""
+    date_str = date_str.replace("/", "-").replace(".", "-")
+    parts = date_str.split("-")
+    if len(parts) == 3:
+        first, second, third = map(int, parts)
+        if 31 < first <= 9999 and second <= 12 and third <= 31:
+            year, month, day = first, second, third
+        elif first <= 31 and second <= 12:
+            day, month, year = first, second, third
+        elif first <= 12 and second <= 31:
+            month, day, year = first, second, third
+        else:
+            year = None
+        if year is not None:
+            if year < 100:
+                year += datetime.date.today().year // 100 * 100
+            date_str = f"{year:04d}-{month:02d}-{day:02d}"
+    datetime.datetime.strptime(date_str, "%Y-%m-%d")
+    return date_str
+
+
+def parse_response(content):
+    """Turn the model's JSON answer into category, date, amount and currency"""
+    content = content.strip()
+    if content.startswith("```json") and content.endswith("```"):
+        content = content[7:-3].strip()
+    data = json.loads(content)
+
+    amount = data.get("amount")
+    if amount is not None:
+        try:
+            amount = float(str(amount).replace(",", "."))
+        except (ValueError, TypeError):
+            log.error("Invalid amount format from API: %s. Using default amount.", amount)
+            amount = 0.00
+
+    expense_date = data.get("date")
+    if expense_date:
+        try:
+            expense_date = _normalize_date(expense_date)
+        except (ValueError, IndexError):
+            log.error("Could not parse date: %s. Using current date.", expense_date)
+            expense_date = datetime.date.today().strftime("%Y-%m-%d")
+
+    category = data.get("category", "Miscellaneous")
+    if category not in Expense.BASE_CATEGORIES:
+        category = "Miscellaneous"
+
+    # Only a three-letter code fits Expense.currency and can be looked up in a rate table
+    currency = str(data.get("currency") or "").strip().upper()
+    if not CURRENCY_CODE.fullmatch(currency):
+        if currency:
+            log.error("Invalid currency from API: %s. Ignoring it.", currency)
+        currency = None
+
+    return {
+        "category": category,
+        "date": expense_date,
+        "amount": amount,
+        "currency": currency,
+    }
+
+
+class VisionClient:
+    """Concurrency-limited async client for receipt extraction
+
+    Create and use it inside one event loop; the underlying HTTP pool is tied
+    to the loop that first uses it.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        base_url=None,
+        model="gpt-4o-mini",
+        max_concurrency=4,
+        deadline=30.0,
+        max_attempts=3,
+        backoff=0.5,
+    ):
+        from openai import AsyncOpenAI
+
+        # Retries and timeouts are handled here, against the per-receipt deadline
+        self._client = AsyncOpenAI(api_key=api_key, base_url=base_url or None, max_retries=0)
+        self.model = model
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            model=settings.VISION_MODEL,
+            max_concurrency=settings.VISION_MAX_CONCURRENCY,
+            deadline=settings.VISION_DEADLINE,
+            max_attempts=settings.VISION_MAX_ATTEMPTS,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self._client.close()
+
+    async def _request(self, image_url, timeout):
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": PROMPT},
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": image_url, "detail": settings.VISION_IMAGE_DETAIL},
+                        },
+                    ],
+                }
+            ],
+            temperature=0.2,
+            timeout=timeout,
+        )
+        if not response or not response.choices or not response.choices[0].message.content:
+            raise ValueError("Empty or invalid response from OpenAI API")
+        return response.choices[0].message.content
+
+    async def extract(self, image_path):
+        """Return the fields read from one receipt, or None if the model could not be used"""
+        import openai
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.deadline
+            try:
+                image_url = await asyncio.to_thread(encode_image, image_path)
+            except Exception as e:
+                # An unreadable file fails only its own receipt, not the whole batch
+                log.error("Could not prepare %s for the vision model: %s", image_path, e)
+                return None
+
+            for attempt in range(self.max_attempts):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    # The HTTP timeout bounds each read; wait_for bounds the whole request
+                    content = await asyncio.wait_for(self._request(image_url, remaining), remaining)
+                    return parse_response(content)
+                except asyncio.TimeoutError:
+                    log.warning("Vision request for %s ran past its deadline", image_path)
+                except (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError) as e:
+                    log.warning("Vision request for %s failed: %s", image_path, e)
+                except openai.APIStatusError as e:
+                    log.warning("Vision request for %s failed: %s", image_path, e)
+                    if e.status_code < 500:
+                        break
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    # Bad answers do not get better by asking again
+                    log.error("Unusable vision response for %s: %s", image_path, e)
+                    break
+
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if attempt + 1 >= self.max_attempts or loop.time() + delay >= deadline:
+                    break
+                await asyncio.sleep(delay)
+        return None
+
+    async def extract_many(self, image_paths):
+        """Extract a batch concurrently (up to the semaphore limit), results in input order"""
+        return await asyncio.gather(*(self.extract(path) for path in image_paths))
+
+
+def is_configured():
+    return bool(settings.OPENAI_API_KEY)
+
@@ -1,3 +1,1120 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image, UnidentifiedImageError
+
+from .management.commands.sync_exchange_rates import read_csv
+from .models import (
+    CategoryClassifier, Expense, Income, MonthlySummary, ReceiptJob, ReconversionJob, UserProfile,
+)
+from .services import category_classifier, exchange_rates, listing, reconversion, summaries
+from .services.currency import convert_many
+from .services import ocr_executor
+from .services.receipt_batch import import_receipts
+from .services.receipt_queue import claim_next_job, enqueue_receipt, process_jobs
+from .services.reconversion import reconvert_user
+from .services.fx_client import FXClient
+from .services.rate_bundle import RateBundle, write_bundle
+from .services.vision_client import VisionClient, parse_response
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        status, body, drip = self.server.next_reply()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            if drip:
+                for i in range(len(body)):
+                    self.wfile.write(body[i:i + 1])
+                    self.wfile.flush()
+                    time.sleep(drip)
+            else:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    do_GET = do_POST = _respond
+
+
+class StubServer(ThreadingHTTPServer):
+    """Local HTTP server answering with queued (status, JSON body, seconds between bytes) replies
+
+    The last reply is repeated once the queue is down to it.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.replies = []
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/"
+
+    def reply(self, status, payload, drip=0.0):
+        self.replies.append((status, json.dumps(payload).encode(), drip))
+
+    def next_reply(self):
+        with self._lock:
+            self.requests += 1
+            return self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+
+
+class StubServerMixin:
+    def setUp(self):
+        super().setUp()
+        self.server = StubServer()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+
+class ReceiptFilesMixin:
+    """Stores uploads under a throwaway MEDIA_ROOT and runs OCR inline instead of in the process pool"""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        executor = mock.patch.object(ocr_executor, "_executor", ocr_executor.OCRExecutor(0))
+        executor.start()
+        self.addCleanup(executor.stop)
+
+
+@override_settings(LISTING_PAGE_SIZE=5)
+class QueryPlanTests(TestCase):
+    """The per-user listing and category queries are served by the composite indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("planner", password="secret")
+        other = User.objects.create_user("other", password="secret")
+        day = datetime.date(2024, 1, 1)
+        for owner in (cls.user, other):
+            Expense.objects.bulk_create(
+                Expense(
+                    user=owner,
+                    expense_date=day + datetime.timedelta(days=i) if i % 10 else None,
+                    amount=i,
+                    currency="EUR",
+                    category=Expense.BASE_CATEGORIES[i % len(Expense.BASE_CATEGORIES)],
+                    category_normalized=Expense.BASE_CATEGORIES[i % len(Expense.BASE_CATEGORIES)].lower(),
+                )
+                for i in range(40)
+            )
+            Income.objects.bulk_create(
+                Income(user=owner, income_date=day + datetime.timedelta(days=i), amount=i, currency="EUR")
+                for i in range(40)
+            )
+
+    def setUp(self):
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest(f"No plan expectations for {connection.vendor}")
+        self.client.login(username="planner", password="secret")
+        # Earlier tests may have cached the dashboard under the same data version
+        cache.clear()
+        if connection.vendor == "postgresql":
+            # The fixture is tiny; make the planner show which index it would use at scale
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                return "\n".join(row[-1] for row in cursor.fetchall())
+            cursor.execute(f"EXPLAIN {sql}")
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def listing_plans(self, url, table, params=None):
+        """Plans of the queries a view runs against one table"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        selects = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith("SELECT") and re.search(rf'FROM "{table}"', query["sql"])
+        ]
+        self.assertTrue(selects, f"{url} ran no query against {table}")
+        return [self.explain(sql) for sql in selects]
+
+    def assertUsesIndex(self, plan, index):
+        self.assertIn(index, plan)
+        # The index order serves ORDER BY, so nothing is sorted in memory
+        self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan)
+        # PostgreSQL: neither Sort nor Incremental Sort (which means the index covers only a prefix)
+        self.assertNotRegex(plan, r"\bSort\b")
+
+    def test_dashboard_expense_listing_uses_user_date_index(self):
+        for plan in self.listing_plans("/core/dashboard/", "core_expense"):
+            self.assertUsesIndex(plan, "expense_user_date_idx")
+
+    def test_dashboard_income_listing_uses_user_date_index(self):
+        for plan in self.listing_plans("/core/dashboard/", "core_income"):
+            self.assertUsesIndex(plan, "income_user_date_idx")
+
+    def test_load_more_uses_user_date_index(self):
+        for plan in self.listing_plans("/core/expense/rows/", "core_expense", {"cursor": "2024-01-20.15"}):
+            self.assertUsesIndex(plan, "expense_user_date_idx")
+        for plan in self.listing_plans("/core/income/rows/", "core_income", {"cursor": "2024-01-20.15"}):
+            self.assertUsesIndex(plan, "income_user_date_idx")
+
+    def test_income_list_uses_user_date_index(self):
+        for plan in self.listing_plans("/core/income/list/", "core_income"):
+            self.assertUsesIndex(plan, "income_user_date_idx")
+
+    def test_category_totals_use_user_category_index(self):
+        queryset = (
+            Expense.objects.filter(user=self.user)
+            .values("category_normalized")
+            .annotate(total=Sum("amount_in_target_currency"))
+            .order_by("category_normalized")
+        )
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            sql = connection.ops.last_executed_query(cursor, sql, params)
+        self.assertUsesIndex(self.explain(sql), "expense_user_category_idx")
+
+
+class ListingPagingTests(TestCase):
+    """Walking a listing cursor by cursor returns every row exactly once, in order"""
+
+    filters = [
+        {},
+        {"currency": "EUR"},
+        {"category": "housing"},
+        {"date_from": datetime.date(2024, 1, 2), "date_to": datetime.date(2024, 1, 3)},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("pager", password="secret")
+        other = User.objects.create_user("other", password="secret")
+        dates = [datetime.date(2024, 1, 1), datetime.date(2024, 1, 2), datetime.date(2024, 1, 3), None]
+        # Dates cycle, so ids do not follow dates and every date is shared by several rows
+        for i in range(17):
+            for owner in (cls.user, other):
+                Expense.objects.create(
+                    user=owner,
+                    expense_date=dates[i % 4],
+                    amount=i,
+                    currency="EUR" if i % 3 else "USD",
+                    category="Housing" if i % 2 else "Groceries",
+                )
+                Income.objects.create(
+                    user=owner,
+                    income_date=dates[i % 3],
+                    amount=i,
+                    currency="EUR" if i % 3 else "USD",
+                    category="Housing" if i % 2 else "Salary",
+                )
+
+    def expected(self, kind, filters):
+        """Newest first by (date, id), undated rows last"""
+        _, date_field = listing.LISTINGS[kind]
+        rows = list(listing.filtered(kind, self.user, filters).values_list(date_field, "id"))
+        dated = sorted((row for row in rows if row[0] is not None), reverse=True)
+        undated = sorted((row for row in rows if row[0] is None), reverse=True)
+        return [pk for _, pk in dated + undated]
+
+    def walk(self, kind, filters, size):
+        ids, cursor = [], None
+        while True:
+            rows, cursor = listing.page(kind, self.user, filters, cursor, size)
+            ids += [row.id for row in rows]
+            if cursor is None:
+                return ids
+            self.assertEqual(len(rows), size)
+            self.assertLessEqual(len(ids), 17, "paging does not end")
+
+    def test_every_row_once_for_every_page_size(self):
+        for kind in listing.LISTINGS:
+            for filters in self.filters:
+                expected = self.expected(kind, filters)
+                self.assertTrue(expected)
+                for size in range(1, len(expected) + 2):
+                    with self.subTest(kind=kind, filters=filters, size=size):
+                        self.assertEqual(self.walk(kind, filters, size), expected)
+
+    def test_equal_dates_are_split_by_id(self):
+        day = datetime.date(2024, 1, 2)
+        same_day = list(
+            Expense.objects.filter(user=self.user, expense_date=day)
+            .order_by("-id").values_list("id", flat=True)
+        )
+        self.assertGreater(len(same_day), 2)
+        rows, _ = listing.page("expense", self.user, cursor=listing.encode_cursor(day, same_day[0]), size=2)
+        self.assertEqual([row.id for row in rows], same_day[1:3])
+
+    def test_last_dated_row_continues_with_the_undated_rows(self):
+        last_dated = (
+            Expense.objects.filter(user=self.user, expense_date__isnull=False)
+            .order_by("expense_date", "id").first()
+        )
+        undated = list(
+            Expense.objects.filter(user=self.user, expense_date=None)
+            .order_by("-id").values_list("id", flat=True)
+        )
+        cursor = listing.encode_cursor(last_dated.expense_date, last_dated.id)
+        rows, next_cursor = listing.page("expense", self.user, cursor=cursor, size=2)
+        self.assertEqual([row.id for row in rows], undated[:2])
+        self.assertEqual(next_cursor, listing.encode_cursor(None, undated[1]))
+        rows, _ = listing.page("expense", self.user, cursor=next_cursor, size=len(undated))
+        self.assertEqual([row.id for row in rows], undated[2:])
+
+    @override_settings(LISTING_PAGE_SIZE=4)
+    def test_rows_endpoint_walks_the_whole_listing(self):
+        self.client.login(username="pager", password="secret")
+        for kind, link in (("expense", r"/core/expense/(\d+)/"), ("income", r"/core/income/(\d+)/")):
+            for filters in self.filters:
+                with self.subTest(kind=kind, filters=filters):
+                    query = {key: str(value) for key, value in filters.items()}
+                    ids, cursor = [], None
+                    while True:
+                        params = {**query, **({"cursor": cursor} if cursor else {})}
+                        page = self.client.get(f"/core/{kind}/rows/", params).json()
+                        ids += [int(pk) for pk in re.findall(link, page["html"])]
+                        cursor = page["next_cursor"]
+                        if cursor is None:
+                            break
+                    self.assertEqual(ids, self.expected(kind, filters))
+
+
+class RateBundleTests(SimpleTestCase):
+    """Malformed currency codes and rates never reach a published bundle"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "rates.fxb")
+
+    def test_bad_codes_and_rates_are_skipped(self):
+        day = datetime.date(2024, 1, 2)
+        with self.assertLogs("core.services.rate_bundle", "ERROR"):
+            write_bundle(self.path, {day: {"EUR": "0.9", "EURO": "1", "€": "1", "INR": "abc", "JPY": "-1"}})
+        bundle = RateBundle(self.path)
+        self.addCleanup(bundle.close)
+        self.assertEqual(bundle.currencies, ["EUR"])
+        self.assertEqual(bundle.rates(day), {"EUR": Decimal("0.9")})
+
+    def test_truncated_bundle_is_rejected(self):
+        write_bundle(self.path, {datetime.date(2024, 1, 2): {"EUR": 0.9, "INR": 83}})
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 4)
+        with self.assertRaises(ValueError):
+            RateBundle(self.path)
+
+    def test_failed_write_keeps_the_previous_bundle(self):
+        write_bundle(self.path, {datetime.date(2024, 1, 2): {"EUR": 0.9}})
+        with self.assertRaises(AttributeError):
+            write_bundle(self.path, {"not a date": {"EUR": 0.9}})
+        self.assertEqual(os.listdir(self.dir.name), ["rates.fxb"])
+        bundle = RateBundle(self.path)
+        self.addCleanup(bundle.close)
+        self.assertEqual(len(bundle), 1)
+
+    def test_csv_rows_with_bad_rates_are_skipped(self):
+        csv_path = os.path.join(self.dir.name, "rates.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("date,currency,rate\n2024-01-02,eur,0.9\n2024-01-02,INR,n/a\n2024-01-02,US,1\n")
+        with self.assertLogs("core.management.commands.sync_exchange_rates", "ERROR") as logs:
+            tables = read_csv(csv_path)
+        self.assertEqual(tables, {datetime.date(2024, 1, 2): {"EUR": Decimal("0.9")}})
+        self.assertEqual(len(logs.records), 2)
+
+
+class FXClientTests(StubServerMixin, SimpleTestCase):
+    """The FX client against a local stub of the historical API"""
+
+    day = datetime.date(2024, 1, 2)
+
+    def client_for(self, **options):
+        client = FXClient(self.server.url, backoff=0, **options)
+        self.addCleanup(client.close)
+        return client
+
+    def test_rates_are_read(self):
+        self.server.reply(200, {"rates": {"EUR": 0.9}})
+        self.assertEqual(self.client_for().historical(self.day), {"EUR": Decimal("0.9")})
+
+    def test_5xx_is_retried(self):
+        self.server.reply(503, {"error": "busy"})
+        self.server.reply(200, {"rates": {"EUR": 0.9}})
+        self.assertEqual(self.client_for().historical(self.day), {"EUR": Decimal("0.9")})
+        self.assertEqual(self.server.requests, 2)
+
+    def test_4xx_is_not_retried(self):
+        self.server.reply(401, {"error": "invalid app id"})
+        self.assertIsNone(self.client_for().historical(self.day))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_slow_drip_stays_within_the_time_budget(self):
+        self.server.reply(200, {"rates": {"EUR": 0.9, "INR": 83.1}}, drip=0.05)
+        start = time.monotonic()
+        self.assertIsNone(self.client_for(time_budget=0.5, max_attempts=1).historical(self.day))
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def test_breaker_opens_after_repeated_failures(self):
+        self.server.reply(500, {"error": "down"})
+        client = self.client_for(max_attempts=1, failure_threshold=2)
+        self.assertIsNone(client.historical(self.day))
+        self.assertIsNone(client.historical(self.day + datetime.timedelta(days=1)))
+        self.assertTrue(client.circuit_open)
+        self.assertIsNone(client.historical(self.day + datetime.timedelta(days=2)))
+        self.assertEqual(self.server.requests, 2)
+
+    def test_client_errors_do_not_open_the_breaker(self):
+        self.server.reply(400, {"error": "invalid date"})
+        client = self.client_for(max_attempts=1, failure_threshold=2)
+        for offset in range(3):
+            self.assertIsNone(client.historical(self.day + datetime.timedelta(days=offset)))
+        self.assertFalse(client.circuit_open)
+        self.assertEqual(self.server.requests, 3)
+        # the failed date itself is still negatively cached
+        self.assertIsNone(client.historical(self.day))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_negative_cache_is_bounded(self):
+        self.server.reply(500, {"error": "down"})
+        client = self.client_for(max_attempts=1, failure_threshold=100, negative_cache_size=2)
+        for offset in range(5):
+            client.historical(self.day + datetime.timedelta(days=offset))
+        self.assertEqual(len(client._negative), 2)
+
+
+def chat_completion(content):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "stub",
+        "choices": [
+            {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+        ],
+    }
+
+
+class VisionClientTests(StubServerMixin, SimpleTestCase):
+    """The vision client against a local stub of the chat completions API"""
+
+    answer = '{"category": "Groceries", "date": "2024-01-02", "amount": "12,50", "currency": "eur"}'
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.receipt = os.path.join(self.dir.name, "receipt.jpg")
+        Image.new("L", (200, 300), 255).save(self.receipt)
+        self.corrupt = os.path.join(self.dir.name, "corrupt.jpg")
+        with open(self.corrupt, "wb") as f:
+            f.write(b"not an image")
+
+    def extract_many(self, paths, **options):
+        async def run():
+            async with VisionClient("stub-key", base_url=self.server.url, backoff=0, **options) as client:
+                return await client.extract_many(paths)
+
+        return asyncio.run(run())
+
+    def test_receipt_is_read(self):
+        self.server.reply(200, chat_completion(self.answer))
+        [result] = self.extract_many([self.receipt])
+        self.assertEqual(
+            result, {"category": "Groceries", "date": "2024-01-02", "amount": 12.5, "currency": "EUR"}
+        )
+
+    def test_currency_that_is_not_a_code_is_dropped(self):
+        for answer in ("RUPEES", "Rs.", "€", 42):
+            with self.subTest(answer=answer):
+                content = json.dumps({"category": "Groceries", "amount": 5, "currency": answer})
+                with self.assertLogs("core.services.vision_client", "ERROR"):
+                    self.assertIsNone(parse_response(content)["currency"])
+        self.assertEqual(parse_response('{"currency": " usd "}')["currency"], "USD")
+        self.assertIsNone(parse_response('{"currency": null}')["currency"])
+
+    def test_corrupt_file_fails_only_its_own_receipt(self):
+        self.server.reply(200, chat_completion(self.answer))
+        with self.assertLogs("core.services.vision_client", "ERROR"):
+            results = self.extract_many([self.corrupt, self.receipt])
+        self.assertIsNone(results[0])
+        self.assertEqual(results[1]["amount"], 12.5)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_5xx_is_retried(self):
+        self.server.reply(502, {"error": {"message": "bad gateway"}})
+        self.server.reply(200, chat_completion(self.answer))
+        [result] = self.extract_many([self.receipt])
+        self.assertEqual(result["category"], "Groceries")
+        self.assertEqual(self.server.requests, 2)
+
+    def test_4xx_is_not_retried(self):
+        self.server.reply(401, {"error": {"message": "invalid key"}})
+        self.assertEqual(self.extract_many([self.receipt]), [None])
+        self.assertEqual(self.server.requests, 1)
+
+    def test_slow_answer_stays_within_the_deadline(self):
+        self.server.reply(200, chat_completion(self.answer), drip=0.05)
+        start = time.monotonic()
+        self.assertEqual(self.extract_many([self.receipt], deadline=0.5), [None])
+        self.assertLess(time.monotonic() - start, 1.5)
+
+
+@override_settings(OPENAI_API_KEY="stub-key")
+class ReceiptFailureTests(ReceiptFilesMixin, TestCase):
+    """A receipt the vision model chokes on is finished with its local result"""
+
+    def setUp(self):
+        super().setUp()
+        extract = mock.patch(
+            "core.services.vision_client.VisionClient.extract",
+            side_effect=UnidentifiedImageError("cannot identify image file"),
+        )
+        extract.start()
+        self.addCleanup(extract.stop)
+        self.user = User.objects.create_user("uploader", password="secret")
+
+    def test_worker_finishes_the_job(self):
+        enqueue_receipt(self.user, SimpleUploadedFile("bad.jpg", b"not an image"))
+        with self.assertLogs("core.services.receipt_extraction", "ERROR"):
+            [job] = process_jobs([claim_next_job()])
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReceiptJob.DONE)
+        self.assertEqual(job.tier, ReceiptJob.TIER_LOCAL)
+
+    def test_batch_import_reports_the_receipt(self):
+        with self.assertLogs("core.services.receipt_extraction", "ERROR"):
+            [entry] = import_receipts(self.user, [SimpleUploadedFile("bad.jpg", b"not an image")])
+        self.assertEqual(entry["status"], "created")
+        self.assertIn("warning", entry)
+
+
+@override_settings(OPENAI_API_KEY="")
+class ReceiptImportTests(ReceiptFilesMixin, TestCase):
+    """Bulk receipt imports validate every file and leave nothing behind on failure"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("importer", password="secret")
+
+    def stored_receipts(self):
+        return default_storage.listdir("receipts")[1] if default_storage.exists("receipts") else []
+
+    def archive(self, entries, corrupt=None):
+        """A ZIP upload of {name: bytes}, with the stored data of entry `corrupt` damaged"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            for name, data in entries.items():
+                archive.writestr(name, data)
+        content = bytearray(buffer.getvalue())
+        if corrupt is not None:
+            offset = content.index(entries[corrupt])
+            content[offset] ^= 0xFF
+        return SimpleUploadedFile("receipts.zip", bytes(content))
+
+    @override_settings(RECEIPT_MAX_BYTES=16)
+    def test_direct_uploads_are_checked_like_zip_entries(self):
+        summary = import_receipts(
+            self.user,
+            [
+                SimpleUploadedFile("notes.txt", b"x"),
+                SimpleUploadedFile("big.jpg", b"x" * 17),
+                SimpleUploadedFile("small.jpg", b"x" * 16),
+            ],
+        )
+        self.assertEqual(
+            [(entry["file"], entry["status"], entry.get("error")) for entry in summary],
+            [
+                ("notes.txt", "skipped", "Not a receipt image"),
+                ("big.jpg", "skipped", "File too large"),
+                ("small.jpg", "created", None),
+            ],
+        )
+        self.assertEqual(len(self.stored_receipts()), 1)
+
+    def test_unreadable_zip_entry_is_skipped(self):
+        upload = self.archive({"bad.jpg": b"a" * 64, "good.jpg": b"b" * 64}, corrupt="bad.jpg")
+        summary = import_receipts(self.user, [upload])
+        self.assertEqual(summary[0]["status"], "skipped")
+        self.assertTrue(summary[0]["error"].startswith("Could not read file"))
+        self.assertEqual(summary[1]["status"], "created")
+        self.assertEqual(self.stored_receipts(), ["good.jpg"])
+
+    def test_failed_import_deletes_stored_files(self):
+        upload = self.archive({"one.jpg": b"a" * 64, "two.jpg": b"b" * 64})
+        with mock.patch.object(Expense.objects, "bulk_create", side_effect=IntegrityError("boom")):
+            with self.assertRaises(IntegrityError):
+                import_receipts(self.user, [upload])
+        self.assertEqual(self.stored_receipts(), [])
+        self.assertFalse(Expense.objects.filter(user=self.user).exists())
+
+
+class CategoryLabelTests(TestCase):
+    """The category classifier learns only from categories the user chose"""
+
+    def setUp(self):
+        category_classifier.clear_cache()
+        self.addCleanup(category_classifier.clear_cache)
+        self.user = User.objects.create_user("labeller", password="secret")
+        self.client.login(username="labeller", password="secret")
+
+    def add(self, description, category=""):
+        self.client.post(
+            "/core/expense/add/",
+            {
+                "amount": "12.50",
+                "currency": "INR",
+                "expense_date": "2024-01-02",
+                "description": description,
+                "category": category,
+            },
+        )
+        return Expense.objects.filter(user=self.user).latest("id")
+
+    def examples(self):
+        return (
+            CategoryClassifier.objects.filter(user=self.user).values_list("examples", flat=True).first()
+            or 0
+        )
+
+    def test_chosen_category_is_learned(self):
+        expense = self.add("Weekly supermarket shop", "Groceries")
+        self.assertTrue(expense.category_confirmed)
+        self.assertEqual(self.examples(), 1)
+        self.assertEqual(category_classifier.predict(self.user.id, "supermarket")[0], "Groceries")
+
+    def test_predicted_category_is_not_learned(self):
+        self.add("Weekly supermarket shop", "Groceries")
+        expense = self.add("Supermarket run")
+        self.assertEqual(expense.category, "Groceries")
+        self.assertFalse(expense.category_confirmed)
+        self.assertEqual(self.examples(), 1)
+
+    def test_correction_is_learned(self):
+        self.add("Weekly supermarket shop", "Groceries")
+        expense = self.add("Supermarket cafe lunch")
+        self.client.post(
+            f"/core/save_expense/{expense.id}/",
+            {"category": "Dining Out", "expense_date": "2024-01-02", "amount": "12.50", "currency": "INR"},
+        )
+        expense.refresh_from_db()
+        self.assertTrue(expense.category_confirmed)
+        self.assertEqual(self.examples(), 2)
+
+    def test_other_saves_do_no_classifier_work(self):
+        expense = self.add("Weekly supermarket shop", "Groceries")
+        expense.amount = Decimal("20.00")
+        with CaptureQueriesContext(connection) as queries:
+            expense.save()
+        self.assertFalse(any("core_categoryclassifier" in query["sql"] for query in queries.captured_queries))
+
+
+class TargetCurrencyTests(TestCase):
+    """Profile saves and re-conversions around target currency changes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("traveller", password="secret")
+
+    def test_login_does_not_touch_the_profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.client.login(username="traveller", password="secret"))
+        self.assertFalse(any("core_userprofile" in query["sql"] for query in queries.captured_queries))
+
+    def test_superseded_reconversion_writes_nothing(self):
+        Expense.objects.create(
+            user=self.user, amount=10, currency="INR", amount_in_target_currency=10, category="Housing"
+        )
+        # The profile moved on to USD before the EUR re-conversion got to run
+        UserProfile.objects.filter(user=self.user).update(target_currency="USD")
+        with self.assertLogs("core.services.reconversion", "INFO") as logs:
+            self.assertEqual(reconvert_user(self.user, "EUR"), 0)
+        self.assertIn("superseded", logs.output[-1])
+        self.assertEqual(Expense.objects.get(user=self.user).amount_in_target_currency, 10)
+
+
+@override_settings(RECONVERT_IN_BACKGROUND=True)
+class ReconversionJobTests(TestCase):
+    """Target currency changes are re-converted by the worker, resumably"""
+
+    day = datetime.date(2024, 1, 2)
+
+    def setUp(self):
+        exchange_rates.clear_cache()
+        self.addCleanup(exchange_rates.clear_cache)
+        fetch = mock.patch.object(
+            exchange_rates, "fetch_rates",
+            return_value={"USD": Decimal("1"), "EUR": Decimal("0.5"), "INR": Decimal("80")},
+        )
+        fetch.start()
+        self.addCleanup(fetch.stop)
+        self.user = User.objects.create_user("traveller")
+        self.expenses = [
+            Expense.objects.create(
+                user=self.user, amount=10, currency="USD", amount_in_target_currency=800,
+                expense_date=self.day, category="Housing",
+            )
+            for _ in range(3)
+        ]
+
+    def change_currency(self, currency):
+        profile = UserProfile.objects.get(user=self.user)
+        profile.target_currency = currency
+        profile.save()
+
+    def amounts(self):
+        return list(
+            Expense.objects.filter(user=self.user).order_by("id")
+            .values_list("amount_in_target_currency", flat=True)
+        )
+
+    def test_currency_change_is_queued_for_the_worker(self):
+        self.change_currency("EUR")
+        job = ReconversionJob.objects.get(user=self.user)
+        self.assertEqual((job.status, job.target_currency), (ReconversionJob.PENDING, "EUR"))
+        self.assertEqual(self.amounts(), [Decimal("800.00")] * 3)
+        call_command("process_reconversions", once=True, stdout=io.StringIO())
+        self.assertEqual(self.amounts(), [Decimal("5.00")] * 3)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReconversionJob.DONE)
+
+    def test_interrupted_job_resumes_after_its_last_batch(self):
+        self.change_currency("EUR")
+        real_convert_many = reconversion.convert_many
+        calls = []
+
+        def crash_on_second_batch(items, target_currency):
+            calls.append(items)
+            if len(calls) == 2:
+                raise RuntimeError("worker went away")
+            return real_convert_many(items, target_currency)
+
+        with mock.patch.object(reconversion, "convert_many", side_effect=crash_on_second_batch):
+            with self.assertLogs("core.services.reconversion", "ERROR"):
+                job = reconversion.process_job(reconversion.claim_next_job(), batch_size=1)
+        self.assertEqual(job.status, ReconversionJob.PENDING)
+        self.assertEqual(job.last_expense_id, self.expenses[0].id)
+        self.assertEqual(self.amounts(), [Decimal("5.00"), Decimal("800.00"), Decimal("800.00")])
+
+        with mock.patch.object(reconversion, "convert_many", side_effect=real_convert_many) as convert:
+            call_command("process_reconversions", once=True, batch_size=1, stdout=io.StringIO())
+        # Only the two rows the first run never committed are converted again
+        self.assertEqual(convert.call_count, 2)
+        self.assertEqual(self.amounts(), [Decimal("5.00")] * 3)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReconversionJob.DONE)
+
+    def test_newer_change_supersedes_an_older_job(self):
+        self.change_currency("EUR")
+        older = reconversion.claim_next_job()
+        self.change_currency("USD")
+        self.change_currency("EUR")
+        self.change_currency("USD")
+        with self.assertLogs("core.services.reconversion", "INFO"):
+            self.assertEqual(reconversion.process_job(older).status, ReconversionJob.SUPERSEDED)
+        call_command("process_reconversions", once=True, stdout=io.StringIO())
+        statuses = list(ReconversionJob.objects.order_by("id").values_list("status", flat=True))
+        self.assertEqual(statuses, ["superseded", "superseded", "superseded", "done"])
+        self.assertEqual(self.amounts(), [Decimal("10.00")] * 3)
+
+
+@override_settings(RECONVERT_IN_BACKGROUND=True)
+class DataVersionViewTests(TestCase):
+    """Pages are revalidated by ETag and cached until the user's data changes"""
+
+    pages = ["/core/dashboard/", "/core/income/list/", "/core/expense/rows/", "/core/income/rows/"]
+    day = datetime.date(2024, 1, 2)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        exchange_rates.clear_cache()
+        self.addCleanup(exchange_rates.clear_cache)
+        fetch = mock.patch.object(
+            exchange_rates, "fetch_rates",
+            return_value={"USD": Decimal("1"), "EUR": Decimal("0.5"), "INR": Decimal("80")},
+        )
+        fetch.start()
+        self.addCleanup(fetch.stop)
+        self.user = User.objects.create_user("viewer", password="secret")
+        Expense.objects.create(
+            user=self.user, amount=10, currency="INR", amount_in_target_currency=10,
+            expense_date=self.day, category="Housing",
+        )
+        self.client.login(username="viewer", password="secret")
+
+    def etags(self):
+        return {url: self.client.get(url)["ETag"] for url in self.pages}
+
+    def assert_all_changed(self, before):
+        for url, etag in before.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+
+    def test_matching_etag_gets_304(self):
+        for url, etag in self.etags().items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b"")
+        # The ETag covers the query string as well
+        etag = self.client.get("/core/dashboard/")["ETag"]
+        response = self.client.get("/core/dashboard/?category=Housing", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_expense_write_invalidates_pages_and_dashboard_cache(self):
+        self.assertEqual(self.client.get("/core/dashboard/").context["total_expenses"], Decimal("10"))
+        before = self.etags()
+        response = self.client.post(
+            "/core/expense/add/",
+            {"amount": "5", "currency": "INR", "expense_date": "2024-01-03", "category": "Groceries"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_all_changed(before)
+        self.assertEqual(self.client.get("/core/dashboard/").context["total_expenses"], Decimal("15"))
+
+    def test_income_write_invalidates_pages_and_dashboard_cache(self):
+        self.assertEqual(self.client.get("/core/dashboard/").context["total_income"], 0)
+        before = self.etags()
+        response = self.client.post(
+            "/core/income/add/",
+            {"amount": "100", "currency": "INR", "income_date": "2024-01-03", "category": "Salary"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_all_changed(before)
+        self.assertEqual(self.client.get("/core/dashboard/").context["total_income"], Decimal("100"))
+
+    def test_currency_change_invalidates_pages_and_dashboard_cache(self):
+        self.assertEqual(self.client.get("/core/dashboard/").context["total_expenses"], 10)
+        before = self.etags()
+        profile = UserProfile.objects.get(user=self.user)
+        profile.target_currency = "EUR"
+        profile.save()
+        self.assert_all_changed(before)
+        # The re-converted amounts invalidate them once more
+        before = self.etags()
+        call_command("process_reconversions", once=True, stdout=io.StringIO())
+        self.assert_all_changed(before)
+        self.assertEqual(float(self.client.get("/core/dashboard/").context["total_expenses"]), 0.06)
+
+
+class ReceiptUploadTests(ReceiptFilesMixin, TestCase):
+    """Single receipt uploads are stored once and hashed as they stream"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("scanner", password="secret")
+
+    def test_reupload_reuses_the_stored_file(self):
+        first = enqueue_receipt(self.user, SimpleUploadedFile("a.jpg", b"receipt bytes")).expense
+        second = enqueue_receipt(self.user, SimpleUploadedFile("b.jpg", b"receipt bytes")).expense
+        self.assertEqual(first.receipt_hash, hashlib.sha256(b"receipt bytes").hexdigest())
+        self.assertEqual(second.duplicate_of, first)
+        self.assertEqual(second.receipt_image.name, first.receipt_image.name)
+        self.assertEqual(default_storage.listdir("receipts")[1], ["a.jpg"])
+
+    @override_settings(RECEIPT_MAX_BYTES=4)
+    def test_oversized_upload_is_rejected(self):
+        self.client.login(username="scanner", password="secret")
+        response = self.client.post(
+            "/core/upload-receipt/", {"receipt_image": SimpleUploadedFile("a.jpg", b"receipt bytes")}
+        )
+        self.assertContains(response, "File too large")
+        self.assertFalse(Expense.objects.filter(user=self.user).exists())
+        self.assertEqual(default_storage.listdir("receipts")[1], [])
+
+
+class MonthlySummaryTests(TestCase):
+    """Incrementally kept monthly summaries always match a rebuild from scratch"""
+
+    def setUp(self):
+        self.user = User.objects.create_user("summariser", password="secret")
+
+    def rows(self):
+        return sorted(
+            MonthlySummary.objects.filter(user=self.user).values_list("kind", "month", "category", "total", "count")
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.rows()
+        summaries.rebuild(self.user.id)
+        self.assertEqual(incremental, self.rows())
+        return incremental
+
+    def expense(self, **fields):
+        defaults = {
+            "user": self.user,
+            "amount": Decimal("10.00"),
+            "currency": "INR",
+            "amount_in_target_currency": Decimal("10.00"),
+            "expense_date": datetime.date(2024, 1, 15),
+            "category": "Groceries",
+        }
+        return Expense.objects.create(**{**defaults, **fields})
+
+    def income(self, **fields):
+        defaults = {
+            "user": self.user,
+            "amount": Decimal("100.00"),
+            "currency": "INR",
+            "income_date": datetime.date(2024, 1, 1),
+            "category": "Salary",
+        }
+        return Income.objects.create(**{**defaults, **fields})
+
+    def test_create(self):
+        self.expense()
+        self.expense(amount_in_target_currency=Decimal("5.50"))
+        self.expense(expense_date=None, category=None)
+        self.income()
+        self.assertIn(
+            ("expense", "2024-01", "groceries", Decimal("15.50"), 2), self.assertMatchesRebuild()
+        )
+
+    def test_edit(self):
+        expense = self.expense()
+        income = self.income()
+        expense.amount_in_target_currency = Decimal("12.00")
+        expense.category = "Dining Out"
+        expense.save()
+        income.amount_in_target_currency = Decimal("90.00")
+        income.save()
+        self.assertEqual(
+            self.assertMatchesRebuild(),
+            [
+                ("expense", "2024-01", "dining out", Decimal("12.00"), 1),
+                ("income", "2024-01", "salary", Decimal("90.00"), 1),
+            ],
+        )
+
+    def test_move_to_another_month(self):
+        self.expense()
+        expense = self.expense()
+        expense.expense_date = datetime.date(2024, 2, 1)
+        expense.save()
+        income = self.income()
+        income.income_date = datetime.date(2023, 12, 31)
+        income.save(update_fields=["income_date"])
+        self.assertEqual(
+            self.assertMatchesRebuild(),
+            [
+                ("expense", "2024-01", "groceries", Decimal("10.00"), 1),
+                ("expense", "2024-02", "groceries", Decimal("10.00"), 1),
+                ("income", "2023-12", "salary", Decimal("100.00"), 1),
+            ],
+        )
+
+    def test_delete(self):
+        kept = self.expense()
+        self.expense().delete()
+        self.income().delete()
+        Expense.objects.filter(pk=self.expense(category="Housing").pk).delete()
+        self.assertEqual(
+            self.assertMatchesRebuild(), [("expense", "2024-01", "groceries", Decimal("10.00"), 1)]
+        )
+        kept.delete()
+        self.assertEqual(self.assertMatchesRebuild(), [])
+
+    def test_delete_uses_the_stored_row(self):
+        self.expense()
+        expense = self.expense()
+        stale = Expense.objects.get(pk=expense.pk)
+        expense.amount_in_target_currency = Decimal("30.00")
+        expense.save()
+        stale.delete()
+        self.assertEqual(
+            self.assertMatchesRebuild(), [("expense", "2024-01", "groceries", Decimal("10.00"), 1)]
+        )
+
+    def test_failed_summary_update_rolls_back_the_save(self):
+        expense = self.expense()
+        expense.amount_in_target_currency = Decimal("99.00")
+        with mock.patch("core.services.summaries.apply", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                expense.save()
+        expense.refresh_from_db()
+        self.assertEqual(expense.amount_in_target_currency, Decimal("10.00"))
+        self.assertEqual(self.assertMatchesRebuild(), [("expense", "2024-01", "groceries", Decimal("10.00"), 1)])
+
+
+class RateLookupTests(TestCase):
+    """How often a rate lookup has to go to the network"""
+
+    day = datetime.date(2024, 1, 2)
+    table = {"USD": Decimal("1"), "EUR": Decimal("0.5"), "INR": Decimal("80")}
+
+    def setUp(self):
+        exchange_rates.clear_cache()
+        self.addCleanup(exchange_rates.clear_cache)
+        fetch = mock.patch.object(exchange_rates, "fetch_rates", return_value=dict(self.table))
+        self.fetch_rates = fetch.start()
+        self.addCleanup(fetch.stop)
+
+    def test_future_dates_never_reach_the_network(self):
+        future = datetime.date.today() + datetime.timedelta(days=30)
+        self.assertIsNone(exchange_rates.get_rates(future, {"EUR"}))
+        self.assertEqual(convert_many([(100, "EUR", future)], "INR"), [None])
+        self.fetch_rates.assert_not_called()
+
+    def test_one_lookup_per_date_however_it_is_given(self):
+        items = [
+            (100, "EUR", "2024-01-02"),
+            (100, "EUR", self.day),
+            (100, "EUR", datetime.datetime(2024, 1, 2, 12, 30)),
+        ]
+        with mock.patch(
+            "core.services.currency.get_rates", side_effect=exchange_rates.get_rates
+        ) as get_rates:
+            self.assertEqual(convert_many(items, "INR"), [Decimal("16000.00")] * 3)
+        self.assertEqual(get_rates.call_count, 1)
+        self.fetch_rates.assert_called_once_with(self.day)
+
+    def test_lru_then_store_serve_repeat_lookups(self):
+        convert_many([(100, "EUR", self.day)], "INR")
+        convert_many([(100, "EUR", self.day)], "USD")
+        self.assertEqual(self.fetch_rates.call_count, 1)
+        info = exchange_rates.cache_info()
+        self.assertEqual(
+            {key: info[key] for key in ("hits", "store_hits", "bundle_hits", "misses", "size")},
+            {"hits": 1, "store_hits": 0, "bundle_hits": 0, "misses": 1, "size": 1},
+        )
+        # A fresh process falls through to the stored table, never the network
+        exchange_rates.clear_cache()
+        self.assertEqual(convert_many([(100, "EUR", self.day)], "INR"), [Decimal("16000.00")])
+        self.assertEqual(self.fetch_rates.call_count, 1)
+        self.assertEqual(exchange_rates.cache_info()["store_hits"], 1)
+
+    @override_settings(EXCHANGE_RATE_CACHE_SIZE=2)
+    def test_lru_evicts_the_least_recently_used_date(self):
+        days = [self.day + datetime.timedelta(days=offset) for offset in range(3)]
+        for day in days:
+            exchange_rates.get_rates(day)
+        exchange_rates.get_rates(days[2])
+        self.assertEqual(self.fetch_rates.call_count, 3)
+        info = exchange_rates.cache_info()
+        self.assertEqual((info["hits"], info["misses"], info["size"], info["maxsize"]), (1, 3, 2, 2))
+        # The evicted date comes back from the store
+        exchange_rates.get_rates(days[0])
+        self.assertEqual(self.fetch_rates.call_count, 3)
+        self.assertEqual(exchange_rates.cache_info()["store_hits"], 1)
+
+
+class PartialRateTableTests(TestCase):
+    """A stored table holding only some currencies does not stand in for the full one"""
+
+    day = datetime.date(2024, 1, 2)
+    full = {"USD": Decimal("1"), "EUR": Decimal("0.5"), "INR": Decimal("80")}
+
+    def setUp(self):
+        exchange_rates.clear_cache()
+        self.addCleanup(exchange_rates.clear_cache)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "rates.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("date,currency,rate\n2024-01-02,EUR,0.5\n2024-01-02,USD,1\n")
+        call_command("sync_exchange_rates", load=[path], stdout=io.StringIO())
+        fetch = mock.patch.object(exchange_rates, "fetch_rates", return_value=dict(self.full))
+        self.fetch_rates = fetch.start()
+        self.addCleanup(fetch.stop)
+
+    def test_missing_currency_falls_through_to_the_network(self):
+        self.assertEqual(convert_many([(100, "EUR", self.day)], "INR"), [Decimal("16000.00")])
+        self.assertEqual(self.fetch_rates.call_count, 1)
+        # Now stored as complete, so neither the cache nor the store needs the network again
+        exchange_rates.clear_cache()
+        self.assertEqual(convert_many([(100, "EUR", self.day)], "INR"), [Decimal("16000.00")])
+        self.assertEqual(self.fetch_rates.call_count, 1)
+
+    def test_partial_table_answers_what_it_holds(self):
+        self.assertEqual(convert_many([(100, "EUR", self.day)], "USD"), [Decimal("200.00")])
+        self.fetch_rates.assert_not_called()
+
+    def test_sync_fetches_partially_loaded_dates(self):
+        Expense.objects.create(
+            user=User.objects.create_user("syncer"), amount=1, currency="EUR", expense_date=self.day
+        )
+        with mock.patch(
+            "core.management.commands.sync_exchange_rates.fetch_rates", return_value=dict(self.full)
+        ) as fetch_rates:
+            call_command("sync_exchange_rates", sync=True, stdout=io.StringIO())
+            fetch_rates.assert_called_once_with(self.day)
+            call_command("sync_exchange_rates", sync=True, stdout=io.StringIO())
+            self.assertEqual(fetch_rates.call_count, 1)
+
+
+@override_settings(OPENAI_API_KEY="")
+class SharedReceiptCacheTests(ReceiptFilesMixin, TestCase):
+    """The receipt cache is shared, so it never carries one user's personal category"""
+
+    text = "Zyxx Blorp Emporium\nTOTAL 12.50\n02/01/2024\n"
+    words = [("Zyxx", 90), ("Blorp", 90), ("Emporium", 90), ("TOTAL", 90), ("12.50", 90), ("02/01/2024", 90)]
+
+    def setUp(self):
+        super().setUp()
+        ocr = mock.patch(
+            "core.services.receipt_extraction.ocr_receipt_words", return_value=(self.text, self.words)
+        )
+        ocr.start()
+        self.addCleanup(ocr.stop)
+        category_classifier.clear_cache()
+        self.addCleanup(category_classifier.clear_cache)
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        category_classifier.relabel(self.alice.id, None, ("Zyxx Blorp Emporium", "Pet Care"))
+
+    def upload(self, user):
+        job = enqueue_receipt(user, SimpleUploadedFile("receipt.jpg", b"same receipt"))
+        if job.status == ReceiptJob.PENDING:
+            process_jobs([claim_next_job()])
+        return Expense.objects.get(pk=job.expense_id)
+
+    def test_queue_cache_hit_uses_the_uploaders_classifier(self):
+        self.assertEqual(self.upload(self.alice).category, "Pet Care")
+        self.assertEqual(self.upload(self.bob).category, "Miscellaneous")
+        category_classifier.relabel(self.bob.id, None, ("Zyxx Blorp Emporium", "Education"))
+        self.assertEqual(self.upload(self.bob).category, "Education")
+
+    def test_batch_cache_hit_uses_the_uploaders_classifier(self):
+        [entry] = import_receipts(self.alice, [SimpleUploadedFile("receipt.jpg", b"same receipt")])
+        self.assertEqual(entry["category"], "Pet Care")
+        [entry] = import_receipts(self.bob, [SimpleUploadedFile("receipt.jpg", b"same receipt")])
+        self.assertEqual(entry["category"], "Miscellaneous")
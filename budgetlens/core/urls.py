@@ -5,6 +5,9 @@ from .views import CustomLogoutView
 
 urlpatterns = [
     path("upload-receipt/", views.upload_receipt, name="upload_receipt"),
+    path("upload-receipts/batch/", views.upload_receipts_batch, name="upload_receipts_batch"),
+    path("receipt-job/<int:job_id>/", views.receipt_job, name="receipt_job"),
+    path("receipt-job/<int:job_id>/status/", views.receipt_job_status, name="receipt_job_status"),
     path('dashboard/', views.dashboard, name='dashboard'),
     # Using the login template from core/templates/login.html
     path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
@@ -14,9 +17,11 @@ urlpatterns = [
     path('save_expense/<int:expense_id>/', views.save_expense, name='save_expense'),
     # Expense URLs
     path('expense/add/', views.add_expense, name='add_expense'),
+    path('expense/rows/', views.listing_rows, {'kind': 'expense'}, name='expense_rows'),
     # Income URLs
     path('income/add/', views.add_income, name='add_income'),
     path('income/list/', views.income_list, name='income_list'),
+    path('income/rows/', views.listing_rows, {'kind': 'income'}, name='income_rows'),
     path('income/<int:income_id>/', views.income_detail, name='income_detail'),
     path('income/edit/<int:income_id>/', views.edit_income, name='edit_income'),
 ]
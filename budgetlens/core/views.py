@@ -1,354 +1,202 @@
 """Views for the core app"""
 
-import base64
-from decimal import Decimal
+import datetime
+import hashlib
 import logging
 import json
-import os
-import requests
-from django.db.models import Sum, F, Value, FloatField
-from django.db.models.functions import Lower, Trim, Coalesce
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LogoutView
-from django.shortcuts import redirect, render
-from .forms import ExpenseEditForm, ExpenseForm, IncomeForm, IncomeEditForm, ExpenseAddForm
-from .models import Expense, UserProfile, Income
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.template.loader import render_to_string
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .forms import ExpenseEditForm, ExpenseForm, IncomeForm, IncomeEditForm, ExpenseAddForm, ListingFilterForm
+from .models import Expense, UserProfile, Income, ReceiptJob, MonthlySummary
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from django.core.files.storage import FileSystemStorage
-from .services.receipt_parser import create_expense_from_receipt
+from .services.receipt_batch import import_receipts
+from .services.receipt_queue import enqueue_receipt
+from .services import data_version, listing, summaries
+from .services.category_classifier import predict as predict_category, relabel as relabel_category
+from .services.currency import convert
 from .models import Expense
 
 class CustomLogoutView(LogoutView):
     http_method_names = ['get', 'post']
 
-OPEN_EXCHANGE_RATES_API_KEY = os.getenv("OPEN_EXCHANGE_RATES_API_KEY")
-OPEN_EXCHANGE_RATES_API_URL = "https://openexchangerates.org/api/historical/"
-
 log = logging.getLogger(__name__)
 
-# Initialize OpenAI client only if API key is available
-try:
-    from openai import OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    if not os.getenv("OPENAI_API_KEY"):
-        client = None
-except (ImportError, Exception):
-    client = None
-
-
-def encode_image(image_path):
-    """Encode the image file to base64 string"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
-
-
-def process_receipt(image_path):
-    """Process the receipt image using OpenAI API if available, otherwise return default values"""
-    log.debug("views : process_receipt()")
-    category = "Miscellaneous"
-    # Use current date as default in YYYY-MM-DD format
-    import datetime
-    expense_date = datetime.date.today().strftime("%Y-%m-%d")
-    amount = 10.00
-    currency = "EUR"
-
-    # If OpenAI client is not available, return default values
-    if client is None:
-        return {
-            "category": category,
-            "date": expense_date,
-            "amount": amount,
-            "currency": currency,
-        }
-    
-    base64_image = encode_image(image_path)
-    
-    base_categories = [
-        "Housing",
-        "Utilities",
-        "Transportation",
-        "Groceries",
-        "Dining Out",
-        "Healthcare",
-        "Debt Payments",
-        "Insurance",
-        "Clothing",
-        "Entertainment",
-        "Education",
-        "Childcare",
-        "Pet Care",
-        "Subscriptions",
-        "Miscellaneous",
-    ]
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": (
-                                "Analyze the provided receipt and extract the following details: "
-                                "1. Category: Determine the category of the expense from this list: "
-                                f"{', '.join(base_categories)}. 2.Date: Identify the transaction date. "
-                                "3. Amount: Extract the expense amount as a decimal number. Consider: "
-                                "- A comma may serve as a thousand separator or decimal separator. "
-                                "- In KRW (Korean Won), the amount is never lower than a thousand. "
-                                "4. Currency: Identify the currency used in the expense starting "
-                                "(three-character ISO 4217 code). Respond strictly in JSON format, "
-                                "and ending with braces, without any additional markup language "
-                                'or explanation. Example response: {"category": "<category>",'
-                                ' "date": "<date>", "amount": <amount>,'
-                                ' "currency": "<currency>"}'
-                            ),
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
-                    },
-                ],
-            }
-        ],
-        temperature=0.2,
-    )
-
-        if (
-            not response
-            or not response.choices
-            or not response.choices[0].message.content
-        ):
-            raise ValueError("Empty or invalid response from OpenAI API")
-
-        content = response.choices[0].message.content.strip()
-        log.debug("Response from OpenAI")
-        log.debug(content)
-    except Exception as e:
-        log.error(f"Error processing receipt with OpenAI: {str(e)}")
-        return {
-            "category": category,
-            "date": expense_date,
-            "amount": amount,
-            "currency": currency,
-        }
 
+@login_required
+def upload_receipt(request):
+    """View to upload a receipt and queue it for background processing"""
+    if request.method == "POST" and request.FILES.get("receipt_image"):
         try:
-            if content.startswith("```json") and content.endswith("```"):
-                log.debug("Content: %s", content)
-                content = content[7:-3].strip()
-                log.debug("Content after stripping markdown: %s", content)
-
-            response_data = json.loads(content)
-            
-            # Ensure amount is a valid decimal
-            amount_val = response_data.get("amount")
-            if amount_val is not None:
-                try:
-                    # Try to convert to float first to handle various formats
-                    float_val = float(str(amount_val).replace(',', '.'))
-                    response_data["amount"] = float_val
-                except (ValueError, TypeError):
-                    log.error(f"Invalid amount format from API: {amount_val}. Using default amount.")
-                    response_data["amount"] = 0.00
-            
-            # Ensure date is in YYYY-MM-DD format
-            date_str = response_data.get("date")
-            if date_str:
-                # Replace any separators with hyphens
-                date_str = date_str.replace("/", "-").replace(".", "-")
-                
-                # Try to parse and standardize the date format
-                try:
-                    import datetime
-                    # Check for various date formats
-                    if len(date_str.split("-")) == 3:
-                        parts = list(map(int, date_str.split("-")))
-                        
-                        # Determine which format we're dealing with
-                        if parts[0] > 31 and parts[0] <= 9999 and parts[1] <= 12 and parts[2] <= 31:
-                            # Already YYYY-MM-DD format
-                            year, month, day = parts
-                            date_str = f"{year:04d}-{month:02d}-{day:02d}"
-                        elif parts[0] <= 31 and parts[1] <= 12 and parts[2] <= 9999:
-                            # DD-MM-YYYY format
-                            day, month, year = parts
-                            if year < 100:
-                                # Handle 2-digit year
-                                current_year = datetime.date.today().year
-                                century = current_year // 100
-                                year = century * 100 + year
-                            date_str = f"{year:04d}-{month:02d}-{day:02d}"
-                        elif parts[0] <= 12 and parts[1] <= 31 and parts[2] <= 9999:
-                            # MM-DD-YYYY format
-                            month, day, year = parts
-                            if year < 100:
-                                # Handle 2-digit year
-                                current_year = datetime.date.today().year
-                                century = current_year // 100
-                                year = century * 100 + year
-                            date_str = f"{year:04d}-{month:02d}-{day:02d}"
-                    
-                    # Validate the final date format
-                    datetime.datetime.strptime(date_str, "%Y-%m-%d")
-                    response_data["date"] = date_str
-                except (ValueError, IndexError):
-                    # If parsing fails, use current date
-                    log.error(f"Could not parse date: {date_str}. Using current date.")
-                    response_data["date"] = datetime.date.today().strftime("%Y-%m-%d")
-
-            category = response_data.get("category", "Miscellaneous")
-            if category not in base_categories:
-                category = "Miscellaneous"
-
-            expense_date = response_data.get("date")
-            amount = response_data.get("amount")
-            currency = response_data.get("currency").upper()
-
-            return {
-                "category": category,
-                "date": expense_date,
-                "amount": amount,
-                "currency": currency,
-            }
-        except json.JSONDecodeError as e:
-            log.error("JSON decode error: %s", e)
-            return {
-                "category": category,
-                "date": expense_date,
-                "amount": amount,
-                "currency": currency,
-            }
+            job = enqueue_receipt(request.user, request.FILES["receipt_image"])
         except ValueError as e:
-             log.error("Value error: %s", e)
-             return {
-                 "category": category,
-                 "date": expense_date,
-                 "amount": amount,
-                 "currency": currency,
-             }
-    except Exception as e:
-        log.error("Unexpected error: %s", e)
-        raise
+            return render(request, "upload_receipt.html", {"error": str(e)})
+        return redirect("receipt_job", job_id=job.id)
 
+    return render(request, "upload_receipt.html")
 
-def get_exchange_rate(date, from_currency, to_currency):
-    """Get the exchange rate for the given date and currencies"""
 
-    if from_currency == to_currency:
-        return 1, 1
+@login_required
+def upload_receipts_batch(request):
+    """View to upload many receipts, or ZIP archives of receipts, in one request"""
+    if request.method == "POST":
+        files = request.FILES.getlist("receipt_images")
+        if not files:
+            return JsonResponse({"error": "No files were uploaded"}, status=400)
+        summary = import_receipts(request.user, files)
+        return JsonResponse(
+            {
+                "created": sum(1 for entry in summary if entry["status"] != "skipped"),
+                "skipped": sum(1 for entry in summary if entry["status"] == "skipped"),
+                "files": summary,
+            }
+        )
 
-    log.debug("views : get_exchange_rate()")
-    url = f"{OPEN_EXCHANGE_RATES_API_URL}{date}.json"
-    log.debug("URL: %s", url)
-    params = {"app_id": OPEN_EXCHANGE_RATES_API_KEY}
-    response = requests.get(url, params=params, timeout=10)
+    return render(request, "upload_receipts_batch.html")
 
-    if response.status_code == 200:
-        data = response.json()
-        return data["rates"].get(from_currency), data["rates"].get(to_currency)
 
-    log.error("Error fetching exchange rate: %s", response.text)
-    return None, None
+@login_required
+def receipt_job(request, job_id):
+    """View to display a queued receipt, which polls until processing has finished"""
+    job = get_object_or_404(
+        ReceiptJob.objects.select_related("expense"), id=job_id, expense__user=request.user
+    )
+    return render(request, "receipt_success.html", {"expense": job.expense, "job": job})
 
 
 @login_required
-def upload_receipt(request):
-    if request.method == "POST" and request.FILES.get("receipt_image"):
-        receipt_image = request.FILES["receipt_image"]
+def receipt_job_status(request, job_id):
+    """View to report the processing status of a queued receipt as JSON"""
+    job = get_object_or_404(
+        ReceiptJob.objects.select_related("expense"), id=job_id, expense__user=request.user
+    )
+    expense_detail = job.expense
+    return JsonResponse(
+        {
+            "status": job.status,
+            "error": job.error,
+            "expense": {
+                "id": expense_detail.id,
+                "description": expense_detail.description,
+                "amount": str(expense_detail.amount) if expense_detail.amount is not None else None,
+                "currency": expense_detail.currency,
+                "category": expense_detail.category,
+                "expense_date": (
+                    expense_detail.expense_date.isoformat() if expense_detail.expense_date else None
+                ),
+            },
+        }
+    )
+
+
+LISTING_ROW_TEMPLATES = {"expense": "expense_rows.html", "income": "income_rows.html"}
 
-        # Save image
-        fs = FileSystemStorage()
-        filename = fs.save(receipt_image.name, receipt_image)
-        file_path = fs.path(filename)   # ✅ get the full system path
 
-        # Now pass the path
-        expense = create_expense_from_receipt(request.user, file_path)
-        return render(request, "receipt_success.html", {"expense": expense})
+def _data_version(request):
+    """The user's data version, read once per request"""
+    if not hasattr(request, "_data_version"):
+        request._data_version = data_version.get_version(request.user.id)
+    return request._data_version
 
-    return render(request, "upload_receipt.html")  
 
+def _data_etag(request, *args, **kwargs):
+    """ETag of a page built only from the user's data: user, data version and full URL"""
+    if not request.user.is_authenticated:
+        return None
+    page = hashlib.md5(request.get_full_path().encode()).hexdigest()[:16]
+    return f"{request.user.id}-{_data_version(request)}-{page}"
 
 
+def _listing_filters(request):
+    """Return the filter form bound to the query string, and its cleaned filters"""
+    form = ListingFilterForm(request.GET)
+    filters = form.cleaned_data if form.is_valid() else {}
+    return form, filters
 
 
+def _listing_query(request):
+    """The query string minus the cursor, for the "load more" requests"""
+    params = request.GET.copy()
+    params.pop("cursor", None)
+    return params.urlencode()
+
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_data_etag)
+def listing_rows(request, kind):
+    """View to return the next page of an expense or income listing as table rows"""
+    _, filters = _listing_filters(request)
+    try:
+        rows, next_cursor = listing.page(kind, request.user, filters, request.GET.get("cursor"))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cursor")
+    return JsonResponse(
+        {
+            "html": render_to_string(LISTING_ROW_TEMPLATES[kind], {"rows": rows}, request),
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_data_etag)
 def dashboard(request):
     """View to display the user's expenses and income ordered by date and aggregated by category"""
-    expenses = Expense.objects.filter(user=request.user).order_by("-expense_date")
-    incomes = Income.objects.filter(user=request.user).order_by("-income_date")
-
-    expenses = expenses.annotate(category_normalized=Trim(Lower(F("category"))))
-    log.debug("Normalized Category: %s", expenses.values("category_normalized"))
-
-    category_data = (
-        expenses.values("category_normalized")
-        .annotate(
-            total_amount=Coalesce(
-                Sum("amount_in_target_currency", output_field=FloatField()),
-                Value(0, output_field=FloatField()),
-            )
-        )
-        .order_by("category_normalized")
+    filter_form, filters = _listing_filters(request)
+    # Any write bumps the version, so a stale entry is simply never looked up again
+    query = hashlib.md5(_listing_query(request).encode()).hexdigest()[:16]
+    cache_key = f"dashboard:{request.user.id}:{_data_version(request)}:{query}"
+    context = cache.get(cache_key)
+    if context is None:
+        context = _dashboard_context(request.user, filters)
+        cache.set(cache_key, context, settings.DASHBOARD_CACHE_TIMEOUT)
+
+    return render(
+        request,
+        "dashboard.html",
+        {**context, "filter_form": filter_form, "listing_query": _listing_query(request)},
     )
 
-    categories = [
-        (
-            item["category_normalized"].capitalize()
-            if item["category_normalized"]
-            else "Uncategorized"
-        )
-        for item in category_data
-    ]
-    amounts = [float(item["total_amount"]) for item in category_data]
+
+def _dashboard_context(user, filters):
+    """Totals, category chart data and the first listing pages for the dashboard"""
+    # Totals come from the monthly summary rows, not from the user's full history
+    category_data = summaries.category_totals(user.id)
+    categories = [category.capitalize() if category else "Uncategorized" for category, _ in category_data]
+    amounts = [float(total) for _, total in category_data]
 
     log.debug("Aggregated Category Data: %s", categories)
 
-    # Calculate total income converted to target currency
-    user_profile = UserProfile.objects.get(user=request.user)
-    target_currency = user_profile.target_currency
-    total_income = 0
-    for income in incomes:
-        if income.currency == target_currency:
-            total_income += float(income.amount)
-        else:
-            # Convert to target currency
-            date_str = income.income_date.strftime("%Y-%m-%d")
-            exchange_rate_to_usd, exchange_rate_to_target = get_exchange_rate(
-                date_str, income.currency, target_currency
-            )
-            if exchange_rate_to_usd and exchange_rate_to_target:
-                exchange_rate_to_usd = Decimal(str(exchange_rate_to_usd))
-                exchange_rate_to_target = Decimal(str(exchange_rate_to_target))
-                converted_amount_to_usd = income.amount / exchange_rate_to_usd
-                converted_amount_to_target = converted_amount_to_usd * exchange_rate_to_target
-                total_income += float(converted_amount_to_target)
-            else:
-                total_income += float(income.amount)  # Fallback to original if conversion fails
-
-    # Calculate total expenses
-    total_expenses = expenses.aggregate(Sum('amount_in_target_currency'))['amount_in_target_currency__sum'] or 0
-    total_expenses = float(total_expenses)
+    totals = summaries.totals(user.id)
+    total_income = float(totals[MonthlySummary.INCOME])
+    total_expenses = float(totals[MonthlySummary.EXPENSE])
 
     # Calculate balance
     balance = total_income - total_expenses
 
-    return render(
-        request,
-        "dashboard.html",
-        {
-            "expenses": expenses,
-            "incomes": incomes,
-            "categories": json.dumps(categories),
-            "amounts": json.dumps(amounts),
-            "total_income": total_income,
-            "total_expenses": total_expenses,
-            "balance": balance,
-        },
-    )
+    expense_rows, expense_cursor = listing.page("expense", user, filters)
+    income_rows, income_cursor = listing.page("income", user, filters)
+
+    return {
+        "expenses": expense_rows,
+        "expense_cursor": expense_cursor,
+        "incomes": income_rows,
+        "income_cursor": income_cursor,
+        "categories": json.dumps(categories),
+        "amounts": json.dumps(amounts),
+        "total_income": total_income,
+        "total_expenses": total_expenses,
+        "balance": balance,
+    }
 
 
 @login_required
@@ -371,35 +219,36 @@ def save_expense(request, expense_id):
     """View to save the edited expense details with currency conversion"""
     log.debug("views : save_expense()")
     expense_edit = Expense.objects.get(id=expense_id, user=request.user)
+    # Binding the form updates the instance, so keep the stored label first
+    stored_label = (expense_edit.description, expense_edit.category)
+    was_confirmed = expense_edit.category_confirmed
 
     if request.method == "POST":
         form = ExpenseEditForm(request.POST, instance=expense_edit)
         if form.is_valid():
             expense_form = form.save(commit=False)
+            if expense_form.category != stored_label[1]:
+                expense_form.category_confirmed = True
 
             user_profile = UserProfile.objects.get(user=request.user)
             target_currency = user_profile.target_currency
 
-            # Format the date as YYYY-MM-DD string for the API call
-            date_str = expense_form.expense_date.strftime("%Y-%m-%d") if expense_form.expense_date else datetime.date.today().strftime("%Y-%m-%d")
-            
-            exchange_rate_to_usd, exchange_rate_to_target = get_exchange_rate(
-                date_str, expense_form.currency, target_currency
+            converted = convert(
+                expense_form.amount,
+                expense_form.currency,
+                expense_form.expense_date or datetime.date.today(),
+                target_currency,
             )
-
-            if exchange_rate_to_usd and exchange_rate_to_target:
-                exchange_rate_to_usd = Decimal(str(exchange_rate_to_usd))
-                exchange_rate_to_target = Decimal(str(exchange_rate_to_target))
-
-                converted_amount_to_usd = expense_form.amount / exchange_rate_to_usd
-                converted_amount_to_target = (
-                    converted_amount_to_usd * exchange_rate_to_target
-                )
-                expense_form.amount_in_target_currency = round(
-                    converted_amount_to_target, 2
-                )
+            if converted is not None:
+                expense_form.amount_in_target_currency = converted
 
             expense_form.save()
+            if expense_form.category_confirmed:
+                relabel_category(
+                    request.user.id,
+                    stored_label if was_confirmed else None,
+                    (expense_form.description, expense_form.category),
+                )
             log.debug("Expense updated successfully")
             return redirect("expense", expense_id=expense_id)
         else:
@@ -421,6 +270,15 @@ def add_income(request):
         if form.is_valid():
             income = form.save(commit=False)
             income.user = request.user
+
+            user_profile = UserProfile.objects.get(user=request.user)
+            converted = convert(
+                income.amount, income.currency, income.income_date, user_profile.target_currency
+            )
+            income.amount_in_target_currency = (
+                converted if converted is not None else income.amount
+            )
+
             income.save()
             return redirect("income_list")
         else:
@@ -437,35 +295,26 @@ def add_expense(request):
         if form.is_valid():
             expense = form.save(commit=False)
             expense.user = request.user
+            if expense.category:
+                expense.category_confirmed = True
+            elif expense.description:
+                # A guess, so it must not train the classifier it came from
+                expense.category = predict_category(request.user.id, expense.description)[0]
 
             # Currency conversion logic similar to upload_receipt
             user_profile = UserProfile.objects.get(user=request.user)
             target_currency = user_profile.target_currency
 
-            date_str = expense.expense_date.strftime("%Y-%m-%d") if expense.expense_date else None
-
-            from decimal import Decimal
-
-            if date_str:
-                exchange_rate_to_usd, exchange_rate_to_target = get_exchange_rate(
-                    date_str, expense.currency, target_currency
-                )
-            else:
-                exchange_rate_to_usd, exchange_rate_to_target = None, None
-
-            if exchange_rate_to_usd and exchange_rate_to_target:
-                exchange_rate_to_usd = Decimal(str(exchange_rate_to_usd))
-                exchange_rate_to_target = Decimal(str(exchange_rate_to_target))
-
-                converted_amount_to_usd = expense.amount / exchange_rate_to_usd
-                converted_amount_to_target = (
-                    converted_amount_to_usd * exchange_rate_to_target
-                )
-                expense.amount_in_target_currency = round(converted_amount_to_target, 2)
-            else:
-                expense.amount_in_target_currency = expense.amount
+            converted = convert(
+                expense.amount, expense.currency, expense.expense_date, target_currency
+            )
+            expense.amount_in_target_currency = (
+                converted if converted is not None else expense.amount
+            )
 
             expense.save()
+            if expense.category_confirmed:
+                relabel_category(request.user.id, None, (expense.description, expense.category))
             return redirect("dashboard")
         else:
             log.error("Form errors: %s", form.errors)
@@ -474,10 +323,23 @@ def add_expense(request):
     return render(request, "add_expense.html", {"form": form})
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_data_etag)
 def income_list(request):
-    """View to display all income entries"""
-    incomes = Income.objects.filter(user=request.user).order_by("-income_date")
-    return render(request, "income_list.html", {"incomes": incomes})
+    """View to display the first page of income entries, newest first"""
+    filter_form, filters = _listing_filters(request)
+    incomes, income_cursor = listing.page("income", request.user, filters)
+    return render(
+        request,
+        "income_list.html",
+        {
+            "filter_form": filter_form,
+            "filtering": any(filters.values()),
+            "listing_query": _listing_query(request),
+            "incomes": incomes,
+            "income_cursor": income_cursor,
+        },
+    )
 
 @login_required
 def income_detail(request, income_id):
@@ -492,7 +354,17 @@ def edit_income(request, income_id):
     if request.method == "POST":
         form = IncomeEditForm(request.POST, instance=income)
         if form.is_valid():
-            form.save()
+            income = form.save(commit=False)
+
+            user_profile = UserProfile.objects.get(user=request.user)
+            converted = convert(
+                income.amount, income.currency, income.income_date, user_profile.target_currency
+            )
+            income.amount_in_target_currency = (
+                converted if converted is not None else income.amount
+            )
+
+            income.save()
             return redirect("income_detail", income_id=income_id)
         else:
             log.error("Form errors: %s", form.errors)